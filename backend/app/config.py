@@ -6,6 +6,14 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    CALCULATION_ENGINE: str = "matrix"  # matrix (NumPy) hoặc sql (Postgres GROUP BY)
+    CALCULATION_JOB_WORKERS: int = 2  # Số thread chạy job tính toán nền
+    CALCULATION_PARALLEL_WORKERS: int = 4  # Số worker tính song song các môn học của chương trình
+    RESULT_CACHE_SIZE: int = 512  # Số kết quả TLĐ tối đa trong cache (LRU)
+    COURSE_PASS_SCORE: float = 4.0  # Điểm tổng kết tối thiểu (thang 10) để đạt môn học
+    MATRIX_CACHE_SIZE: int = 64  # Số môn học tối đa giữ ma trận điểm trong bộ nhớ cho mô phỏng (LRU)
+    ELIGIBILITY_CACHE_SIZE: int = 32  # Số cohort tối đa giữ ma trận đủ điều kiện đăng ký trong bộ nhớ (LRU)
+    TEXT_PROFILE_CACHE_SIZE: int = 4096  # Số hồ sơ văn bản CLO / PLO tối đa giữ trong bộ nhớ (LRU)
     
     class Config:
         env_file = ".env"
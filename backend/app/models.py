@@ -1,5 +1,5 @@
 from sqlmodel import SQLModel, Field, Relationship, Column
-from sqlalchemy import JSON, ARRAY, Integer
+from sqlalchemy import JSON, ARRAY, Integer, UniqueConstraint, Index, text
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -112,6 +112,10 @@ class QuestionBase(SQLModel):
     max_score: float
 
 class Question(QuestionBase, table=True):
+    __table_args__ = (
+        # GIN index cho truy vấn chứa mảng: clo_ids @> ARRAY[clo_id]
+        Index("ix_question_clo_ids_gin", "clo_ids", postgresql_using="gin"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     assessment_id: int = Field(foreign_key="assessment.id")
     clo_ids: Optional[List[int]] = Field(default=[], sa_column=Column(ARRAY(Integer)))
@@ -144,12 +148,106 @@ class StudentCLOResultBase(SQLModel):
     assessed_at: datetime
 
 class StudentCLOResult(StudentCLOResultBase, table=True):
+    __table_args__ = (
+        UniqueConstraint("student_id", "clo_id", name="uq_studentcloresult_student_clo"),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     student_id: int = Field(foreign_key="student.id")
     clo_id: int = Field(foreign_key="clo.id")
     source: Optional[str] = None  # Nguồn tính toán
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Model cho tính toán tăng dần (incremental recalculation)
+class StaleStudentCLO(SQLModel, table=True):
+    """Cặp (sinh viên, CLO) cần tính lại do điểm thay đổi"""
+    __table_args__ = (
+        UniqueConstraint("student_id", "clo_id", name="uq_stalestudentclo_student_clo"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    course_id: int = Field(foreign_key="course.id", index=True)
+    student_id: int = Field(foreign_key="student.id")
+    clo_id: int = Field(foreign_key="clo.id")
+    marked_at: datetime = Field(default_factory=datetime.utcnow)
+
+class StaleCourse(SQLModel, table=True):
+    """Môn học cần tính lại toàn bộ (question, assessment hoặc CLO thay đổi)"""
+    course_id: int = Field(foreign_key="course.id", primary_key=True)
+    marked_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CourseDataVersion(SQLModel, table=True):
+    """Phiên bản dữ liệu của môn học, tăng mỗi khi dữ liệu ảnh hưởng đến TLĐ thay đổi"""
+    course_id: int = Field(foreign_key="course.id", primary_key=True)
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CLOClassResult(SQLModel, table=True):
+    """Bộ đếm TLĐ CLO của lớp, được cập nhật tăng dần"""
+    clo_id: int = Field(foreign_key="clo.id", primary_key=True)
+    course_id: int = Field(foreign_key="course.id", index=True)
+    assessed_count: int = 0  # Số sinh viên được đánh giá
+    achieved_count: int = 0  # Số sinh viên đạt CLO
+    tld: float = 0.0
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
+class StudentPLOResult(SQLModel, table=True):
+    """
+    Mức đạt PLO của từng sinh viên, suy ra từ StudentCLOResult và mapping CLO-PLO
+
+    Khóa chính (student_id, plo_id) phục vụ tra cứu khi kiểm tra điều kiện tiên quyết.
+    """
+    student_id: int = Field(foreign_key="student.id", primary_key=True)
+    plo_id: int = Field(foreign_key="plo.id", primary_key=True, index=True)
+    program_id: int = Field(foreign_key="program.id", index=True)
+    achievement: float  # Mức đạt PLO (0-1)
+    achieved: bool  # achievement >= ngưỡng kỳ vọng của chương trình
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
+class StudentCourseResult(SQLModel, table=True):
+    """
+    Điểm tổng kết môn học của sinh viên (thang 10) và kết quả đạt/không đạt
+
+    Được ghi bởi luồng tính toán môn học; khóa chính (student_id, course_id)
+    phục vụ kiểm tra điều kiện PASS_COURSE / MIN_SCORE.
+    """
+    student_id: int = Field(foreign_key="student.id", primary_key=True)
+    course_id: int = Field(foreign_key="course.id", primary_key=True, index=True)
+    final_score: float  # Điểm tổng kết có trọng số (0-10)
+    passed: bool  # final_score >= COURSE_PASS_SCORE
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Model cho job tính toán chạy nền
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class CalculationJob(SQLModel, table=True):
+    __table_args__ = (
+        # Mỗi phạm vi (course/program) chỉ có tối đa một job đang chờ hoặc đang chạy
+        Index(
+            "uq_calculationjob_active_scope",
+            "kind", "scope_id",
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str  # course hoặc program
+    scope_id: int  # course_id hoặc program_id
+    status: str = JobStatus.QUEUED.value
+    progress: float = 0.0  # 0-1
+    params: Optional[Dict[str, Any]] = Field(default={}, sa_column=Column(JSON))
+    result: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    created_by: Optional[int] = Field(default=None, foreign_key="user.id")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class CoursePrerequisiteBase(SQLModel):
     type: PrerequisiteType
     condition_type: ConditionType
@@ -164,8 +262,60 @@ class CoursePrerequisite(CoursePrerequisiteBase, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Model cho chỉ mục từ khóa phục vụ gợi ý môn tiên quyết
+class CourseTextProfile(SQLModel, table=True):
+    """Tập từ khóa và Bloom trung bình của các CLO trong môn học (tính sẵn khi CLO thay đổi)"""
+    course_id: int = Field(foreign_key="course.id", primary_key=True)
+    tokens: List[str] = Field(default=[], sa_column=Column(JSON))
+    token_count: int = 0
+    clo_count: int = 0
+    bloom_avg: float = 3.0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CourseTokenPosting(SQLModel, table=True):
+    """Chỉ mục ngược: từ khóa → môn học có CLO chứa từ khóa đó"""
+    token: str = Field(primary_key=True)
+    course_id: int = Field(foreign_key="course.id", primary_key=True, index=True)
+
+# Model cho phân tích văn bản CLO / PLO dùng chung
+class TextProfile(SQLModel, table=True):
+    """
+    Tập từ khóa và vector TF-IDF (thưa) của một CLO / PLO
+
+    Tính một lần khi CLO / PLO được ghi; source_updated_at = updated_at của bản ghi
+    nguồn tại thời điểm tính, khác đi nghĩa là hồ sơ đã cũ.
+    """
+    entity_type: str = Field(primary_key=True)  # "clo" hoặc "plo"
+    entity_id: int = Field(primary_key=True)
+    tokens: List[str] = Field(default=[], sa_column=Column(JSON))
+    tfidf: Dict[str, float] = Field(default={}, sa_column=Column(JSON))  # {token: trọng số}, chuẩn hóa L2
+    source_updated_at: datetime
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
+class TextTermStat(SQLModel, table=True):
+    """Số văn bản (CLO + PLO) chứa từ khóa, dùng tính IDF"""
+    token: str = Field(primary_key=True)
+    document_count: int = 0
+
+# Model cho phát hiện CLO gần trùng lặp (MinHash / LSH)
+class CLOMinHash(SQLModel, table=True):
+    """Chữ ký MinHash của tập từ khóa CLO"""
+    clo_id: int = Field(foreign_key="clo.id", primary_key=True)
+    signature: List[int] = Field(default=[], sa_column=Column(JSON))
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CLOLSHBucket(SQLModel, table=True):
+    """Chỉ mục LSH: CLO có cùng bucket ở một band là ứng viên trùng lặp"""
+    band: int = Field(primary_key=True)
+    bucket: str = Field(primary_key=True)  # Hash hex các giá trị chữ ký trong band
+    clo_id: int = Field(foreign_key="clo.id", primary_key=True, index=True)
+
 # Model cho CLO-PLO mapping
 class CLOPLOMapping(SQLModel, table=True):
+    __table_args__ = (
+        UniqueConstraint("clo_id", "plo_id", name="uq_cloplomapping_clo_plo"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     clo_id: int = Field(foreign_key="clo.id")
     plo_id: int = Field(foreign_key="plo.id")
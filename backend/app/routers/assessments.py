@@ -5,6 +5,7 @@ from app.database import get_session
 from app.models import Assessment
 from app.schemas import AssessmentCreate, AssessmentResponse
 from app.auth import get_current_user, require_role, UserRole
+from app.services.dirty_tracking_service import mark_course_stale
 
 router = APIRouter()
 
@@ -64,6 +65,7 @@ async def update_assessment(
         setattr(assessment, key, value)
     
     session.add(assessment)
+    mark_course_stale(session, assessment.course_id)
     session.commit()
     session.refresh(assessment)
     return assessment
@@ -79,6 +81,7 @@ async def delete_assessment(
     if not assessment:
         raise HTTPException(status_code=404, detail="Không tìm thấy đánh giá")
     
+    mark_course_stale(session, assessment.course_id)
     session.delete(assessment)
     session.commit()
     return {"message": "Đã xóa đánh giá"}
@@ -1,32 +1,63 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
+from typing import Dict, Any, Optional
 from datetime import datetime
-from typing import Dict, Any
+import json
 from app.database import get_session
-from app.models import Course, CLO, Student, StudentCLOResult
+from app.models import Course, CLO, Question, Assessment, CalculationJob
 from app.schemas import (
     CalculateCourseRequest, CalculateCourseResponse,
-    CalculateProgramRequest, CalculateProgramResponse
+    CalculateProgramRequest, CalculateProgramResponse,
+    CalculationJobResponse, ClassTLDCLOResponse, ProgramTLDPLOResponse,
+    CalculateStudentPLOResponse, CacheStatsResponse, SimulationRequest, CourseSimulationResponse,
+    ProgramSimulationResponse
 )
 from app.auth import get_current_user
 from app.services.calculation_service import (
-    calculate_student_clo_achievement,
-    calculate_class_tld_clo,
-    calculate_program_tld_plo
+    CALCULATION_ENGINES,
+    CONTRIBUTION_WEIGHTS,
+    run_course_calculation,
+    run_incremental_course_calculation,
+    iter_course_calculation,
+    calculate_program_tld_plos,
+    get_class_tld_clo,
+    get_program_tld_plos,
+    run_program_student_plo_calculation
 )
+from app.services.result_cache import tld_cache, matrix_cache
+from app.services.simulation_service import simulate_course, simulate_program
+from app.services.job_service import submit_calculation_job, has_conflicting_params
 
 router = APIRouter()
 
+def validate_engine(engine: Optional[str]) -> Optional[str]:
+    """Kiểm tra engine tính toán được yêu cầu"""
+    if engine and engine not in CALCULATION_ENGINES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Engine không hợp lệ, chọn một trong: {', '.join(CALCULATION_ENGINES)}"
+        )
+    return engine
+
 @router.post("/course/{course_id}", response_model=CalculateCourseResponse)
-async def calculate_course(
+def calculate_course(
     course_id: int,
+    engine: Optional[str] = Query(None, description="Engine tính toán: matrix hoặc sql"),
+    mode: str = Query("full", description="full: tính toàn bộ, incremental: chỉ tính phần thay đổi"),
     session: Session = Depends(get_session),
     current_user = Depends(get_current_user)
 ):
     """
     Tính toán mức đạt CLO (per student) và TLĐ CLO (per class)
     Lưu kết quả vào StudentCLOResult
+    
+    mode=incremental chỉ tính lại các cặp (sinh viên, CLO) có điểm thay đổi
+    kể từ lần tính trước và cập nhật tăng dần TLĐ CLO của lớp.
     """
+    if mode not in ("full", "incremental"):
+        raise HTTPException(status_code=400, detail="mode phải là full hoặc incremental")
+    
     course = session.get(Course, course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
@@ -38,81 +69,86 @@ async def calculate_course(
     if not clos:
         raise HTTPException(status_code=400, detail="Môn học chưa có CLO")
     
-    # Lấy students có điểm trong course
-    from app.models import Question, Assessment, StudentScore
-    statement = select(Question).join(Assessment).where(Assessment.course_id == course_id)
-    questions = session.exec(statement).all()
-    question_ids = [q.id for q in questions]
+    engine = validate_engine(engine)
+    if mode == "incremental":
+        # Chỉ tính lại các cặp (sinh viên, CLO) bị đánh dấu do điểm thay đổi
+        result = run_incremental_course_calculation(session, course_id, engine)
+    else:
+        # Nạp điểm của cả môn học một lần và tính toàn bộ sinh viên × CLO
+        result = run_course_calculation(session, course_id, engine)
     
-    if not question_ids:
+    if result["mode"] == "full" and not result["question_ids"]:
         raise HTTPException(status_code=400, detail="Môn học chưa có điểm")
     
-    statement = select(StudentScore.student_id).where(
-        StudentScore.question_id.in_(question_ids)
-    ).distinct()
-    student_ids = [row[0] for row in session.exec(statement).all()]
-    
-    student_results = []
-    class_tld_clo = {}
-    
-    # Tính cho từng CLO
-    for clo in clos:
-        # Tính cho từng student
-        achieved_count = 0
-        for student_id in student_ids:
-            result = calculate_student_clo_achievement(session, student_id, clo.id)
-            
-            # Lưu vào StudentCLOResult
-            # Kiểm tra xem đã có record chưa
-            statement = select(StudentCLOResult).where(
-                StudentCLOResult.student_id == student_id,
-                StudentCLOResult.clo_id == clo.id
-            )
-            existing = session.exec(statement).first()
-            
-            if existing:
-                existing.achievement = result["achievement"]
-                existing.achieved = result["achieved"]
-                existing.assessed_at = datetime.utcnow()
-                existing.source = "calculation_endpoint"
-                session.add(existing)
-            else:
-                new_result = StudentCLOResult(
-                    student_id=student_id,
-                    clo_id=clo.id,
-                    achievement=result["achievement"],
-                    achieved=result["achieved"],
-                    assessed_at=datetime.utcnow(),
-                    source="calculation_endpoint"
-                )
-                session.add(new_result)
-            
-            if result["achieved"]:
-                achieved_count += 1
-            
-            student_results.append({
-                "student_id": student_id,
-                "clo_id": clo.id,
-                "achievement": result["achievement"],
-                "achieved": result["achieved"]
-            })
-        
-        # Tính TLĐ CLO cho class
-        tld = calculate_class_tld_clo(session, course_id, clo.id)
-        class_tld_clo[str(clo.id)] = tld
+    class_tld_clo = {
+        str(clo_id): tld for clo_id, tld in result["class_tld_clo"].items()
+    }
+    student_results = [
+        {
+            "student_id": row["student_id"],
+            "clo_id": row["clo_id"],
+            "achievement": row["achievement"],
+            "achieved": row["achieved"]
+        }
+        for row in result["rows"]
+    ]
     
     session.commit()
     
+    if result["mode"] == "incremental":
+        message = f"Đã tính lại {len(student_results)} kết quả (sinh viên × CLO) thay đổi"
+    else:
+        message = f"Đã tính toán cho {result['student_count']} sinh viên và {len(clos)} CLOs"
+    
     return CalculateCourseResponse(
         course_id=course_id,
         student_results=student_results,
         class_tld_clo=class_tld_clo,
-        message=f"Đã tính toán cho {len(student_ids)} sinh viên và {len(clos)} CLOs"
+        inserted_count=result["inserted"],
+        updated_count=result["updated"],
+        message=message
+    )
+
+@router.post("/course/{course_id}/stream")
+def calculate_course_stream(
+    course_id: int,
+    engine: Optional[str] = Query(None, description="Engine tính toán: matrix hoặc sql"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Tính toán mức đạt CLO và trả kết quả dạng NDJSON (mỗi dòng một JSON)
+    
+    Mỗi dòng {"type": "result", ...} là kết quả một (sinh viên, CLO),
+    dòng cuối {"type": "summary", ...} chứa class_tld_clo.
+    Kết quả được lưu vào StudentCLOResult giống endpoint /course/{course_id}.
+    """
+    course = session.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    
+    clo = session.exec(select(CLO.id).where(CLO.course_id == course_id)).first()
+    if clo is None:
+        raise HTTPException(status_code=400, detail="Môn học chưa có CLO")
+    
+    question = session.exec(
+        select(Question.id).join(Assessment).where(Assessment.course_id == course_id)
+    ).first()
+    if question is None:
+        raise HTTPException(status_code=400, detail="Môn học chưa có điểm")
+    
+    lines = iter_course_calculation(session.get_bind(), course_id, validate_engine(engine))
+    return StreamingResponse(
+        (json.dumps(line, ensure_ascii=False) + "\n" for line in lines),
+        media_type="application/x-ndjson"
     )
 
 @router.post("/program/{program_id}", response_model=CalculateProgramResponse)
-async def calculate_program(
+def calculate_program(
     program_id: int,
+    engine: Optional[str] = Query(None, description="Engine tính toán: matrix hoặc sql"),
+    use_persisted: bool = Query(True, description="Dùng bộ đếm TLĐ CLO đã lưu nếu còn mới"),
+    workers: Optional[int] = Query(None, ge=1, description="Số worker tính song song các môn học"),
     session: Session = Depends(get_session),
     current_user = Depends(get_current_user)
 ):
@@ -132,11 +168,22 @@ async def calculate_program(
     if not plos:
         raise HTTPException(status_code=400, detail="Chương trình chưa có PLO")
     
-    tld_plo = {}
-    
-    for plo in plos:
-        tld = calculate_program_tld_plo(session, program_id, plo.id)
-        tld_plo[str(plo.id)] = tld
+    # Tính tất cả PLO trong một lượt, mỗi môn học chỉ tính một lần
+    if use_persisted:
+        # Dữ liệu chưa đổi thì lấy luôn từ cache
+        tld_values = get_program_tld_plos(
+            session, program_id, engine=validate_engine(engine), max_workers=workers
+        )
+    else:
+        tld_values = calculate_program_tld_plos(
+            session,
+            program_id,
+            [plo.id for plo in plos],
+            engine=validate_engine(engine),
+            use_persisted=False,
+            max_workers=workers
+        )
+    tld_plo = {str(plo_id): tld for plo_id, tld in tld_values.items()}
     
     return CalculateProgramResponse(
         program_id=program_id,
@@ -144,5 +191,243 @@ async def calculate_program(
         message=f"Đã tính toán TLĐ cho {len(plos)} PLOs"
     )
 
+@router.post("/program/{program_id}/student-plo", response_model=CalculateStudentPLOResponse)
+def calculate_program_student_plo(
+    program_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Tính mức đạt PLO của từng sinh viên trong chương trình và lưu StudentPLOResult
+
+    Dựa trên StudentCLOResult đã tính, nên cần tính CLO của các môn học trước.
+    """
+    from app.models import Program
+    
+    program = session.get(Program, program_id)
+    if not program:
+        raise HTTPException(status_code=404, detail="Không tìm thấy chương trình đào tạo")
+    
+    result = run_program_student_plo_calculation(session, program_id)
+    session.commit()
+    
+    return CalculateStudentPLOResponse(
+        program_id=program_id,
+        student_count=result["student_count"],
+        plo_count=len(result["plo_ids"]),
+        result_count=result["result_count"],
+        expected_threshold=result["expected_threshold"],
+        message=f"Đã tính mức đạt PLO cho {result['student_count']} sinh viên"
+    )
+
+
+@router.get("/course/{course_id}/tld-clo", response_model=ClassTLDCLOResponse)
+def get_course_tld_clo(
+    course_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Lấy TLĐ CLO của lớp (có cache, chỉ tính lại khi dữ liệu môn học thay đổi)"""
+    course = session.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    
+    class_tld_clo = get_class_tld_clo(session, course_id)
+    return ClassTLDCLOResponse(
+        course_id=course_id,
+        class_tld_clo={str(clo_id): tld for clo_id, tld in class_tld_clo.items()}
+    )
+
+@router.get("/program/{program_id}/tld-plo", response_model=ProgramTLDPLOResponse)
+def get_program_tld_plo(
+    program_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Lấy TLĐ PLO của chương trình (có cache, chỉ tính lại khi dữ liệu thay đổi)"""
+    from app.models import Program
+    
+    program = session.get(Program, program_id)
+    if not program:
+        raise HTTPException(status_code=404, detail="Không tìm thấy chương trình đào tạo")
+    
+    tld_plo = get_program_tld_plos(session, program_id)
+    return ProgramTLDPLOResponse(
+        program_id=program_id,
+        tld_plo={str(plo_id): tld for plo_id, tld in tld_plo.items()}
+    )
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+def get_cache_stats(
+    current_user = Depends(get_current_user)
+):
+    """Thống kê cache kết quả TLĐ (hit/miss) phục vụ giám sát"""
+    return tld_cache.stats()
+
+@router.post("/simulate/course/{course_id}", response_model=CourseSimulationResponse)
+def simulate_course_tld_clo(
+    course_id: int,
+    request: SimulationRequest,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Mô phỏng TLĐ CLO của lớp với ngưỡng / trọng số assessment giả định
+
+    Không sửa dữ liệu và không lưu kết quả.
+    """
+    course = session.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    
+    result = simulate_course(
+        session,
+        course_id,
+        clo_threshold=request.clo_threshold,
+        clo_thresholds=request.clo_thresholds,
+        assessment_weights=request.assessment_weights
+    )
+    return CourseSimulationResponse(
+        course_id=course_id,
+        student_count=result["student_count"],
+        class_tld_clo={str(clo_id): tld for clo_id, tld in result["class_tld_clo"].items()},
+        baseline_tld_clo={str(clo_id): tld for clo_id, tld in result["baseline_tld_clo"].items()}
+    )
 
+@router.post("/simulate/program/{program_id}", response_model=ProgramSimulationResponse)
+def simulate_program_tld_plo(
+    program_id: int,
+    request: SimulationRequest,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Mô phỏng TLĐ PLO của chương trình với ngưỡng, trọng số assessment
+    và trọng số đóng góp M/N/L giả định
 
+    Không sửa dữ liệu và không lưu kết quả.
+    """
+    from app.models import Program
+    
+    program = session.get(Program, program_id)
+    if not program:
+        raise HTTPException(status_code=404, detail="Không tìm thấy chương trình đào tạo")
+    
+    invalid_levels = set(request.contribution_weights) - set(CONTRIBUTION_WEIGHTS)
+    if invalid_levels:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Mức đóng góp không hợp lệ: {', '.join(sorted(invalid_levels))} (chỉ M, N, L)"
+        )
+    
+    result = simulate_program(
+        session,
+        program_id,
+        clo_threshold=request.clo_threshold,
+        clo_thresholds=request.clo_thresholds,
+        assessment_weights=request.assessment_weights,
+        contribution_weights=request.contribution_weights
+    )
+    return ProgramSimulationResponse(
+        program_id=program_id,
+        course_count=result["course_count"],
+        contribution_weights=result["contribution_weights"],
+        tld_plo={str(plo_id): tld for plo_id, tld in result["tld_plo"].items()},
+        baseline_tld_plo={str(plo_id): tld for plo_id, tld in result["baseline_tld_plo"].items()}
+    )
+
+@router.get("/simulate/cache/stats", response_model=CacheStatsResponse)
+def get_simulation_cache_stats(
+    current_user = Depends(get_current_user)
+):
+    """Thống kê cache ma trận điểm dùng cho mô phỏng"""
+    return matrix_cache.stats()
+
+def to_job_response(job: CalculationJob, deduplicated: bool = False) -> CalculationJobResponse:
+    """Chuyển CalculationJob thành response, kèm thời gian chạy"""
+    duration = None
+    if job.started_at:
+        duration = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+    return CalculationJobResponse(
+        **job.model_dump(exclude={"created_by"}),
+        duration_seconds=duration,
+        deduplicated=deduplicated
+    )
+
+@router.post("/jobs/course/{course_id}", response_model=CalculationJobResponse)
+def submit_course_job(
+    course_id: int,
+    engine: Optional[str] = Query(None, description="Engine tính toán: matrix hoặc sql"),
+    mode: str = Query("full", description="full: tính toàn bộ, incremental: chỉ tính phần thay đổi"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Gửi job tính toán mức đạt CLO cho môn học, chạy nền và trả về job id"""
+    if mode not in ("full", "incremental"):
+        raise HTTPException(status_code=400, detail="mode phải là full hoặc incremental")
+    
+    course = session.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    
+    params = {"engine": validate_engine(engine), "mode": mode}
+    job, created = submit_calculation_job(
+        session,
+        "course",
+        course_id,
+        params=params,
+        created_by=current_user.id
+    )
+    if not created and has_conflicting_params(job, params):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Môn học đang có job {job.id} chạy ở chế độ {(job.params or {}).get('mode')}, vui lòng chờ job hoàn tất"
+        )
+    return to_job_response(job, deduplicated=not created)
+
+@router.post("/jobs/program/{program_id}", response_model=CalculationJobResponse)
+def submit_program_job(
+    program_id: int,
+    engine: Optional[str] = Query(None, description="Engine tính toán: matrix hoặc sql"),
+    use_persisted: bool = Query(True, description="Dùng bộ đếm TLĐ CLO đã lưu nếu còn mới"),
+    workers: Optional[int] = Query(None, ge=1, description="Số worker tính song song các môn học"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Gửi job tính toán TLĐ PLO cho chương trình, chạy nền và trả về job id"""
+    from app.models import Program
+    
+    program = session.get(Program, program_id)
+    if not program:
+        raise HTTPException(status_code=404, detail="Không tìm thấy chương trình đào tạo")
+    
+    params = {
+        "engine": validate_engine(engine),
+        "use_persisted": use_persisted,
+        "workers": workers
+    }
+    job, created = submit_calculation_job(
+        session,
+        "program",
+        program_id,
+        params=params,
+        created_by=current_user.id
+    )
+    if not created and has_conflicting_params(job, params):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Chương trình đang có job {job.id} với use_persisted={(job.params or {}).get('use_persisted')}, vui lòng chờ job hoàn tất"
+        )
+    return to_job_response(job, deduplicated=not created)
+
+@router.get("/jobs/{job_id}", response_model=CalculationJobResponse)
+def get_calculation_job(
+    job_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Xem trạng thái, tiến độ, thời gian chạy và kết quả của job tính toán"""
+    job = session.get(CalculationJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return to_job_response(job)
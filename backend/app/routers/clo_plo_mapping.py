@@ -3,14 +3,66 @@ from sqlmodel import Session, select
 from typing import List, Optional
 import tempfile
 import os
+from datetime import datetime
 from app.database import get_session
-from app.models import CLOPLOMapping, CLO, PLO, Program
-from app.schemas import CLOPLOMappingCreate, CLOPLOMappingUpdate, CLOPLOMappingResponse
+from app.models import CLOPLOMapping, CLO, PLO, Program, Course
+from app.schemas import (
+    CLOPLOMappingCreate, CLOPLOMappingUpdate, CLOPLOMappingResponse, CLOPLOAutoSuggestResponse,
+    CLOPLOMatrixResponse, CLOPLOMatrixUpdate, CLOPLOMatrixUpdateResponse
+)
 from app.auth import get_current_user
 from app.services.excel_mapping_parser import parse_excel_mapping
+from app.services.dirty_tracking_service import bump_clo_version, bump_course_version, bump_program_versions
+from app.services.clo_plo_mapping_service import (
+    MATRIX_MAX_CELLS, auto_suggest_course_mappings, load_matrix_scope, encode_mapping_matrix,
+    find_invalid_matrix_cells, apply_mapping_diff, upsert_clo_plo_mappings
+)
 
 router = APIRouter()
 
+def _get_course_or_404(session: Session, course_id: int) -> Course:
+    course = session.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    return course
+
+def _get_program_or_404(session: Session, program_id: int) -> Program:
+    program = session.get(Program, program_id)
+    if not program:
+        raise HTTPException(status_code=404, detail="Không tìm thấy chương trình đào tạo")
+    return program
+
+def _apply_matrix_update(
+    session: Session,
+    clos: List[CLO],
+    plos: List[PLO],
+    update: CLOPLOMatrixUpdate
+) -> dict:
+    """Kiểm tra các ô thay đổi thuộc ma trận rồi ghi bằng một lần upsert hàng loạt"""
+    if len(update.cells) > MATRIX_MAX_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tối đa {MATRIX_MAX_CELLS} ô mỗi lần cập nhật"
+        )
+    cells = [cell.model_dump() for cell in update.cells]
+    invalid = find_invalid_matrix_cells(cells, [clo.id for clo in clos], [plo.id for plo in plos])
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ô không hợp lệ (CLO/PLO ngoài ma trận hoặc mức đóng góp khác M/N/L/-): {invalid[:10]}"
+        )
+
+    result = apply_mapping_diff(session, cells)
+    course_by_clo = {clo.id: clo.course_id for clo in clos}
+    for course_id in sorted({course_by_clo[cell["clo_id"]] for cell in cells}):
+        bump_course_version(session, course_id)
+    session.commit()
+    return {
+        "inserted_count": result["inserted"],
+        "updated_count": result["updated"],
+        "deleted_count": result["deleted"]
+    }
+
 @router.get("/course/{course_id}/clo-plo-mapping", response_model=List[CLOPLOMappingResponse])
 async def get_clo_plo_mapping(
     course_id: int,
@@ -32,6 +84,72 @@ async def get_clo_plo_mapping(
     mappings = session.exec(statement).all()
     return mappings
 
+@router.post("/course/{course_id}/clo-plo-mapping/auto-suggest", response_model=CLOPLOAutoSuggestResponse)
+async def auto_suggest_clo_plo_mapping(
+    course_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Tự động gợi ý mapping cho mọi ô CLO × PLO còn trống của môn học
+
+    Score = 0.6*K + 0.3*B + 0.1*H được tính cho cả ma trận ở server, các mapping
+    còn thiếu được tạo trong một transaction; mapping đã có được giữ nguyên.
+    Trả về ma trận mức đóng góp sau khi gợi ý.
+    """
+    course = _get_course_or_404(session, course_id)
+    result = auto_suggest_course_mappings(session, course)
+    if result["created_count"]:
+        bump_course_version(session, course_id)
+    session.commit()
+    return result
+
+@router.get("/course/{course_id}/clo-plo-matrix", response_model=CLOPLOMatrixResponse)
+async def get_course_clo_plo_matrix(
+    course_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Ma trận CLO × PLO của môn học (header PLO, hàng CLO, chuỗi mã mức đóng góp)"""
+    course = _get_course_or_404(session, course_id)
+    clos, plos = load_matrix_scope(session, course_id=course_id, program_id=course.program_id)
+    return {"course_id": course_id, "program_id": course.program_id, **encode_mapping_matrix(session, clos, plos)}
+
+@router.put("/course/{course_id}/clo-plo-matrix", response_model=CLOPLOMatrixUpdateResponse)
+async def update_course_clo_plo_matrix(
+    course_id: int,
+    update: CLOPLOMatrixUpdate,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Cập nhật các ô thay đổi của ma trận môn học (contribution_level = null để xóa mapping)"""
+    course = _get_course_or_404(session, course_id)
+    clos, plos = load_matrix_scope(session, course_id=course_id, program_id=course.program_id)
+    return _apply_matrix_update(session, clos, plos, update)
+
+@router.get("/program/{program_id}/clo-plo-matrix", response_model=CLOPLOMatrixResponse)
+async def get_program_clo_plo_matrix(
+    program_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Ma trận CLO × PLO của toàn bộ chương trình đào tạo"""
+    _get_program_or_404(session, program_id)
+    clos, plos = load_matrix_scope(session, program_id=program_id)
+    return {"program_id": program_id, **encode_mapping_matrix(session, clos, plos)}
+
+@router.put("/program/{program_id}/clo-plo-matrix", response_model=CLOPLOMatrixUpdateResponse)
+async def update_program_clo_plo_matrix(
+    program_id: int,
+    update: CLOPLOMatrixUpdate,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Cập nhật các ô thay đổi của ma trận chương trình (contribution_level = null để xóa mapping)"""
+    _get_program_or_404(session, program_id)
+    clos, plos = load_matrix_scope(session, program_id=program_id)
+    return _apply_matrix_update(session, clos, plos, update)
+
 @router.post("/clo-plo-mapping", response_model=CLOPLOMappingResponse)
 async def create_clo_plo_mapping(
     mapping_data: CLOPLOMappingCreate,
@@ -48,26 +166,15 @@ async def create_clo_plo_mapping(
     if not plo:
         raise HTTPException(status_code=404, detail="Không tìm thấy PLO")
     
-    # Kiểm tra mapping đã tồn tại chưa
+    # Tạo mới hoặc cập nhật contribution_level nếu mapping đã tồn tại (upsert trên (clo_id, plo_id))
+    upsert_clo_plo_mappings(session, [{**mapping_data.model_dump(), "created_at": datetime.utcnow()}])
+    bump_clo_version(session, mapping_data.clo_id)
+    session.commit()
     statement = select(CLOPLOMapping).where(
         CLOPLOMapping.clo_id == mapping_data.clo_id,
         CLOPLOMapping.plo_id == mapping_data.plo_id
     )
-    existing = session.exec(statement).first()
-    if existing:
-        # Cập nhật contribution_level
-        existing.contribution_level = mapping_data.contribution_level
-        session.add(existing)
-        session.commit()
-        session.refresh(existing)
-        return existing
-    
-    # Tạo mới
-    mapping = CLOPLOMapping(**mapping_data.model_dump())
-    session.add(mapping)
-    session.commit()
-    session.refresh(mapping)
-    return mapping
+    return session.exec(statement).one()
 
 @router.put("/clo-plo-mapping/{mapping_id}", response_model=CLOPLOMappingResponse)
 async def update_clo_plo_mapping(
@@ -83,6 +190,7 @@ async def update_clo_plo_mapping(
     
     mapping.contribution_level = mapping_data.contribution_level
     session.add(mapping)
+    bump_clo_version(session, mapping.clo_id)
     session.commit()
     session.refresh(mapping)
     return mapping
@@ -98,6 +206,7 @@ async def delete_clo_plo_mapping(
     if not mapping:
         raise HTTPException(status_code=404, detail="Không tìm thấy mapping")
     
+    bump_clo_version(session, mapping.clo_id)
     session.delete(mapping)
     session.commit()
     return {"message": "Đã xóa mapping"}
@@ -143,6 +252,8 @@ async def import_excel_mapping(
             program_id=program_id,
             sheet_name=sheet_name
         )
+        bump_program_versions(session, program_id)
+        session.commit()
         
         return {
             "message": "Import thành công",
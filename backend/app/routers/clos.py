@@ -1,10 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 from typing import List
+from datetime import datetime
 from app.database import get_session
-from app.models import CLO, StudentCLOResult, CLOPLOMapping, Rubric, Question
+from app.models import (
+    CLO, StudentCLOResult, CLOPLOMapping, Rubric, StaleStudentCLO, CLOClassResult
+)
 from app.schemas import CLOCreate, CLOResponse
 from app.auth import get_current_user, require_role, UserRole
+from app.services.dirty_tracking_service import mark_clo_stale
+from app.services.question_clo_service import remove_clo_from_questions
+from app.services.prerequisite_service import refresh_course_text_index
+from app.services.text_analysis_service import ENTITY_CLO, refresh_text_profile, delete_text_profiles
+from app.services.clo_duplicate_service import refresh_clo_minhash, delete_clo_minhashes
 
 router = APIRouter()
 
@@ -52,6 +60,10 @@ async def create_clo(
         # Tạo CLO
         clo = CLO(**clo_data.model_dump(), course_id=course_id)
         session.add(clo)
+        mark_clo_stale(session, clo)
+        profile = refresh_text_profile(session, ENTITY_CLO, clo)
+        refresh_clo_minhash(session, clo.id, profile["tokens"])
+        refresh_course_text_index(session, course_id)
         session.commit()
         session.refresh(clo)
         return clo
@@ -75,8 +87,13 @@ async def update_clo(
     
     for key, value in clo_data.model_dump().items():
         setattr(clo, key, value)
+    clo.updated_at = datetime.utcnow()
     
     session.add(clo)
+    mark_clo_stale(session, clo)
+    profile = refresh_text_profile(session, ENTITY_CLO, clo)
+    refresh_clo_minhash(session, clo.id, profile["tokens"])
+    refresh_course_text_index(session, clo.course_id)
     session.commit()
     session.refresh(clo)
     return clo
@@ -99,6 +116,13 @@ async def delete_clo(
     for result in student_results:
         session.delete(result)
     
+    # Xóa bộ đếm TLĐ và đánh dấu tính lại của CLO
+    for stale in session.exec(select(StaleStudentCLO).where(StaleStudentCLO.clo_id == clo_id)).all():
+        session.delete(stale)
+    class_result = session.get(CLOClassResult, clo_id)
+    if class_result:
+        session.delete(class_result)
+    
     # 2. Xóa CLOPLOMapping
     statement = select(CLOPLOMapping).where(CLOPLOMapping.clo_id == clo_id)
     mappings = session.exec(statement).all()
@@ -112,16 +136,16 @@ async def delete_clo(
         session.delete(rubric)
     
     # 4. Cập nhật Question để loại bỏ clo_id khỏi clo_ids array
-    # (Không xóa Question, chỉ cập nhật clo_ids)
-    statement = select(Question)
-    questions = session.exec(statement).all()
-    for question in questions:
-        if question.clo_ids and clo_id in question.clo_ids:
-            question.clo_ids = [cid for cid in question.clo_ids if cid != clo_id]
-            session.add(question)
+    # (Không xóa Question, chỉ cập nhật clo_ids bằng một câu UPDATE array_remove)
+    remove_clo_from_questions(session, clo_id)
     
-    # 5. Xóa CLO
+    # 5. Xóa CLO, đánh dấu môn học cần tính lại và cập nhật chỉ mục từ khóa
+    course_id = clo.course_id
+    mark_clo_stale(session, clo)
+    delete_text_profiles(session, ENTITY_CLO, [clo_id])
+    delete_clo_minhashes(session, [clo_id])
     session.delete(clo)
+    refresh_course_text_index(session, course_id)
     session.commit()
     return {"message": "Đã xóa CLO"}
 
@@ -2,13 +2,20 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 from sqlalchemy import text as sql_text
 from typing import List
+from datetime import datetime
 from app.database import get_session
 from app.models import (
     Course, CLO, Assessment, Question, CoursePrerequisite,
-    Rubric, Reference, StudentCLOResult, CLOPLOMapping, StudentScore
+    Rubric, Reference, StudentCLOResult, CLOPLOMapping, StudentScore,
+    StaleStudentCLO, StaleCourse, CLOClassResult, CourseDataVersion, StudentCourseResult
 )
 from app.schemas import CourseCreate, CourseResponse
 from app.auth import get_current_user, require_role, UserRole
+from app.services.dirty_tracking_service import bump_course_version
+from app.services.prerequisite_graph_service import invalidate_prerequisite_graph
+from app.services.prerequisite_service import remove_course_text_index
+from app.services.text_analysis_service import ENTITY_CLO, delete_text_profiles
+from app.services.clo_duplicate_service import delete_clo_minhashes
 
 router = APIRouter()
 
@@ -66,10 +73,15 @@ async def update_course(
     
     for key, value in course_data.model_dump().items():
         setattr(course, key, value)
+    # Token đồ thị tiên quyết dựa vào max(Course.updated_at)
+    course.updated_at = datetime.utcnow()
     
     session.add(course)
+    # Số tín chỉ thay đổi ảnh hưởng đến TLĐ PLO
+    bump_course_version(session, course.id)
     session.commit()
     session.refresh(course)
+    invalidate_prerequisite_graph()
     return course
 
 @router.delete("/{course_id}")
@@ -85,8 +97,20 @@ async def delete_course(
     
     # Xóa các dữ liệu liên quan trước (cascade delete)
     try:
+        # 0. Xóa dữ liệu phục vụ tính toán tăng dần
+        for model in (StaleStudentCLO, CLOClassResult, StudentCourseResult):
+            for row in session.exec(select(model).where(model.course_id == course_id)).all():
+                session.delete(row)
+        for model in (StaleCourse, CourseDataVersion):
+            row = session.get(model, course_id)
+            if row:
+                session.delete(row)
+        remove_course_text_index(session, course_id)
+        
         # 1. Xóa CLOs và dữ liệu liên quan
         clos = session.exec(select(CLO).where(CLO.course_id == course_id)).all()
+        delete_text_profiles(session, ENTITY_CLO, [clo.id for clo in clos])
+        delete_clo_minhashes(session, [clo.id for clo in clos])
         for clo in clos:
             # Xóa StudentCLOResult
             student_results = session.exec(select(StudentCLOResult).where(StudentCLOResult.clo_id == clo.id)).all()
@@ -160,6 +184,7 @@ async def delete_course(
         # 6. Cuối cùng xóa Course
         session.delete(course)
         session.commit()
+        invalidate_prerequisite_graph()
         
         return {"message": "Đã xóa môn học và tất cả dữ liệu liên quan"}
     except Exception as e:
@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import Session
+from app.database import get_session
+from app.models import Course
+from app.schemas import (
+    EligibilityBatchRequest, EligibilityBatchResponse, CohortEligibilitySummaryResponse,
+    CohortCourseEligibilityResponse, BlockedStudentsResponse
+)
+from app.auth import get_current_user
+from app.services.prerequisite_service import ELIGIBILITY_MAX_PAIRS, compute_eligibility_matrix
+from app.services.cohort_eligibility_service import (
+    get_cohort_eligibility, summarize_cohort_eligibility, count_eligible_students, find_blocked_students
+)
+
+router = APIRouter()
+
+@router.post("/eligibility:batch", response_model=EligibilityBatchResponse)
+def check_eligibility_batch(
+    request: EligibilityBatchRequest,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Kiểm tra điều kiện tiên quyết hàng loạt cho nhiều sinh viên × nhiều môn học
+
+    Trả về ma trận gọn: mỗi sinh viên một chuỗi '0'/'1' theo thứ tự course_ids.
+    Điều kiện khuyến nghị (recommended) không chặn đăng ký; điều kiện song hành
+    chỉ được miễn khi chính sinh viên đăng ký môn song hành (registrations).
+    """
+    student_ids = list(dict.fromkeys(request.student_ids))
+    course_ids = list(dict.fromkeys(request.course_ids))
+    pair_count = len(student_ids) * len(course_ids)
+    if pair_count > ELIGIBILITY_MAX_PAIRS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Quá nhiều cặp sinh viên × môn học ({pair_count}), tối đa {ELIGIBILITY_MAX_PAIRS}"
+        )
+    
+    result = compute_eligibility_matrix(session, student_ids, course_ids, request.registrations)
+    eligible = result["eligible"]
+    return EligibilityBatchResponse(
+        student_ids=student_ids,
+        course_ids=course_ids,
+        eligible=["".join("1" if value else "0" for value in row) for row in eligible.tolist()],
+        eligible_count=int(eligible.sum()),
+        pair_count=pair_count,
+        blocking_prereq_ids={
+            str(course_id): prereq_ids for course_id, prereq_ids in result["blocking_prereq_ids"].items()
+        }
+    )
+
+
+@router.get("/cohort-eligibility", response_model=CohortEligibilitySummaryResponse)
+def get_cohort_eligibility_summary(
+    cohort_id: str = Query(None, description="Lọc theo cohort"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Số sinh viên đủ điều kiện đăng ký theo từng môn có điều kiện tiên quyết"""
+    return summarize_cohort_eligibility(get_cohort_eligibility(session, cohort_id))
+
+
+@router.get("/cohort-eligibility/courses/{course_id}", response_model=CohortCourseEligibilityResponse)
+def get_cohort_course_eligibility(
+    course_id: int,
+    cohort_id: str = Query(None, description="Lọc theo cohort"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Số sinh viên của cohort đủ điều kiện đăng ký môn học"""
+    if not session.get(Course, course_id):
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    return count_eligible_students(get_cohort_eligibility(session, cohort_id), course_id)
+
+
+@router.get("/cohort-eligibility/blocked", response_model=BlockedStudentsResponse)
+def get_blocked_students(
+    cohort_id: str = Query(None, description="Lọc theo cohort"),
+    min_courses: int = Query(1, ge=1, description="Số môn bị chặn tối thiểu"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Sinh viên bị chặn đăng ký bởi ít nhất min_courses môn học"""
+    return find_blocked_students(get_cohort_eligibility(session, cohort_id), min_courses)
@@ -39,15 +39,18 @@ async def export_course_word(
     statement = select(Assessment).where(Assessment.course_id == course_id)
     assessments = session.exec(statement).all()
     
-    # Lấy Questions
-    question_data = []
-    for assessment in assessments:
-        statement = select(Question).where(Question.assessment_id == assessment.id)
-        questions = session.exec(statement).all()
-        question_data.append({
-            "assessment": assessment,
-            "questions": questions
-        })
+    # Lấy Questions của tất cả assessments trong một truy vấn
+    questions_by_assessment = {assessment.id: [] for assessment in assessments}
+    if questions_by_assessment:
+        statement = select(Question).where(
+            Question.assessment_id.in_(list(questions_by_assessment))
+        ).order_by(Question.id)
+        for question in session.exec(statement).all():
+            questions_by_assessment[question.assessment_id].append(question)
+    question_data = [
+        {"assessment": assessment, "questions": questions_by_assessment[assessment.id]}
+        for assessment in assessments
+    ]
     
     # Lấy Prerequisites nếu cần
     prerequisites = []
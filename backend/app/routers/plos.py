@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 from typing import List
+from datetime import datetime
 from app.database import get_session
-from app.models import PLO
+from app.models import PLO, StudentPLOResult
 from app.schemas import PLOCreate, PLOResponse
 from app.auth import get_current_user, require_role, UserRole
+from app.services.text_analysis_service import ENTITY_PLO, refresh_text_profile, delete_text_profiles
 
 router = APIRouter()
 
@@ -44,6 +46,7 @@ async def create_plo(
     """Tạo PLO mới"""
     plo = PLO(**plo_data.model_dump(), program_id=program_id)
     session.add(plo)
+    refresh_text_profile(session, ENTITY_PLO, plo)
     session.commit()
     session.refresh(plo)
     return plo
@@ -62,8 +65,10 @@ async def update_plo(
     
     for key, value in plo_data.model_dump().items():
         setattr(plo, key, value)
+    plo.updated_at = datetime.utcnow()
     
     session.add(plo)
+    refresh_text_profile(session, ENTITY_PLO, plo)
     session.commit()
     session.refresh(plo)
     return plo
@@ -79,6 +84,11 @@ async def delete_plo(
     if not plo:
         raise HTTPException(status_code=404, detail="Không tìm thấy PLO")
     
+    # Xóa mức đạt PLO đã tính của sinh viên
+    for result in session.exec(select(StudentPLOResult).where(StudentPLOResult.plo_id == plo_id)).all():
+        session.delete(result)
+    
+    delete_text_profiles(session, ENTITY_PLO, [plo_id])
     session.delete(plo)
     session.commit()
     return {"message": "Đã xóa PLO"}
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+import json
 from app.database import get_session
 from app.models import (
     CoursePrerequisite, Course, CLO, Student, StudentCLOResult,
@@ -9,16 +12,122 @@ from app.models import (
 from app.schemas import (
     PrerequisiteCreate, PrerequisiteResponse,
     SuggestPrerequisiteRequest, SuggestPrerequisiteResponse,
-    ImpactAnalysisResponse
+    ImpactAnalysisResponse, ImpactSummaryResponse, ImpactPageResponse,
+    PrerequisiteChainResponse, DependentCoursesResponse, PrerequisiteGraphReportResponse,
+    SimilarCoursesRequest, SimilarCoursesResponse
 )
 from app.auth import get_current_user, require_role, UserRole
+from app.services.prerequisite_graph_service import (
+    get_prerequisite_graph,
+    invalidate_prerequisite_graph,
+    creates_prerequisite_cycle,
+    get_prerequisite_chain,
+    get_dependent_courses,
+    get_prerequisite_graph_report
+)
 from app.services.prerequisite_service import (
-    check_student_meets_prereq,
+    compute_prerequisite_impact,
+    get_prerequisite_impact_page,
+    iter_prerequisite_impact_stream,
     suggest_prerequisites
 )
+from app.services.cohort_eligibility_service import get_course_impact_summary
+from app.services.course_similarity_service import (
+    SIMILARITY_METRICS,
+    find_similar_courses,
+    find_courses_similar_to_clos
+)
 
 router = APIRouter()
 
+def reject_prerequisite_cycle(
+    session: Session,
+    course_id: int,
+    prereq_data: PrerequisiteCreate
+) -> None:
+    """Từ chối điều kiện tiên quyết tạo chu trình (ví dụ A cần B, B cần A)"""
+    graph = get_prerequisite_graph(session)
+    cycle = creates_prerequisite_cycle(
+        graph, course_id, prereq_data.prereq_course_id, prereq_data.type.value
+    )
+    if cycle:
+        codes = [graph["courses"].get(node, {}).get("code", str(node)) for node in cycle]
+        raise HTTPException(
+            status_code=400,
+            detail=f"Điều kiện tiên quyết tạo chu trình: {' → '.join(codes)}"
+        )
+
+def validate_similarity_metric(metric: str) -> None:
+    """Chỉ chấp nhận các độ đo tương tự được hỗ trợ"""
+    if metric not in SIMILARITY_METRICS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Độ đo không hợp lệ: {metric} (chỉ hỗ trợ {', '.join(SIMILARITY_METRICS)})"
+        )
+
+@router.post("/similar", response_model=SimilarCoursesResponse)
+async def find_courses_similar_to_clos_endpoint(
+    request: SimilarCoursesRequest,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Môn học tương tự một tập CLO tùy ý, trên toàn bộ danh mục môn học"""
+    validate_similarity_metric(request.metric)
+    texts = [f"{clo.get('verb', '')} {clo.get('text', '')}" for clo in request.clos]
+    return find_courses_similar_to_clos(
+        session, texts, request.metric, request.k,
+        exclude_course_id=request.exclude_course_id, program_id=request.program_id
+    )
+
+@router.get("/{course_id}/similar", response_model=SimilarCoursesResponse)
+async def find_similar_courses_endpoint(
+    course_id: int,
+    metric: str = Query("cosine", description="cosine hoặc jaccard"),
+    k: int = Query(10, ge=1, le=100, description="Số môn học trả về"),
+    program_id: Optional[int] = Query(None, description="Lọc theo chương trình đào tạo"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Top-k môn học có CLO tương tự môn học (cosine TF-IDF hoặc Jaccard từ khóa)"""
+    validate_similarity_metric(metric)
+    if not session.get(Course, course_id):
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    return find_similar_courses(session, course_id, metric, k, program_id)
+
+@router.get("/prerequisites/cycles", response_model=PrerequisiteGraphReportResponse)
+async def get_prerequisite_cycles(
+    program_id: Optional[int] = Query(None, description="Lọc theo chương trình đào tạo"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Báo cáo chu trình và thứ tự topo của đồ thị điều kiện tiên quyết"""
+    graph = get_prerequisite_graph(session)
+    return get_prerequisite_graph_report(graph, program_id)
+
+@router.get("/{course_id}/prerequisites/chain", response_model=PrerequisiteChainResponse)
+async def get_prerequisite_chain_endpoint(
+    course_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Chuỗi điều kiện tiên quyết đầy đủ (trực tiếp và bắc cầu) của môn học"""
+    graph = get_prerequisite_graph(session)
+    if course_id not in graph["courses"]:
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    return get_prerequisite_chain(graph, course_id)
+
+@router.get("/{course_id}/prerequisites/dependents", response_model=DependentCoursesResponse)
+async def get_dependent_courses_endpoint(
+    course_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Các môn học cần môn này làm tiên quyết (trực tiếp và bắc cầu)"""
+    graph = get_prerequisite_graph(session)
+    if course_id not in graph["courses"]:
+        raise HTTPException(status_code=404, detail="Không tìm thấy môn học")
+    return get_dependent_courses(graph, course_id)
+
 @router.get("/{course_id}/prerequisites", response_model=List[PrerequisiteResponse])
 async def list_prerequisites(
     course_id: int,
@@ -50,6 +159,8 @@ async def create_prerequisite(
     if not prereq_course:
         raise HTTPException(status_code=404, detail="Không tìm thấy môn học tiên quyết")
     
+    reject_prerequisite_cycle(session, course_id, prereq_data)
+    
     prereq = CoursePrerequisite(
         **prereq_data.model_dump(),
         course_id=course_id,
@@ -58,6 +169,7 @@ async def create_prerequisite(
     session.add(prereq)
     session.commit()
     session.refresh(prereq)
+    invalidate_prerequisite_graph()
     return prereq
 
 @router.put("/{course_id}/prerequisites/{prereq_id}", response_model=PrerequisiteResponse)
@@ -73,12 +185,16 @@ async def update_prerequisite(
     if not prereq or prereq.course_id != course_id:
         raise HTTPException(status_code=404, detail="Không tìm thấy điều kiện tiên quyết")
     
+    reject_prerequisite_cycle(session, course_id, prereq_data)
+    
     for key, value in prereq_data.model_dump().items():
         setattr(prereq, key, value)
+    prereq.updated_at = datetime.utcnow()
     
     session.add(prereq)
     session.commit()
     session.refresh(prereq)
+    invalidate_prerequisite_graph()
     return prereq
 
 @router.delete("/{course_id}/prerequisites/{prereq_id}")
@@ -95,6 +211,7 @@ async def delete_prerequisite(
     
     session.delete(prereq)
     session.commit()
+    invalidate_prerequisite_graph()
     return {"message": "Đã xóa điều kiện tiên quyết"}
 
 @router.post("/{course_id}/prerequisites/suggest", response_model=List[SuggestPrerequisiteResponse])
@@ -108,7 +225,8 @@ async def suggest_prerequisites_endpoint(
     suggestions = suggest_prerequisites(
         session=session,
         clos=request.clos,
-        domain=request.domain
+        domain=request.domain,
+        exclude_course_id=course_id
     )
     return suggestions
 
@@ -120,69 +238,44 @@ async def analyze_prerequisite_impact(
     current_user = Depends(get_current_user)
 ):
     """Phân tích tác động: số sinh viên không đáp ứng điều kiện tiên quyết"""
-    # Lấy danh sách prerequisites
-    statement = select(CoursePrerequisite).where(
-        CoursePrerequisite.course_id == course_id
-    )
-    prereqs = session.exec(statement).all()
-    
-    if not prereqs:
-        return ImpactAnalysisResponse(
-            total_students=0,
-            missing_count=0,
-            missing_students=[],
-            risk_score=0.0
-        )
-    
-    # Lấy danh sách sinh viên
-    if cohort_id:
-        statement = select(Student).where(Student.cohort == cohort_id)
-    else:
-        statement = select(Student)
-    students = session.exec(statement).all()
-    
-    missing_students = []
-    for student in students:
-        missing_courses = []
-        missing_course_details = []  # Lưu thông tin chi tiết: tên môn và trạng thái
-        
-        for prereq in prereqs:
-            result = check_student_meets_prereq(session, student.id, prereq)
-            if not result["meets"]:
-                # Lấy tên môn học từ prereq_course_id
-                prereq_course = session.get(Course, prereq.prereq_course_id)
-                course_name = prereq_course.title if prereq_course else f"Môn học ID {prereq.prereq_course_id}"
-                
-                # Xác định trạng thái: Chưa học hoặc Chưa đạt
-                details = result.get("details", "")
-                status = "Chưa học"
-                if "Chưa đạt:" in details:
-                    status = "Chưa đạt"
-                
-                missing_courses.append(course_name)
-                missing_course_details.append({
-                    "course_name": course_name,
-                    "status": status
-                })
-        
-        if missing_courses:
-            missing_students.append({
-                "id": student.id,
-                "name": student.name,
-                "student_number": student.student_number,
-                "reason": ", ".join(missing_courses),
-                "missing_courses": missing_courses,
-                "missing_course_details": missing_course_details
-            })
-    
-    total_students = len(students)
-    missing_count = len(missing_students)
-    risk_score = missing_count / total_students if total_students > 0 else 0.0
-    
-    return ImpactAnalysisResponse(
-        total_students=total_students,
-        missing_count=missing_count,
-        missing_students=missing_students,
-        risk_score=risk_score
-    )
+    return ImpactAnalysisResponse(**compute_prerequisite_impact(session, course_id, cohort_id))
 
+@router.get("/{course_id}/prerequisites/impact/summary", response_model=ImpactSummaryResponse)
+async def get_prerequisite_impact_summary(
+    course_id: int,
+    cohort_id: str = Query(None, description="Lọc theo cohort"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Chỉ số tổng hợp của phân tích tác động (đọc từ ma trận đủ điều kiện đã tính sẵn của cohort)"""
+    return ImpactSummaryResponse(**get_course_impact_summary(session, course_id, cohort_id))
+
+@router.get("/{course_id}/prerequisites/impact/students", response_model=ImpactPageResponse)
+async def list_prerequisite_impact_students(
+    course_id: int,
+    cohort_id: str = Query(None, description="Lọc theo cohort"),
+    cursor: Optional[int] = Query(None, description="Id sinh viên cuối cùng của trang trước"),
+    limit: int = Query(100, ge=1, le=1000, description="Số sinh viên mỗi trang"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Danh sách sinh viên không đáp ứng điều kiện tiên quyết, phân trang theo cursor"""
+    page = get_prerequisite_impact_page(session, course_id, cohort_id, cursor, limit)
+    return ImpactPageResponse(**page, limit=limit)
+
+@router.get("/{course_id}/prerequisites/impact/stream")
+async def stream_prerequisite_impact(
+    course_id: int,
+    cohort_id: str = Query(None, description="Lọc theo cohort"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Phân tích tác động dạng NDJSON: mỗi dòng một sinh viên không đáp ứng,
+    dòng cuối là bản tóm tắt (type = "summary")
+    """
+    lines = iter_prerequisite_impact_stream(session.get_bind(), course_id, cohort_id)
+    return StreamingResponse(
+        (json.dumps(line, ensure_ascii=False) + "\n" for line in lines),
+        media_type="application/x-ndjson"
+    )
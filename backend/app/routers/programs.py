@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, select
 from typing import List
 from app.database import get_session
 from app.models import Program
-from app.schemas import ProgramCreate, ProgramResponse
+from app.schemas import ProgramCreate, ProgramResponse, DuplicateCLOReportResponse
 from app.auth import get_current_user, require_role, UserRole
+from app.services.clo_duplicate_service import (
+    DEFAULT_DUPLICATE_THRESHOLD, MIN_DUPLICATE_THRESHOLD, find_duplicate_clos
+)
 
 router = APIRouter()
 
@@ -85,3 +88,19 @@ async def delete_program(
     session.commit()
     return {"message": "Đã xóa chương trình đào tạo"}
 
+@router.get("/{program_id}/duplicate-clos", response_model=DuplicateCLOReportResponse)
+async def get_duplicate_clos_report(
+    program_id: int,
+    threshold: float = Query(
+        DEFAULT_DUPLICATE_THRESHOLD, ge=MIN_DUPLICATE_THRESHOLD, le=1.0,
+        description="Ngưỡng Jaccard (thấp hơn ngưỡng tối thiểu thì LSH bỏ sót phần lớn cặp)"
+    ),
+    include_other_programs: bool = Query(True, description="Gồm cả CLO trùng ở chương trình khác"),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """Báo cáo các cặp CLO gần trùng lặp (MinHash / LSH) liên quan đến chương trình"""
+    program = session.get(Program, program_id)
+    if not program:
+        raise HTTPException(status_code=404, detail="Không tìm thấy chương trình đào tạo")
+    return find_duplicate_clos(session, program_id, threshold, include_other_programs)
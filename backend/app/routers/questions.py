@@ -5,6 +5,7 @@ from app.database import get_session
 from app.models import Question
 from app.schemas import QuestionCreate, QuestionResponse
 from app.auth import get_current_user, require_role, UserRole
+from app.services.dirty_tracking_service import mark_question_stale
 
 router = APIRouter()
 
@@ -44,6 +45,7 @@ async def create_question(
     """Tạo câu hỏi mới"""
     question = Question(**question_data.model_dump(), assessment_id=assessment_id)
     session.add(question)
+    mark_question_stale(session, question)
     session.commit()
     session.refresh(question)
     return question
@@ -64,6 +66,7 @@ async def update_question(
         setattr(question, key, value)
     
     session.add(question)
+    mark_question_stale(session, question)
     session.commit()
     session.refresh(question)
     return question
@@ -79,6 +82,7 @@ async def delete_question(
     if not question:
         raise HTTPException(status_code=404, detail="Không tìm thấy câu hỏi")
     
+    mark_question_stale(session, question)
     session.delete(question)
     session.commit()
     return {"message": "Đã xóa câu hỏi"}
@@ -5,6 +5,7 @@ from app.database import get_session
 from app.models import StudentScore
 from app.schemas import StudentScoreCreate, StudentScoreResponse
 from app.auth import get_current_user
+from app.services.dirty_tracking_service import mark_scores_stale
 
 router = APIRouter()
 
@@ -46,6 +47,7 @@ async def create_score(
     """Tạo điểm mới"""
     score = StudentScore(**score_data.model_dump())
     session.add(score)
+    mark_scores_stale(session, [(score.student_id, score.question_id)])
     session.commit()
     session.refresh(score)
     return score
@@ -62,6 +64,7 @@ async def create_scores_batch(
         score = StudentScore(**score_data.model_dump())
         session.add(score)
         scores.append(score)
+    mark_scores_stale(session, [(score.student_id, score.question_id) for score in scores])
     session.commit()
     for score in scores:
         session.refresh(score)
@@ -79,10 +82,12 @@ async def update_score(
     if not score:
         raise HTTPException(status_code=404, detail="Không tìm thấy điểm")
     
+    old_key = (score.student_id, score.question_id)
     for key, value in score_data.model_dump().items():
         setattr(score, key, value)
     
     session.add(score)
+    mark_scores_stale(session, [old_key, (score.student_id, score.question_id)])
     session.commit()
     session.refresh(score)
     return score
@@ -98,6 +103,7 @@ async def delete_score(
     if not score:
         raise HTTPException(status_code=404, detail="Không tìm thấy điểm")
     
+    mark_scores_stale(session, [(score.student_id, score.question_id)])
     session.delete(score)
     session.commit()
     return {"message": "Đã xóa điểm"}
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+from sqlmodel import Session
+from app.database import get_session
+from app.schemas import TextProfileStatsResponse, TextProfileRebuildResponse
+from app.auth import get_current_user, require_role, UserRole
+from app.services.text_analysis_service import rebuild_text_profiles, get_text_profile_stats
+from app.services.prerequisite_service import rebuild_course_text_index
+
+router = APIRouter()
+
+@router.get("/stats", response_model=TextProfileStatsResponse)
+def get_text_profiles_stats(
+    current_user = Depends(get_current_user)
+):
+    """Tỉ lệ tái sử dụng hồ sơ văn bản CLO / PLO (cache bộ nhớ và bảng TextProfile)"""
+    return get_text_profile_stats()
+
+@router.post("/rebuild", response_model=TextProfileRebuildResponse)
+def rebuild_text_profiles_endpoint(
+    session: Session = Depends(get_session),
+    current_user = Depends(require_role([UserRole.ADMIN]))
+):
+    """Tách từ lại toàn bộ CLO / PLO, tính lại TF-IDF và chỉ mục từ khóa của môn học"""
+    result = rebuild_text_profiles(session)
+    result["course_count"] = rebuild_course_text_index(session)
+    session.commit()
+    return result
@@ -1,4 +1,5 @@
-from sqlmodel import SQLModel
+from sqlmodel import SQLModel, Field
+from pydantic import confloat
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from app.models import (
@@ -153,6 +154,71 @@ class PrerequisiteResponse(SQLModel):
     created_at: datetime
     updated_at: datetime
 
+class PrerequisiteGraphCourse(SQLModel):
+    course_id: int
+    code: Optional[str] = None
+    title: Optional[str] = None
+    level: int = 0  # Độ sâu trong đồ thị tiên quyết (0 = không cần môn nào)
+
+class PrerequisiteChainResponse(SQLModel):
+    course_id: int
+    level: int
+    direct: List[PrerequisiteGraphCourse]
+    transitive: List[PrerequisiteGraphCourse]  # Theo thứ tự topo: học trước đứng trước
+    coreqs: List[PrerequisiteGraphCourse]
+
+class DependentCoursesResponse(SQLModel):
+    course_id: int
+    direct: List[PrerequisiteGraphCourse]
+    transitive: List[PrerequisiteGraphCourse]
+
+class PrerequisiteGraphReportResponse(SQLModel):
+    program_id: Optional[int] = None
+    course_count: int
+    edge_count: int
+    cycles: List[List[PrerequisiteGraphCourse]]
+    topological_order: List[int]
+
+class SimilarCourse(SQLModel):
+    course_id: int
+    code: str
+    title: str
+    program_id: Optional[int] = None
+    score: float
+
+class SimilarCoursesRequest(SQLModel):
+    clos: List[Dict[str, Any]]  # [{verb, text}]
+    metric: str = "cosine"  # cosine hoặc jaccard
+    k: int = Field(default=10, ge=1, le=100)
+    program_id: Optional[int] = None
+    exclude_course_id: Optional[int] = None
+
+class SimilarCoursesResponse(SQLModel):
+    metric: str
+    course_id: Optional[int] = None
+    similar_courses: List[SimilarCourse]
+
+class DuplicateCLOItem(SQLModel):
+    clo_id: int
+    code: str
+    text: str
+    course_id: int
+    course_code: str
+    program_id: Optional[int] = None
+
+class DuplicateCLOPair(SQLModel):
+    similarity: float  # Jaccard chính xác trên tập từ khóa
+    estimated_similarity: float  # Ước lượng từ chữ ký MinHash
+    first: DuplicateCLOItem
+    second: DuplicateCLOItem
+
+class DuplicateCLOReportResponse(SQLModel):
+    program_id: int
+    threshold: float
+    candidate_count: int  # Số cặp ứng viên từ chỉ mục LSH
+    duplicate_count: int
+    duplicates: List[DuplicateCLOPair]
+
 class SuggestPrerequisiteRequest(SQLModel):
     clos: List[Dict[str, Any]]  # [{verb, text, bloom_level}]
     domain: Optional[str] = "Tourism"
@@ -170,6 +236,52 @@ class ImpactAnalysisResponse(SQLModel):
     missing_students: List[Dict[str, Any]]
     risk_score: float
 
+class ImpactSummaryResponse(SQLModel):
+    total_students: int
+    missing_count: int
+    risk_score: float
+
+class ImpactPageResponse(SQLModel):
+    missing_students: List[Dict[str, Any]]
+    next_cursor: Optional[int] = None  # Id sinh viên cuối trang, None nếu hết dữ liệu
+    limit: int
+
+class EligibilityBatchRequest(SQLModel):
+    student_ids: List[int]
+    course_ids: List[int]  # Các môn cần kiểm tra
+    # Các môn mỗi sinh viên đăng ký trong cùng đợt: {student_id: [course_id]}.
+    # Điều kiện song hành (coreq) chỉ được miễn cho sinh viên đăng ký môn song hành.
+    registrations: Optional[Dict[int, List[int]]] = None
+
+class EligibilityBatchResponse(SQLModel):
+    student_ids: List[int]
+    course_ids: List[int]
+    eligible: List[str]  # Mỗi sinh viên một chuỗi '0'/'1' theo thứ tự course_ids
+    eligible_count: int
+    pair_count: int
+    blocking_prereq_ids: Dict[str, List[int]] = {}  # {course_id: id điều kiện chặn đăng ký}
+
+class CohortEligibilitySummaryResponse(SQLModel):
+    cohort_id: Optional[str] = None
+    student_count: int
+    built_at: datetime
+    refreshed_student_count: int  # Số sinh viên được tính lại ở lần làm mới gần nhất
+    courses: Dict[str, int] = {}  # {course_id: số sinh viên đủ điều kiện}
+
+class CohortCourseEligibilityResponse(SQLModel):
+    cohort_id: Optional[str] = None
+    course_id: int
+    student_count: int
+    eligible_count: int
+    blocked_count: int
+
+class BlockedStudentsResponse(SQLModel):
+    cohort_id: Optional[str] = None
+    min_blocked_courses: int
+    student_count: int
+    blocked_count: int
+    students: List[Dict[str, int]]  # [{student_id, blocked_course_count}]
+
 class CalculateCourseRequest(SQLModel):
     course_id: int
 
@@ -177,6 +289,8 @@ class CalculateCourseResponse(SQLModel):
     course_id: int
     student_results: List[Dict[str, Any]]
     class_tld_clo: Dict[str, float]  # {clo_id: tld_value}
+    inserted_count: int = 0  # Số StudentCLOResult được thêm mới
+    updated_count: int = 0  # Số StudentCLOResult được cập nhật
     message: str
 
 class CalculateProgramRequest(SQLModel):
@@ -187,6 +301,77 @@ class CalculateProgramResponse(SQLModel):
     tld_plo: Dict[str, float]  # {plo_id: tld_value}
     message: str
 
+class CalculateStudentPLOResponse(SQLModel):
+    program_id: int
+    student_count: int
+    plo_count: int
+    result_count: int  # Số StudentPLOResult đã lưu
+    expected_threshold: float
+    message: str
+
+class ClassTLDCLOResponse(SQLModel):
+    course_id: int
+    class_tld_clo: Dict[str, float]  # {clo_id: tld_value}
+
+class ProgramTLDPLOResponse(SQLModel):
+    program_id: int
+    tld_plo: Dict[str, float]  # {plo_id: tld_value}
+
+class CacheStatsResponse(SQLModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
+
+class TextProfileStatsResponse(SQLModel):
+    memory_cache: CacheStatsResponse
+    persisted_hits: int  # Hồ sơ đọc từ bảng TextProfile
+    recomputed: int  # Hồ sơ chưa có / đã cũ phải tách từ lại
+    lookups: int
+    hit_ratio: float
+
+class TextProfileRebuildResponse(SQLModel):
+    clo_count: int
+    plo_count: int
+    term_count: int
+    course_count: int  # Số môn học được dựng lại chỉ mục từ khóa
+
+class SimulationRequest(SQLModel):
+    clo_threshold: Optional[float] = Field(default=None, ge=0, le=1)  # Ngưỡng đạt áp dụng cho mọi CLO
+    clo_thresholds: Dict[int, confloat(ge=0, le=1)] = {}  # {clo_id: ngưỡng}, ghi đè clo_threshold
+    assessment_weights: Dict[int, confloat(ge=0)] = {}  # {assessment_id: trọng số}
+    contribution_weights: Dict[str, confloat(ge=0)] = {}  # {"M"|"N"|"L": trọng số}, chỉ dùng cho chương trình
+
+class CourseSimulationResponse(SQLModel):
+    course_id: int
+    student_count: int
+    class_tld_clo: Dict[str, float]  # {clo_id: tld mô phỏng}
+    baseline_tld_clo: Dict[str, float]  # {clo_id: tld với tham số hiện tại}
+
+class ProgramSimulationResponse(SQLModel):
+    program_id: int
+    course_count: int
+    contribution_weights: Dict[str, float]
+    tld_plo: Dict[str, float]  # {plo_id: tld mô phỏng}
+    baseline_tld_plo: Dict[str, float]  # {plo_id: tld với tham số hiện tại}
+
+class CalculationJobResponse(SQLModel):
+    id: int
+    kind: str
+    scope_id: int
+    status: str
+    progress: float
+    params: Dict[str, Any] = {}
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None  # Thời gian chạy (đến hiện tại nếu chưa xong)
+    deduplicated: bool = False  # True nếu trả về job đang chạy sẵn của cùng phạm vi
+
 class ExportCourseRequest(SQLModel):
     instructor_name: str
     instructor_email: str
@@ -212,6 +397,48 @@ class CLOPLOMappingResponse(SQLModel):
     contribution_level: str
     created_at: datetime
 
+class CLOPLOAutoSuggestResponse(SQLModel):
+    course_id: int
+    program_id: Optional[int] = None
+    clo_ids: List[int]  # Thứ tự hàng của ma trận
+    plo_ids: List[int]  # Thứ tự cột của ma trận
+    levels: List[List[Optional[str]]]  # levels[i][j]: mức đóng góp của clo_ids[i] vào plo_ids[j]
+    created_count: int
+    mappings: List[CLOPLOMappingResponse]
+
+class CLOPLOMatrixPLO(SQLModel):
+    id: int
+    code: str
+    description: str
+
+class CLOPLOMatrixCLO(SQLModel):
+    id: int
+    code: str
+    verb: str
+    text: str
+    bloom_level: str
+    course_id: int
+
+class CLOPLOMatrixResponse(SQLModel):
+    course_id: Optional[int] = None
+    program_id: Optional[int] = None
+    plos: List[CLOPLOMatrixPLO]  # Header cột
+    clos: List[CLOPLOMatrixCLO]  # Hàng
+    rows: List[str]  # rows[i][j]: mức đóng góp (M/N/L/-) của clos[i] vào plos[j], '.' = chưa có mapping
+
+class CLOPLOMatrixCell(SQLModel):
+    clo_id: int
+    plo_id: int
+    contribution_level: Optional[str] = None  # None = xóa mapping
+
+class CLOPLOMatrixUpdate(SQLModel):
+    cells: List[CLOPLOMatrixCell]  # Chỉ các ô thay đổi
+
+class CLOPLOMatrixUpdateResponse(SQLModel):
+    inserted_count: int
+    updated_count: int
+    deleted_count: int
+
 # Schemas cho Rubric
 class RubricCreate(SQLModel):
     name: str
@@ -2,11 +2,731 @@
 Service tính toán CLO achievement và TLĐ (Tỷ lệ đạt)
 """
 from sqlmodel import Session, select
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Callable, Iterable, Iterator
+from itertools import islice
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from sqlalchemy import text as sql_text, literal_column, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert, array
+from app.config import settings
 from app.models import (
-    Course, CLO, Assessment, Question, Student, StudentScore, StudentCLOResult, CLOPLOMapping
+    Course, CLO, Assessment, Question, Student, StudentScore, StudentCLOResult, CLOPLOMapping,
+    StaleStudentCLO, StaleCourse, CLOClassResult, StudentPLOResult, StudentCourseResult
 )
+from app.services.dirty_tracking_service import get_course_data_version, get_program_data_version
+from app.services.result_cache import tld_cache
+
+def load_course_matrices(
+    session: Session,
+    course_id: int,
+    student_ids: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """
+    Nạp toàn bộ dữ liệu điểm của một môn học thành các ma trận NumPy
+
+    Chỉ dùng một số truy vấn cố định (CLO, assessment, question, điểm),
+    không phụ thuộc vào số sinh viên hay số câu hỏi.
+    Truyền student_ids để chỉ nạp điểm của một nhóm sinh viên.
+
+    Trả về dict gồm:
+    - student_ids, question_ids, clo_ids, assessment_ids: thứ tự hàng/cột
+    - scores: ma trận điểm sinh viên × câu hỏi (thiếu điểm = 0)
+    - max_scores: điểm tối đa của từng câu hỏi
+    - question_assessment: chỉ số assessment của từng câu hỏi
+    - assessment_weights: trọng số của từng assessment
+    - incidence: ma trận 0/1 câu hỏi × CLO (từ Question.clo_ids)
+    - thresholds: ngưỡng đạt (NKQCLO_j) của từng CLO
+    """
+    clos = session.exec(
+        select(CLO).where(CLO.course_id == course_id).order_by(CLO.id)
+    ).all()
+    assessments = session.exec(
+        select(Assessment).where(Assessment.course_id == course_id).order_by(Assessment.id)
+    ).all()
+    questions = session.exec(
+        select(Question).join(Assessment)
+        .where(Assessment.course_id == course_id)
+        .order_by(Question.id)
+    ).all()
+
+    clo_ids = [clo.id for clo in clos]
+    assessment_ids = [a.id for a in assessments]
+    question_ids = [q.id for q in questions]
+
+    # Sắp theo id: nếu một (sinh viên, câu hỏi) có nhiều dòng điểm thì dòng mới nhất
+    # (id lớn nhất) được giữ, cùng quy tắc với COURSE_ACHIEVEMENT_SQL
+    score_rows = []
+    if question_ids:
+        statement = select(
+            StudentScore.student_id, StudentScore.question_id, StudentScore.score
+        ).where(StudentScore.question_id.in_(question_ids)).order_by(StudentScore.id)
+        if student_ids is not None:
+            statement = statement.where(StudentScore.student_id.in_(student_ids))
+        score_rows = session.exec(statement).all()
+
+    student_ids = sorted({row[0] for row in score_rows})
+
+    clo_index = {clo_id: j for j, clo_id in enumerate(clo_ids)}
+    assessment_index = {a_id: k for k, a_id in enumerate(assessment_ids)}
+    question_index = {q_id: i for i, q_id in enumerate(question_ids)}
+    student_index = {s_id: r for r, s_id in enumerate(student_ids)}
+
+    scores = np.zeros((len(student_ids), len(question_ids)), dtype=np.float64)
+    for student_id, question_id, score in score_rows:
+        scores[student_index[student_id], question_index[question_id]] = score
+
+    incidence = np.zeros((len(question_ids), len(clo_ids)), dtype=np.float64)
+    for i, question in enumerate(questions):
+        for clo_id in question.clo_ids or []:
+            j = clo_index.get(clo_id)
+            if j is not None:
+                incidence[i, j] = 1.0
+
+    return {
+        "course_id": course_id,
+        "student_ids": student_ids,
+        "question_ids": question_ids,
+        "clo_ids": clo_ids,
+        "assessment_ids": assessment_ids,
+        "scores": scores,
+        "max_scores": np.array([q.max_score for q in questions], dtype=np.float64),
+        "question_assessment": np.array(
+            [assessment_index[q.assessment_id] for q in questions], dtype=np.intp
+        ),
+        "assessment_weights": np.array([a.weight for a in assessments], dtype=np.float64),
+        "incidence": incidence,
+        "thresholds": np.array([clo.threshold for clo in clos], dtype=np.float64),
+    }
+
+def compute_achievement_matrix(
+    matrices: Dict[str, Any],
+    assessment_weights: Optional[np.ndarray] = None,
+    thresholds: Optional[np.ndarray] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Tính mức đạt CLO cho toàn bộ sinh viên × CLO bằng một phép nhân ma trận
+
+    W = incidence * trọng số assessment của từng câu hỏi (câu hỏi × CLO)
+    achievement = (scores @ W) / (max_scores @ W)
+
+    Có thể truyền assessment_weights / thresholds khác để tính thử
+    mà không cần nạp lại dữ liệu.
+    """
+    if assessment_weights is None:
+        assessment_weights = matrices["assessment_weights"]
+    if thresholds is None:
+        thresholds = matrices["thresholds"]
+
+    question_weights = assessment_weights[matrices["question_assessment"]]
+    weighted_incidence = matrices["incidence"] * question_weights[:, None]
+
+    weighted_score = matrices["scores"] @ weighted_incidence
+    weighted_max = matrices["max_scores"] @ weighted_incidence
+
+    achievement = np.divide(
+        weighted_score,
+        weighted_max,
+        out=np.zeros_like(weighted_score),
+        where=weighted_max > 0
+    )
+    achieved = (achievement >= thresholds) & (weighted_max > 0)
+
+    return {
+        "achievement": achievement,
+        "achieved": achieved
+    }
+
+# Câu truy vấn tổng hợp điểm có trọng số theo (sinh viên, CLO) cho cả môn học.
+# Sinh viên thiếu điểm một câu hỏi vẫn được tính điểm tối đa của câu đó (điểm = 0).
+# Mỗi (sinh viên, câu hỏi) chỉ lấy dòng điểm mới nhất (id lớn nhất), như load_course_matrices.
+COURSE_ACHIEVEMENT_SQL = """
+    WITH course_question AS (
+        SELECT DISTINCT q.id AS question_id, q.max_score, a.weight,
+               unnest(q.clo_ids) AS clo_id
+        FROM question q
+        JOIN assessment a ON a.id = q.assessment_id
+        WHERE a.course_id = :course_id
+    ),
+    course_score AS (
+        SELECT DISTINCT ON (s.student_id, s.question_id)
+               s.student_id, s.question_id, s.score
+        FROM studentscore s
+        JOIN question q ON q.id = s.question_id
+        JOIN assessment a ON a.id = q.assessment_id
+        WHERE a.course_id = :course_id
+          AND (CAST(:student_ids AS integer[]) IS NULL OR s.student_id = ANY(:student_ids))
+        ORDER BY s.student_id, s.question_id, s.id DESC
+    ),
+    course_student AS (
+        SELECT DISTINCT student_id FROM course_score
+    )
+    SELECT cs.student_id,
+           cq.clo_id,
+           SUM(COALESCE(s.score, 0) * cq.weight) AS weighted_score,
+           SUM(cq.max_score * cq.weight) AS weighted_max
+    FROM course_student cs
+    CROSS JOIN course_question cq
+    JOIN clo c ON c.id = cq.clo_id AND c.course_id = :course_id
+    LEFT JOIN course_score s
+           ON s.student_id = cs.student_id AND s.question_id = cq.question_id
+    GROUP BY cs.student_id, cq.clo_id
+"""
+
+CALCULATION_ENGINES = ("matrix", "sql")
+
+def _build_course_result(
+    course_id: int,
+    student_ids: List[int],
+    clo_ids: List[int],
+    question_ids: List[int],
+    achievement: np.ndarray,
+    achieved: np.ndarray
+) -> Dict[str, Any]:
+    """Đóng gói kết quả sinh viên × CLO và tính TLĐ CLO của lớp"""
+    if student_ids:
+        tld_values = achieved.mean(axis=0)
+    else:
+        tld_values = np.zeros(len(clo_ids))
+
+    return {
+        "course_id": course_id,
+        "student_ids": student_ids,
+        "clo_ids": clo_ids,
+        "question_ids": question_ids,
+        "achievement": achievement,
+        "achieved": achieved,
+        "class_tld_clo": {
+            clo_id: float(tld) for clo_id, tld in zip(clo_ids, tld_values)
+        }
+    }
+
+def _calculate_course_matrix(
+    session: Session,
+    course_id: int,
+    student_ids: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """Engine NumPy: nạp ma trận điểm và tính bằng phép nhân ma trận"""
+    matrices = load_course_matrices(session, course_id, student_ids)
+    result = compute_achievement_matrix(matrices)
+    return _build_course_result(
+        course_id,
+        matrices["student_ids"],
+        matrices["clo_ids"],
+        matrices["question_ids"],
+        result["achievement"],
+        result["achieved"]
+    )
+
+def _calculate_course_sql(
+    session: Session,
+    course_id: int,
+    student_ids: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """Engine SQL: Postgres tổng hợp điểm có trọng số bằng một câu GROUP BY"""
+    clos = session.exec(
+        select(CLO).where(CLO.course_id == course_id).order_by(CLO.id)
+    ).all()
+    question_ids = list(session.exec(
+        select(Question.id).join(Assessment)
+        .where(Assessment.course_id == course_id)
+        .order_by(Question.id)
+    ).all())
+
+    clo_ids = [clo.id for clo in clos]
+    thresholds = np.array([clo.threshold for clo in clos], dtype=np.float64)
+
+    student_filter = student_ids
+    student_ids = []
+    rows = []
+    if question_ids:
+        statement = select(StudentScore.student_id).where(
+            StudentScore.question_id.in_(question_ids)
+        ).distinct()
+        if student_filter is not None:
+            statement = statement.where(StudentScore.student_id.in_(student_filter))
+        student_ids = sorted(session.exec(statement).all())
+        rows = session.execute(
+            sql_text(COURSE_ACHIEVEMENT_SQL),
+            {"course_id": course_id, "student_ids": student_filter}
+        ).all()
+
+    clo_index = {clo_id: j for j, clo_id in enumerate(clo_ids)}
+    student_index = {s_id: i for i, s_id in enumerate(student_ids)}
+
+    weighted_score = np.zeros((len(student_ids), len(clo_ids)), dtype=np.float64)
+    weighted_max = np.zeros((len(student_ids), len(clo_ids)), dtype=np.float64)
+    for student_id, clo_id, score_sum, max_sum in rows:
+        i, j = student_index[student_id], clo_index[clo_id]
+        weighted_score[i, j] = score_sum or 0.0
+        weighted_max[i, j] = max_sum or 0.0
+
+    achievement = np.divide(
+        weighted_score,
+        weighted_max,
+        out=np.zeros_like(weighted_score),
+        where=weighted_max > 0
+    )
+    achieved = (achievement >= thresholds) & (weighted_max > 0)
+
+    return _build_course_result(
+        course_id, student_ids, clo_ids, question_ids, achievement, achieved
+    )
+
+def calculate_course_clo_achievements(
+    session: Session,
+    course_id: int,
+    engine: Optional[str] = None,
+    student_ids: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """
+    Tính mức đạt CLO cho tất cả sinh viên và tất cả CLO của một môn học
+
+    engine:
+    - "matrix": nạp điểm về Python và tính bằng NumPy
+    - "sql": để Postgres tổng hợp bằng một câu GROUP BY
+    Mặc định lấy theo settings.CALCULATION_ENGINE.
+    Truyền student_ids để chỉ tính cho một nhóm sinh viên.
+
+    Trả về student_ids, clo_ids, ma trận achievement/achieved (sinh viên × CLO)
+    và class_tld_clo (TLĐ CLO của lớp cho từng CLO).
+    """
+    engine = engine or settings.CALCULATION_ENGINE
+    if engine == "matrix":
+        return _calculate_course_matrix(session, course_id, student_ids)
+    if engine == "sql":
+        return _calculate_course_sql(session, course_id, student_ids)
+    raise ValueError(f"Engine tính toán không hợp lệ: {engine}")
+
+# Số dòng tối đa trong một câu INSERT ... ON CONFLICT
+UPSERT_BATCH_SIZE = 1000
+
+def iter_student_clo_rows(
+    course_results: Dict[str, Any],
+    source: str = "calculation_endpoint"
+) -> Iterator[Dict[str, Any]]:
+    """Sinh lần lượt các dòng StudentCLOResult từ ma trận kết quả sinh viên × CLO"""
+    assessed_at = datetime.utcnow()
+    achievement = course_results["achievement"]
+    achieved = course_results["achieved"]
+    for j, clo_id in enumerate(course_results["clo_ids"]):
+        for i, student_id in enumerate(course_results["student_ids"]):
+            yield {
+                "student_id": student_id,
+                "clo_id": clo_id,
+                "achievement": float(achievement[i, j]),
+                "achieved": bool(achieved[i, j]),
+                "assessed_at": assessed_at,
+                "source": source
+            }
+
+def build_student_clo_rows(
+    course_results: Dict[str, Any],
+    source: str = "calculation_endpoint"
+) -> List[Dict[str, Any]]:
+    """Chuyển ma trận kết quả sinh viên × CLO thành các dòng StudentCLOResult"""
+    return list(iter_student_clo_rows(course_results, source))
+
+def upsert_student_clo_results(
+    session: Session,
+    rows: Iterable[Dict[str, Any]]
+) -> Dict[str, int]:
+    """
+    Lưu hàng loạt StudentCLOResult bằng INSERT ... ON CONFLICT DO UPDATE
+
+    Dựa trên unique constraint (student_id, clo_id). Mỗi lô UPSERT_BATCH_SIZE dòng
+    là một câu lệnh. Trả về số dòng được thêm mới và số dòng được cập nhật
+    (xmax = 0 nghĩa là dòng vừa được INSERT).
+    Không commit, để caller quyết định transaction.
+    """
+    inserted = 0
+    updated = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, UPSERT_BATCH_SIZE))
+        if not batch:
+            break
+        statement = pg_insert(StudentCLOResult).values(batch)
+        statement = statement.on_conflict_do_update(
+            index_elements=["student_id", "clo_id"],
+            set_={
+                "achievement": statement.excluded.achievement,
+                "achieved": statement.excluded.achieved,
+                "assessed_at": statement.excluded.assessed_at,
+                "source": statement.excluded.source,
+            }
+        ).returning(literal_column("(xmax = 0)").label("inserted"))
+        for (was_inserted,) in session.execute(statement):
+            if was_inserted:
+                inserted += 1
+            else:
+                updated += 1
+    return {"inserted": inserted, "updated": updated}
+
+def save_clo_class_results(session: Session, course_results: Dict[str, Any]) -> None:
+    """Ghi lại bộ đếm TLĐ CLO của lớp (CLOClassResult) sau khi tính toàn bộ"""
+    assessed_count = len(course_results["student_ids"])
+    achieved_counts = course_results["achieved"].sum(axis=0)
+    computed_at = datetime.utcnow()
+    rows = [
+        {
+            "clo_id": clo_id,
+            "course_id": course_results["course_id"],
+            "assessed_count": assessed_count,
+            "achieved_count": int(achieved_counts[j]),
+            "tld": course_results["class_tld_clo"][clo_id],
+            "computed_at": computed_at
+        }
+        for j, clo_id in enumerate(course_results["clo_ids"])
+    ]
+    if not rows:
+        return
+    statement = pg_insert(CLOClassResult).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=["clo_id"],
+        set_={
+            "course_id": statement.excluded.course_id,
+            "assessed_count": statement.excluded.assessed_count,
+            "achieved_count": statement.excluded.achieved_count,
+            "tld": statement.excluded.tld,
+            "computed_at": statement.excluded.computed_at,
+        }
+    )
+    session.execute(statement)
+
+def clear_course_stale_marks(session: Session, course_id: int, before: datetime) -> None:
+    """Xóa các đánh dấu cần tính lại của môn học đã được xử lý (trước thời điểm before)"""
+    session.execute(
+        delete(StaleStudentCLO).where(
+            StaleStudentCLO.course_id == course_id,
+            StaleStudentCLO.marked_at <= before
+        )
+    )
+    session.execute(
+        delete(StaleCourse).where(
+            StaleCourse.course_id == course_id,
+            StaleCourse.marked_at <= before
+        )
+    )
+
+# Điểm tổng kết môn học theo thang 10
+FINAL_SCORE_SCALE = 10.0
+
+def compute_final_scores(
+    assessment_scores: np.ndarray,
+    assessment_max: np.ndarray,
+    assessment_weights: np.ndarray
+) -> np.ndarray:
+    """
+    Điểm tổng kết có trọng số (thang 10) cho từng sinh viên
+
+    assessment_scores: ma trận tổng điểm sinh viên × assessment
+    assessment_max: tổng điểm tối đa của từng assessment
+    final = Σ w_a * (điểm_a / tối đa_a) / Σ w_a * 10, chỉ xét assessment có câu hỏi.
+    """
+    has_questions = assessment_max > 0
+    ratios = np.divide(
+        assessment_scores,
+        assessment_max,
+        out=np.zeros_like(assessment_scores),
+        where=has_questions
+    )
+    weights = np.where(has_questions, assessment_weights, 0.0)
+    total_weight = weights.sum()
+    if total_weight <= 0:
+        return np.zeros(assessment_scores.shape[0], dtype=np.float64)
+    return ratios @ weights / total_weight * FINAL_SCORE_SCALE
+
+def save_student_course_results(
+    session: Session,
+    course_id: int,
+    student_ids: Optional[List[int]] = None
+) -> int:
+    """
+    Tính và lưu điểm tổng kết môn học (StudentCourseResult)
+
+    Hai truy vấn tổng hợp (điểm tối đa theo assessment, tổng điểm theo sinh viên ×
+    assessment), không phụ thuộc engine tính CLO. Truyền student_ids để chỉ tính lại
+    một nhóm sinh viên; sinh viên trong nhóm không còn điểm nào sẽ bị xóa kết quả.
+    Không commit. Trả về số dòng được lưu.
+    """
+    assessments = session.exec(
+        select(Assessment.id, Assessment.weight)
+        .where(Assessment.course_id == course_id)
+        .order_by(Assessment.id)
+    ).all()
+    assessment_index = {assessment_id: k for k, (assessment_id, _) in enumerate(assessments)}
+
+    assessment_max = np.zeros(len(assessments), dtype=np.float64)
+    for assessment_id, max_total in session.exec(
+        select(Question.assessment_id, func.sum(Question.max_score))
+        .where(Question.assessment_id.in_(list(assessment_index)))
+        .group_by(Question.assessment_id)
+    ).all():
+        assessment_max[assessment_index[assessment_id]] = max_total or 0.0
+
+    statement = select(
+        StudentScore.student_id, Question.assessment_id, func.sum(StudentScore.score)
+    ).join(
+        Question, Question.id == StudentScore.question_id
+    ).where(
+        Question.assessment_id.in_(list(assessment_index))
+    ).group_by(StudentScore.student_id, Question.assessment_id)
+    if student_ids is not None:
+        statement = statement.where(StudentScore.student_id.in_(student_ids))
+    score_rows = session.exec(statement).all()
+
+    scored_student_ids = sorted({student_id for student_id, _, _ in score_rows})
+    student_index = {student_id: i for i, student_id in enumerate(scored_student_ids)}
+    assessment_scores = np.zeros((len(scored_student_ids), len(assessments)), dtype=np.float64)
+    for student_id, assessment_id, score_total in score_rows:
+        assessment_scores[student_index[student_id], assessment_index[assessment_id]] = score_total or 0.0
+
+    final_scores = compute_final_scores(
+        assessment_scores,
+        assessment_max,
+        np.array([weight for _, weight in assessments], dtype=np.float64)
+    )
+
+    # Xóa kết quả cũ của phạm vi được tính lại (sinh viên không còn điểm sẽ không được chèn lại)
+    statement = delete(StudentCourseResult).where(StudentCourseResult.course_id == course_id)
+    if student_ids is not None:
+        statement = statement.where(StudentCourseResult.student_id.in_(student_ids))
+    session.execute(statement)
+
+    computed_at = datetime.utcnow()
+    rows = [
+        {
+            "student_id": student_id,
+            "course_id": course_id,
+            "final_score": round(float(final_scores[i]), 4),
+            "passed": bool(final_scores[i] >= settings.COURSE_PASS_SCORE),
+            "computed_at": computed_at
+        }
+        for i, student_id in enumerate(scored_student_ids)
+    ]
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        session.execute(pg_insert(StudentCourseResult).values(rows[start:start + UPSERT_BATCH_SIZE]))
+    return len(rows)
+
+def run_course_calculation(
+    session: Session,
+    course_id: int,
+    engine: Optional[str] = None,
+    source: str = "calculation_endpoint"
+) -> Dict[str, Any]:
+    """
+    Tính lại toàn bộ sinh viên × CLO của môn học và lưu kết quả
+
+    Lưu StudentCLOResult (bulk upsert), bộ đếm CLOClassResult
+    và xóa các đánh dấu cần tính lại. Không commit.
+    """
+    started_at = datetime.utcnow()
+    course_results = calculate_course_clo_achievements(session, course_id, engine)
+    rows = build_student_clo_rows(course_results, source=source)
+    upsert_counts = upsert_student_clo_results(session, rows)
+    save_clo_class_results(session, course_results)
+    save_student_course_results(session, course_id)
+    clear_course_stale_marks(session, course_id, started_at)
+
+    return {
+        "mode": "full",
+        "course_id": course_id,
+        "question_ids": course_results["question_ids"],
+        "clo_ids": course_results["clo_ids"],
+        "student_count": len(course_results["student_ids"]),
+        "rows": rows,
+        "class_tld_clo": course_results["class_tld_clo"],
+        "inserted": upsert_counts["inserted"],
+        "updated": upsert_counts["updated"]
+    }
+
+def iter_course_calculation(
+    bind: Any,
+    course_id: int,
+    engine: Optional[str] = None,
+    source: str = "calculation_endpoint"
+) -> Iterator[Dict[str, Any]]:
+    """
+    Tính toàn bộ môn học và sinh kết quả từng (sinh viên, CLO) theo dạng luồng
+
+    Kết quả được lưu theo từng lô UPSERT_BATCH_SIZE và sinh ra ngay sau khi lưu,
+    không giữ toàn bộ danh sách trong bộ nhớ. Phần tử cuối cùng là bản tóm tắt
+    (type = "summary") gồm class_tld_clo, được sinh sau khi commit.
+    Dùng DB session riêng trên bind vì generator chạy sau khi request trả về.
+    """
+    with Session(bind) as session:
+        started_at = datetime.utcnow()
+        course_results = calculate_course_clo_achievements(session, course_id, engine)
+        counts = {"inserted": 0, "updated": 0}
+
+        rows = iter_student_clo_rows(course_results, source=source)
+        while True:
+            batch = list(islice(rows, UPSERT_BATCH_SIZE))
+            if not batch:
+                break
+            batch_counts = upsert_student_clo_results(session, batch)
+            counts["inserted"] += batch_counts["inserted"]
+            counts["updated"] += batch_counts["updated"]
+            for row in batch:
+                yield {
+                    "type": "result",
+                    "student_id": row["student_id"],
+                    "clo_id": row["clo_id"],
+                    "achievement": row["achievement"],
+                    "achieved": row["achieved"]
+                }
+
+        save_clo_class_results(session, course_results)
+        save_student_course_results(session, course_id)
+        clear_course_stale_marks(session, course_id, started_at)
+        session.commit()
+
+        yield {
+            "type": "summary",
+            "course_id": course_id,
+            "student_count": len(course_results["student_ids"]),
+            "class_tld_clo": {
+                str(clo_id): tld for clo_id, tld in course_results["class_tld_clo"].items()
+            },
+            "inserted_count": counts["inserted"],
+            "updated_count": counts["updated"]
+        }
+
+def run_incremental_course_calculation(
+    session: Session,
+    course_id: int,
+    engine: Optional[str] = None,
+    source: str = "incremental_recalculation"
+) -> Dict[str, Any]:
+    """
+    Chỉ tính lại các cặp (sinh viên, CLO) đã bị đánh dấu do điểm thay đổi
+
+    - Môn học bị đánh dấu tính lại toàn bộ (hoặc chưa có bộ đếm TLĐ) → tính toàn bộ
+    - Sinh viên mới có điểm trong môn → tính tất cả CLO của sinh viên đó
+    - Sinh viên không còn điểm nào trong môn → xóa kết quả của sinh viên đó
+    Bộ đếm CLOClassResult được cộng/trừ theo chênh lệch, không đếm lại cả lớp.
+    Không commit.
+    """
+    started_at = datetime.utcnow()
+
+    clo_ids = list(session.exec(select(CLO.id).where(CLO.course_id == course_id)).all())
+    class_results = {
+        row.clo_id: row
+        for row in session.exec(
+            select(CLOClassResult).where(CLOClassResult.course_id == course_id)
+        ).all()
+    }
+
+    if session.get(StaleCourse, course_id) or set(class_results) != set(clo_ids):
+        return run_course_calculation(session, course_id, engine, source)
+
+    stale_pairs = session.exec(
+        select(StaleStudentCLO.student_id, StaleStudentCLO.clo_id).where(
+            StaleStudentCLO.course_id == course_id,
+            StaleStudentCLO.marked_at <= started_at
+        )
+    ).all()
+    stale_by_student = {}
+    for student_id, clo_id in stale_pairs:
+        stale_by_student.setdefault(student_id, set()).add(clo_id)
+    dirty_student_ids = sorted(stale_by_student)
+
+    rows = []
+    upsert_counts = {"inserted": 0, "updated": 0}
+    student_count = next(iter(class_results.values())).assessed_count if class_results else 0
+    question_ids = []
+
+    if dirty_student_ids:
+        course_results = calculate_course_clo_achievements(
+            session, course_id, engine, student_ids=dirty_student_ids
+        )
+        question_ids = course_results["question_ids"]
+
+        previous = {
+            (student_id, clo_id): achieved
+            for student_id, clo_id, achieved in session.exec(
+                select(
+                    StudentCLOResult.student_id,
+                    StudentCLOResult.clo_id,
+                    StudentCLOResult.achieved
+                ).where(
+                    StudentCLOResult.student_id.in_(dirty_student_ids),
+                    StudentCLOResult.clo_id.in_(clo_ids)
+                )
+            ).all()
+        }
+        previously_assessed = {student_id for student_id, _ in previous}
+        now_assessed = set(course_results["student_ids"])
+
+        assessed_delta = 0
+        achieved_delta = {clo_id: 0 for clo_id in clo_ids}
+        assessed_at = datetime.utcnow()
+        achievement = course_results["achievement"]
+        achieved = course_results["achieved"]
+
+        for i, student_id in enumerate(course_results["student_ids"]):
+            is_new_student = student_id not in previously_assessed
+            if is_new_student:
+                assessed_delta += 1
+            for j, clo_id in enumerate(course_results["clo_ids"]):
+                if not is_new_student and clo_id not in stale_by_student[student_id]:
+                    continue
+                new_achieved = bool(achieved[i, j])
+                old_achieved = bool(previous.get((student_id, clo_id), False))
+                achieved_delta[clo_id] += int(new_achieved) - int(old_achieved)
+                rows.append({
+                    "student_id": student_id,
+                    "clo_id": clo_id,
+                    "achievement": float(achievement[i, j]),
+                    "achieved": new_achieved,
+                    "assessed_at": assessed_at,
+                    "source": source
+                })
+
+        removed_student_ids = previously_assessed - now_assessed
+        if removed_student_ids:
+            for student_id in removed_student_ids:
+                assessed_delta -= 1
+                for clo_id in clo_ids:
+                    achieved_delta[clo_id] -= int(bool(previous.get((student_id, clo_id), False)))
+            session.execute(
+                delete(StudentCLOResult).where(
+                    StudentCLOResult.student_id.in_(removed_student_ids),
+                    StudentCLOResult.clo_id.in_(clo_ids)
+                )
+            )
+
+        upsert_counts = upsert_student_clo_results(session, rows)
+        save_student_course_results(session, course_id, dirty_student_ids)
+
+        computed_at = datetime.utcnow()
+        for clo_id, class_result in class_results.items():
+            class_result.assessed_count = max(0, class_result.assessed_count + assessed_delta)
+            class_result.achieved_count = max(0, class_result.achieved_count + achieved_delta[clo_id])
+            class_result.tld = (
+                class_result.achieved_count / class_result.assessed_count
+                if class_result.assessed_count > 0 else 0.0
+            )
+            class_result.computed_at = computed_at
+            session.add(class_result)
+            student_count = class_result.assessed_count
+
+    clear_course_stale_marks(session, course_id, started_at)
+
+    return {
+        "mode": "incremental",
+        "course_id": course_id,
+        "question_ids": question_ids,
+        "clo_ids": clo_ids,
+        "student_count": student_count,
+        "rows": rows,
+        "class_tld_clo": {
+            clo_id: class_result.tld for clo_id, class_result in class_results.items()
+        },
+        "inserted": upsert_counts["inserted"],
+        "updated": upsert_counts["updated"]
+    }
 
 def calculate_student_clo_achievement(
     session: Session,
@@ -23,36 +743,29 @@ def calculate_student_clo_achievement(
     if not clo:
         return {"achievement": 0.0, "achieved": False}
     
-    # Lấy tất cả questions map với CLO này
-    statement = select(Question)
-    all_questions = session.exec(statement).all()
-    relevant_questions = [q for q in all_questions if clo_id in (q.clo_ids or [])]
+    # Lấy các câu hỏi map với CLO này (clo_ids @> ARRAY[clo_id], dùng GIN index),
+    # kèm trọng số assessment và điểm của sinh viên trong một truy vấn
+    statement = select(
+        Question.max_score, Assessment.weight, StudentScore.score
+    ).join(
+        Assessment, Assessment.id == Question.assessment_id
+    ).outerjoin(
+        StudentScore,
+        (StudentScore.question_id == Question.id) & (StudentScore.student_id == student_id)
+    ).where(Question.clo_ids.op("@>")(array([clo_id])))
+    rows = session.exec(statement).all()
     
-    if not relevant_questions:
+    if not rows:
         return {"achievement": 0.0, "achieved": False}
     
     # Tính tổng điểm có trọng số
     weighted_score = 0.0
     weighted_max = 0.0
     
-    for question in relevant_questions:
-        # Lấy assessment để có weight
-        assessment = session.get(Assessment, question.assessment_id)
-        if not assessment:
-            continue
-        
-        weight = assessment.weight
-        
-        # Lấy điểm của student cho question này
-        statement = select(StudentScore).where(
-            StudentScore.student_id == student_id,
-            StudentScore.question_id == question.id
-        )
-        score_obj = session.exec(statement).first()
-        
-        if score_obj:
-            weighted_score += score_obj.score * weight
-        weighted_max += question.max_score * weight
+    for max_score, weight, score in rows:
+        if score is not None:
+            weighted_score += score * weight
+        weighted_max += max_score * weight
     
     achievement = weighted_score / weighted_max if weighted_max > 0 else 0.0
     achieved = achievement >= clo.threshold
@@ -62,50 +775,350 @@ def calculate_student_clo_achievement(
         "achieved": achieved
     }
 
+def get_class_tld_clo(
+    session: Session,
+    course_id: int,
+    engine: Optional[str] = None
+) -> Dict[int, float]:
+    """
+    TLĐ CLO của lớp cho tất cả CLO của môn học, có cache theo phiên bản dữ liệu
+
+    Khi cache miss: dùng bộ đếm CLOClassResult nếu còn mới, nếu không thì tính lại.
+    """
+    key = ("class_tld_clo", course_id, get_course_data_version(session, course_id))
+    cached = tld_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    clo_ids = list(session.exec(select(CLO.id).where(CLO.course_id == course_id)).all())
+    persisted = load_persisted_clo_counts(session, {course_id: clo_ids}).get(course_id)
+    if persisted:
+        student_count = persisted["student_count"]
+        class_tld_clo = {
+            clo_id: (achieved_count / student_count if student_count else 0.0)
+            for clo_id, achieved_count in persisted["achieved_counts"].items()
+        }
+    else:
+        class_tld_clo = calculate_course_clo_achievements(session, course_id, engine)["class_tld_clo"]
+
+    tld_cache.set(key, class_tld_clo)
+    return dict(class_tld_clo)
+
 def calculate_class_tld_clo(
     session: Session,
     course_id: int,
     clo_id: int,
-    n_tlkqclo: float = 0.6
+    n_tlkqclo: float = 0.6,
+    engine: Optional[str] = None
 ) -> float:
     """
     Tính TLĐ CLO (Tỷ lệ đạt CLO) cho lớp
     
     TLĐ CLO = số sinh viên đạt CLO / số sinh viên được đánh giá
     """
-    # Lấy tất cả students đã có điểm trong course này
-    # (thông qua questions của course)
-    statement = select(Question).join(Assessment).where(Assessment.course_id == course_id)
-    questions = session.exec(statement).all()
-    question_ids = [q.id for q in questions]
-    
-    if not question_ids:
-        return 0.0
-    
-    # Lấy students có điểm
-    statement = select(StudentScore.student_id).where(
-        StudentScore.question_id.in_(question_ids)
-    ).distinct()
-    student_ids = [row[0] for row in session.exec(statement).all()]
-    
-    if not student_ids:
-        return 0.0
-    
-    # Tính achievement cho từng student
-    achieved_count = 0
-    for student_id in student_ids:
-        result = calculate_student_clo_achievement(session, student_id, clo_id)
-        if result["achieved"]:
-            achieved_count += 1
-    
-    tld = achieved_count / len(student_ids) if student_ids else 0.0
-    return tld
+    return get_class_tld_clo(session, course_id, engine).get(clo_id, 0.0)
+
+# Trọng số theo contribution level: M=1.0, N=0.66, L=0.33
+CONTRIBUTION_WEIGHTS = {
+    'M': 1.0,
+    'N': 0.66,
+    'L': 0.33
+}
+
+def compute_course_clo_counts(
+    session: Session,
+    course_id: int,
+    engine: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Tính số sinh viên được đánh giá và số sinh viên đạt từng CLO của môn học
+
+    Trả về {"student_count": n, "achieved_counts": {clo_id: số SV đạt}}
+    """
+    course_results = calculate_course_clo_achievements(session, course_id, engine)
+    achieved_counts = course_results["achieved"].sum(axis=0)
+    return {
+        "student_count": len(course_results["student_ids"]),
+        "achieved_counts": {
+            clo_id: int(achieved_counts[j])
+            for j, clo_id in enumerate(course_results["clo_ids"])
+        }
+    }
+
+def _compute_course_clo_counts_isolated(
+    bind: Any,
+    course_id: int,
+    engine: Optional[str] = None
+) -> Dict[str, Any]:
+    """Tính bộ đếm CLO của một môn học trong DB session riêng (dùng cho worker song song)"""
+    with Session(bind) as session:
+        return compute_course_clo_counts(session, course_id, engine)
+
+def compute_courses_clo_counts(
+    session: Session,
+    course_ids: List[int],
+    engine: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[float], None]] = None
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Tính bộ đếm CLO cho nhiều môn học, song song theo môn học
+
+    Mỗi môn học độc lập nên được giao cho một worker trong thread pool,
+    mỗi worker dùng DB session riêng. max_workers <= 1 (hoặc chỉ có một môn)
+    thì chạy tuần tự trong session hiện tại.
+    Mặc định lấy theo settings.CALCULATION_PARALLEL_WORKERS.
+    """
+    if max_workers is None:
+        max_workers = settings.CALCULATION_PARALLEL_WORKERS
+
+    results = {}
+    if max_workers <= 1 or len(course_ids) <= 1:
+        for done, course_id in enumerate(course_ids, 1):
+            results[course_id] = compute_course_clo_counts(session, course_id, engine)
+            if progress:
+                progress(done / len(course_ids))
+        return results
+
+    bind = session.get_bind()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(course_ids))) as executor:
+        futures = {
+            executor.submit(_compute_course_clo_counts_isolated, bind, course_id, engine): course_id
+            for course_id in course_ids
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress:
+                progress(done / len(course_ids))
+    return results
+
+def load_persisted_clo_counts(
+    session: Session,
+    course_clo_ids: Dict[int, List[int]]
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Đọc bộ đếm TLĐ CLO đã lưu (CLOClassResult) cho các môn học còn mới
+
+    Môn học được coi là còn mới khi không bị đánh dấu tính lại (StaleCourse,
+    StaleStudentCLO) và có bộ đếm cho tất cả CLO. Các môn khác không có trong kết quả.
+    """
+    course_ids = list(course_clo_ids)
+    if not course_ids:
+        return {}
+
+    stale_course_ids = set(session.exec(
+        select(StaleCourse.course_id).where(StaleCourse.course_id.in_(course_ids))
+    ).all())
+    stale_course_ids.update(session.exec(
+        select(StaleStudentCLO.course_id)
+        .where(StaleStudentCLO.course_id.in_(course_ids))
+        .distinct()
+    ).all())
+
+    class_results = {}
+    for row in session.exec(
+        select(CLOClassResult).where(CLOClassResult.course_id.in_(course_ids))
+    ).all():
+        class_results.setdefault(row.course_id, {})[row.clo_id] = row
+
+    persisted = {}
+    for course_id, clo_ids in course_clo_ids.items():
+        rows = class_results.get(course_id, {})
+        if course_id in stale_course_ids or not clo_ids or set(rows) != set(clo_ids):
+            continue
+        persisted[course_id] = {
+            "student_count": next(iter(rows.values())).assessed_count,
+            "achieved_counts": {clo_id: row.achieved_count for clo_id, row in rows.items()}
+        }
+    return persisted
+
+def load_program_structure(
+    session: Session,
+    program_id: int,
+    plo_ids: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """
+    Nạp cấu trúc chương trình phục vụ tính TLĐ PLO
+
+    Trả về plo_ids, clo_ids, môn học của từng CLO (clo_course_ids), số tín chỉ
+    từng môn (credits_by_course) và ma trận mức đóng góp CLO × PLO (levels,
+    'M'/'N'/'L' hoặc '' nếu không map).
+    """
+    from app.models import PLO
+
+    if plo_ids is None:
+        plo_ids = list(session.exec(
+            select(PLO.id).where(PLO.program_id == program_id).order_by(PLO.id)
+        ).all())
+
+    courses = session.exec(select(Course).where(Course.program_id == program_id)).all()
+    credits_by_course = {course.id: course.credits for course in courses}
+
+    clo_rows = []
+    if credits_by_course:
+        clo_rows = session.exec(
+            select(CLO.id, CLO.course_id)
+            .where(CLO.course_id.in_(list(credits_by_course)))
+            .order_by(CLO.id)
+        ).all()
+    clo_ids = [clo_id for clo_id, _ in clo_rows]
+    clo_index = {clo_id: j for j, clo_id in enumerate(clo_ids)}
+    plo_index = {plo_id: k for k, plo_id in enumerate(plo_ids)}
+
+    levels = np.full((len(clo_ids), len(plo_ids)), "", dtype="<U1")
+    if clo_ids and plo_ids:
+        mappings = session.exec(
+            select(CLOPLOMapping).where(
+                CLOPLOMapping.clo_id.in_(clo_ids),
+                CLOPLOMapping.plo_id.in_(plo_ids)
+            )
+        ).all()
+        for mapping in mappings:
+            levels[clo_index[mapping.clo_id], plo_index[mapping.plo_id]] = \
+                (mapping.contribution_level or "")[:1]
+
+    return {
+        "program_id": program_id,
+        "plo_ids": plo_ids,
+        "clo_ids": clo_ids,
+        "clo_course_ids": [course_id for _, course_id in clo_rows],
+        "credits_by_course": credits_by_course,
+        "levels": levels
+    }
+
+def build_contribution_matrix(
+    structure: Dict[str, Any],
+    contribution_weights: Optional[Dict[str, float]] = None
+) -> np.ndarray:
+    """Ma trận trọng số đóng góp CLO × PLO (0 nếu không map)"""
+    weights = dict(CONTRIBUTION_WEIGHTS)
+    if contribution_weights:
+        weights.update(contribution_weights)
+    levels = structure["levels"]
+    contribution = np.zeros(levels.shape, dtype=np.float64)
+    for level, weight in weights.items():
+        contribution[levels == level] = weight
+    return contribution
+
+def get_mapped_course_clo_ids(
+    structure: Dict[str, Any],
+    contribution: np.ndarray
+) -> Dict[int, List[int]]:
+    """Các môn học có ít nhất một CLO map với PLO, kèm danh sách CLO của môn"""
+    mapped = contribution.any(axis=1)
+    mapped_course_ids = {
+        course_id for course_id, is_mapped in zip(structure["clo_course_ids"], mapped) if is_mapped
+    }
+    course_clo_ids = {course_id: [] for course_id in mapped_course_ids}
+    for clo_id, course_id in zip(structure["clo_ids"], structure["clo_course_ids"]):
+        if course_id in course_clo_ids:
+            course_clo_ids[course_id].append(clo_id)
+    return course_clo_ids
+
+def aggregate_program_tld_plos(
+    structure: Dict[str, Any],
+    contribution: np.ndarray,
+    course_counts: Dict[int, Dict[str, Any]]
+) -> Dict[int, float]:
+    """
+    Gộp bộ đếm CLO của các môn học thành TLĐ PLO
+
+    TLĐ PLO = (Σ T_j * w(CLO, PLO) * số SV đạt CLO) / (Σ T_j * w(CLO, PLO) * tổng số SV)
+    """
+    clo_ids = structure["clo_ids"]
+
+    # Vector (theo CLO) số SV đạt và tổng số SV, đã nhân số tín chỉ T_j
+    weighted_achieved = np.zeros(len(clo_ids), dtype=np.float64)
+    weighted_students = np.zeros(len(clo_ids), dtype=np.float64)
+    for j, (clo_id, course_id) in enumerate(zip(clo_ids, structure["clo_course_ids"])):
+        counts = course_counts.get(course_id)
+        if not counts or not counts["student_count"]:
+            continue
+        T_j = structure["credits_by_course"][course_id]
+        weighted_achieved[j] = T_j * counts["achieved_counts"].get(clo_id, 0)
+        weighted_students[j] = T_j * counts["student_count"]
+
+    total_weighted_achieved = weighted_achieved @ contribution
+    total_weighted_students = weighted_students @ contribution
+    tld_values = np.divide(
+        total_weighted_achieved,
+        total_weighted_students,
+        out=np.zeros_like(total_weighted_achieved),
+        where=total_weighted_students > 0
+    )
+    return {plo_id: float(tld_values[k]) for k, plo_id in enumerate(structure["plo_ids"])}
+
+def calculate_program_tld_plos(
+    session: Session,
+    program_id: int,
+    plo_ids: Optional[List[int]] = None,
+    engine: Optional[str] = None,
+    use_persisted: bool = True,
+    progress: Optional[Callable[[float], None]] = None,
+    max_workers: Optional[int] = None
+) -> Dict[int, float]:
+    """
+    Tính TLĐ PLO cho tất cả PLO của chương trình trong một lượt
+
+    Mỗi môn học chỉ được tính (hoặc đọc từ CLOClassResult nếu còn mới) một lần,
+    sau đó tất cả PLO được suy ra từ ma trận trọng số đóng góp CLO × PLO:
+
+    TLĐ PLO = (Σ T_j * w(CLO, PLO) * số SV đạt CLO) / (Σ T_j * w(CLO, PLO) * tổng số SV)
+
+    Các môn học cần tính lại được chạy song song (max_workers), kết quả của từng
+    môn được gộp vào tử số / mẫu số có trọng số ở bước cuối.
+    progress (tùy chọn) được gọi với tỷ lệ số môn học đã xử lý (0-1).
+    """
+    structure = load_program_structure(session, program_id, plo_ids)
+    if not structure["plo_ids"]:
+        return {}
+
+    contribution = build_contribution_matrix(structure)
+
+    # Chỉ các môn có CLO map với ít nhất một PLO mới cần tính
+    course_clo_ids = get_mapped_course_clo_ids(structure, contribution)
+
+    course_counts = load_persisted_clo_counts(session, course_clo_ids) if use_persisted else {}
+    pending_course_ids = [course_id for course_id in course_clo_ids if course_id not in course_counts]
+    course_counts.update(compute_courses_clo_counts(
+        session, pending_course_ids, engine, max_workers=max_workers, progress=progress
+    ))
+
+    return aggregate_program_tld_plos(structure, contribution, course_counts)
+
+def get_program_tld_plos(
+    session: Session,
+    program_id: int,
+    engine: Optional[str] = None,
+    max_workers: Optional[int] = None
+) -> Dict[int, float]:
+    """
+    TLĐ PLO cho tất cả PLO của chương trình, có cache theo phiên bản dữ liệu
+
+    Token gồm phiên bản dữ liệu của các môn học trong chương trình và danh sách PLO.
+    """
+    from app.models import PLO
+
+    plo_ids = list(session.exec(
+        select(PLO.id).where(PLO.program_id == program_id).order_by(PLO.id)
+    ).all())
+    key = ("tld_plo", program_id, get_program_data_version(session, program_id), tuple(plo_ids))
+    cached = tld_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    tld_plo = calculate_program_tld_plos(
+        session, program_id, plo_ids, engine=engine, max_workers=max_workers
+    )
+    tld_cache.set(key, tld_plo)
+    return dict(tld_plo)
 
 def calculate_program_tld_plo(
     session: Session,
     program_id: int,
     plo_id: int,
-    n_tlplo: float = 0.7
+    n_tlplo: float = 0.7,
+    engine: Optional[str] = None
 ) -> float:
     """
     Tính TLĐ PLO (Tỷ lệ đạt PLO) cho chương trình
@@ -116,85 +1129,124 @@ def calculate_program_tld_plo(
     Trong đó T_j là số tín chỉ của course j
     Chỉ tính các CLOs có mapping với PLO (contribution_level M, N, hoặc L)
     """
-    from app.models import Program, Course, CLO
-    
-    # Lấy courses trong program
-    statement = select(Course).where(Course.program_id == program_id)
-    courses = session.exec(statement).all()
-    
-    if not courses:
-        return 0.0
-    
-    # Lấy tất cả CLO-PLO mappings cho PLO này
-    statement = select(CLOPLOMapping).where(CLOPLOMapping.plo_id == plo_id)
-    mappings = session.exec(statement).all()
-    
-    # Tạo dict mapping clo_id -> contribution_level (chỉ lấy M, N, L)
-    clo_mapping_dict = {}
-    for mapping in mappings:
-        if mapping.contribution_level in ['M', 'N', 'L']:
-            clo_mapping_dict[mapping.clo_id] = mapping.contribution_level
-    
-    if not clo_mapping_dict:
-        # Không có CLO nào map với PLO này
-        return 0.0
-    
-    total_weighted_achieved = 0.0
-    total_weighted_students = 0.0
-    
-    for course in courses:
-        T_j = course.credits
-        
-        # Lấy CLOs của course
-        statement = select(CLO).where(CLO.course_id == course.id)
-        clos = session.exec(statement).all()
-        
-        if not clos:
-            continue
-        
-        # Lọc chỉ lấy CLOs có mapping với PLO
-        mapped_clos = [clo for clo in clos if clo.id in clo_mapping_dict]
-        
-        if not mapped_clos:
-            continue
-        
-        # Lấy students có điểm trong course
-        statement = select(Question).join(Assessment).where(Assessment.course_id == course.id)
-        questions = session.exec(statement).all()
-        question_ids = [q.id for q in questions]
-        
-        if not question_ids:
-            continue
-        
-        statement = select(StudentScore.student_id).where(
-            StudentScore.question_id.in_(question_ids)
-        ).distinct()
-        student_ids = [row[0] for row in session.exec(statement).all()]
-        
-        if not student_ids:
-            continue
-        
-        # Tính số SV đạt CLOs (chỉ tính các CLOs có mapping)
-        for clo in mapped_clos:
-            contribution_level = clo_mapping_dict[clo.id]
-            # Trọng số theo contribution level: M=1.0, N=0.66, L=0.33
-            contribution_weight = {
-                'M': 1.0,
-                'N': 0.66,
-                'L': 0.33
-            }.get(contribution_level, 1.0)
-            
-            achieved_count = 0
-            for student_id in student_ids:
-                result = calculate_student_clo_achievement(session, student_id, clo.id)
-                if result["achieved"]:
-                    achieved_count += 1
-            
-            # Áp dụng trọng số contribution level
-            total_weighted_achieved += T_j * contribution_weight * achieved_count
-            total_weighted_students += T_j * contribution_weight * len(student_ids)
-    
-    tld = total_weighted_achieved / total_weighted_students if total_weighted_students > 0 else 0.0
-    return tld
+    return get_program_tld_plos(session, program_id, engine).get(plo_id, 0.0)
+
+def compute_student_plo_matrix(
+    achieved: np.ndarray,
+    assessed: np.ndarray,
+    weights: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Tính mức đạt PLO cho toàn bộ sinh viên × PLO bằng phép nhân ma trận
 
+    achieved, assessed: ma trận 0/1 sinh viên × CLO (đạt CLO / có kết quả CLO)
+    weights: ma trận CLO × PLO = T_j * w(CLO, PLO)
 
+    achievement = (achieved @ weights) / (assessed @ weights), cùng công thức với
+    TLĐ PLO nhưng tính cho từng sinh viên. assessed_plo = False khi sinh viên chưa
+    có kết quả CLO nào map với PLO.
+    """
+    weighted_achieved = achieved @ weights
+    weighted_assessed = assessed @ weights
+    achievement = np.divide(
+        weighted_achieved,
+        weighted_assessed,
+        out=np.zeros_like(weighted_achieved),
+        where=weighted_assessed > 0
+    )
+    return {
+        "achievement": achievement,
+        "assessed": weighted_assessed > 0
+    }
+
+def compute_program_student_plos(session: Session, program_id: int) -> Dict[str, Any]:
+    """
+    Tính mức đạt PLO của tất cả sinh viên trong chương trình trong một lượt
+
+    Nạp cấu trúc chương trình và StudentCLOResult của các CLO trong chương trình
+    (một truy vấn), sau đó tính bằng compute_student_plo_matrix.
+    """
+    structure = load_program_structure(session, program_id)
+    contribution = build_contribution_matrix(structure)
+    credits = np.array(
+        [structure["credits_by_course"][course_id] for course_id in structure["clo_course_ids"]],
+        dtype=np.float64
+    )
+    weights = contribution * credits[:, None]
+
+    clo_ids = structure["clo_ids"]
+    result_rows = []
+    if clo_ids:
+        result_rows = session.exec(
+            select(StudentCLOResult.student_id, StudentCLOResult.clo_id, StudentCLOResult.achieved)
+            .where(StudentCLOResult.clo_id.in_(clo_ids))
+        ).all()
+
+    student_ids = sorted({student_id for student_id, _, _ in result_rows})
+    student_index = {student_id: i for i, student_id in enumerate(student_ids)}
+    clo_index = {clo_id: j for j, clo_id in enumerate(clo_ids)}
+
+    achieved = np.zeros((len(student_ids), len(clo_ids)), dtype=np.float64)
+    assessed = np.zeros((len(student_ids), len(clo_ids)), dtype=np.float64)
+    for student_id, clo_id, is_achieved in result_rows:
+        i, j = student_index[student_id], clo_index[clo_id]
+        assessed[i, j] = 1.0
+        achieved[i, j] = 1.0 if is_achieved else 0.0
+
+    result = compute_student_plo_matrix(achieved, assessed, weights)
+    return {
+        "program_id": program_id,
+        "student_ids": student_ids,
+        "plo_ids": structure["plo_ids"],
+        "achievement": result["achievement"],
+        "assessed": result["assessed"]
+    }
+
+def run_program_student_plo_calculation(session: Session, program_id: int) -> Dict[str, Any]:
+    """
+    Tính và lưu StudentPLOResult cho toàn bộ chương trình
+
+    Thay thế kết quả cũ của các PLO trong chương trình (xóa rồi chèn theo lô
+    trong cùng transaction). Không commit.
+    """
+    from app.models import Program
+
+    program = session.get(Program, program_id)
+    expected_threshold = program.expected_threshold if program else 0.7
+    results = compute_program_student_plos(session, program_id)
+
+    plo_ids = results["plo_ids"]
+    if plo_ids:
+        session.execute(delete(StudentPLOResult).where(StudentPLOResult.plo_id.in_(plo_ids)))
+
+    computed_at = datetime.utcnow()
+    achievement = results["achievement"]
+    assessed = results["assessed"]
+    rows = (
+        {
+            "student_id": student_id,
+            "plo_id": plo_id,
+            "program_id": program_id,
+            "achievement": float(achievement[i, k]),
+            "achieved": bool(achievement[i, k] >= expected_threshold),
+            "computed_at": computed_at
+        }
+        for i, student_id in enumerate(results["student_ids"])
+        for k, plo_id in enumerate(plo_ids)
+        if assessed[i, k]
+    )
+    row_count = 0
+    while True:
+        batch = list(islice(rows, UPSERT_BATCH_SIZE))
+        if not batch:
+            break
+        session.execute(pg_insert(StudentPLOResult).values(batch))
+        row_count += len(batch)
+
+    return {
+        "program_id": program_id,
+        "student_count": len(results["student_ids"]),
+        "plo_ids": plo_ids,
+        "result_count": row_count,
+        "expected_threshold": expected_threshold
+    }
@@ -0,0 +1,200 @@
+"""
+Service phát hiện CLO gần trùng lặp bằng MinHash / LSH
+
+- Mỗi CLO có chữ ký MinHash (NUM_PERMUTATIONS giá trị) tính từ tập từ khóa
+  của bộ tách từ dùng chung (TextProfile)
+- Chữ ký chia thành LSH_BANDS band, mỗi band LSH_ROWS giá trị; hai CLO trùng bucket
+  ở ít nhất một band là cặp ứng viên. Xác suất thành ứng viên 1 - (1 - J^r)^b,
+  ngưỡng ≈ (1/b)^(1/r) ≈ 0.42 với b = 32, r = 4
+- Ứng viên được kiểm tra lại bằng Jaccard chính xác trên tập từ khóa
+
+Chữ ký và bucket được cập nhật khi CLO được tạo / sửa / xóa, nên báo cáo chỉ là
+một truy vấn tự join trên bảng bucket thay vì so sánh mọi cặp CLO.
+"""
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Optional
+import numpy as np
+from sqlmodel import Session, select
+from sqlalchemy import delete
+from sqlalchemy.orm import aliased
+from app.models import CLO, Course, CLOMinHash, CLOLSHBucket
+from app.services.text_analysis_service import ENTITY_CLO, get_text_profiles
+
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+DEFAULT_DUPLICATE_THRESHOLD = 0.7
+# Ngưỡng thấp nhất LSH còn tìm được phần lớn cặp: xác suất thành ứng viên
+# 1 - (1 - J^4)^32 ≈ 0.87 tại J = 0.5 nhưng chỉ ≈ 0.74 tại J = 0.45, ≈ 0.38 tại J = 0.35
+MIN_DUPLICATE_THRESHOLD = 0.5
+
+# Hàm băm (a * x + b) mod p, tham số cố định để chữ ký ổn định giữa các lần chạy
+HASH_PRIME = np.uint64(4294967291)  # Số nguyên tố lớn nhất < 2^32
+_rng = np.random.default_rng(20250101)
+_PERM_A = _rng.integers(1, int(HASH_PRIME), size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, int(HASH_PRIME), size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def _token_hash(token: str) -> int:
+    """Băm từ khóa thành số 32 bit (ổn định, không phụ thuộc PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def compute_minhash_signature(tokens: Iterable[str]) -> Optional[np.ndarray]:
+    """Chữ ký MinHash của tập từ khóa (None nếu tập rỗng)"""
+    hashes = np.array(sorted({_token_hash(token) for token in tokens}), dtype=np.uint64)
+    if not len(hashes):
+        return None
+    # a, x < 2^32 nên a * x không tràn uint64; lấy mod trước khi cộng b
+    permuted = (np.outer(hashes, _PERM_A) % HASH_PRIME + _PERM_B) % HASH_PRIME
+    return permuted.min(axis=0)
+
+
+def estimate_jaccard(signature1: Iterable[int], signature2: Iterable[int]) -> float:
+    """Ước lượng Jaccard từ hai chữ ký: tỉ lệ vị trí trùng nhau"""
+    return float(np.mean(np.asarray(signature1, dtype=np.uint64) == np.asarray(signature2, dtype=np.uint64)))
+
+
+def compute_band_buckets(signature: np.ndarray) -> List[str]:
+    """Bucket của chữ ký ở từng band (hash hex của LSH_ROWS giá trị)"""
+    return [
+        hashlib.blake2b(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes(), digest_size=8).hexdigest()
+        for band in range(LSH_BANDS)
+    ]
+
+
+def exact_jaccard(tokens1: Iterable[str], tokens2: Iterable[str]) -> float:
+    """Jaccard chính xác giữa hai tập từ khóa"""
+    tokens1, tokens2 = set(tokens1), set(tokens2)
+    union = len(tokens1 | tokens2)
+    return len(tokens1 & tokens2) / union if union else 0.0
+
+
+def delete_clo_minhashes(session: Session, clo_ids: Iterable[int]) -> None:
+    """Xóa chữ ký và bucket của các CLO (không commit)"""
+    clo_ids = list(clo_ids)
+    if not clo_ids:
+        return
+    session.execute(delete(CLOLSHBucket).where(CLOLSHBucket.clo_id.in_(clo_ids)))
+    session.execute(delete(CLOMinHash).where(CLOMinHash.clo_id.in_(clo_ids)))
+
+
+def refresh_clo_minhash(session: Session, clo_id: int, tokens: Iterable[str]) -> None:
+    """
+    Tính lại chữ ký MinHash và bucket LSH của một CLO (gọi sau khi tạo / sửa, trước commit)
+
+    CLO không có từ khóa nào không được đưa vào chỉ mục.
+    """
+    delete_clo_minhashes(session, [clo_id])
+    signature = compute_minhash_signature(tokens)
+    if signature is None:
+        return
+    session.add(CLOMinHash(
+        clo_id=clo_id, signature=[int(value) for value in signature], computed_at=datetime.utcnow()
+    ))
+    for band, bucket in enumerate(compute_band_buckets(signature)):
+        session.add(CLOLSHBucket(band=band, bucket=bucket, clo_id=clo_id))
+
+
+def rebuild_clo_minhashes(session: Session) -> int:
+    """Dựng lại chữ ký và chỉ mục LSH của mọi CLO (migration). Trả về số CLO được đưa vào chỉ mục"""
+    session.execute(delete(CLOLSHBucket))
+    session.execute(delete(CLOMinHash))
+    clos = session.exec(select(CLO).order_by(CLO.id)).all()
+    profiles = get_text_profiles(session, ENTITY_CLO, clos)
+    indexed = 0
+    for clo in clos:
+        tokens = profiles[clo.id]["tokens"]
+        if tokens:
+            refresh_clo_minhash(session, clo.id, tokens)
+            indexed += 1
+    return indexed
+
+
+def find_duplicate_clos(
+    session: Session,
+    program_id: int,
+    threshold: float = DEFAULT_DUPLICATE_THRESHOLD,
+    include_other_programs: bool = True
+) -> Dict[str, Any]:
+    """
+    Báo cáo cặp CLO gần trùng lặp của chương trình
+
+    Cặp ứng viên lấy từ truy vấn tự join trên CLOLSHBucket (cùng band, cùng bucket),
+    trong đó ít nhất một CLO thuộc chương trình; include_other_programs = False
+    chỉ giữ cặp mà cả hai CLO đều thuộc chương trình. Ứng viên được giữ lại nếu
+    Jaccard chính xác trên tập từ khóa >= threshold.
+    """
+    program_clo_ids = select(CLO.id).join(Course, Course.id == CLO.course_id).where(
+        Course.program_id == program_id
+    )
+    left = aliased(CLOLSHBucket)
+    right = aliased(CLOLSHBucket)
+    statement = select(left.clo_id, right.clo_id).join(
+        right, (right.band == left.band) & (right.bucket == left.bucket)
+    ).where(
+        left.clo_id.in_(program_clo_ids),
+        left.clo_id != right.clo_id
+    ).distinct()
+    if not include_other_programs:
+        statement = statement.where(right.clo_id.in_(program_clo_ids))
+
+    # Chuẩn hóa cặp (nhỏ, lớn) để mỗi cặp chỉ xuất hiện một lần
+    candidate_pairs = sorted({
+        (min(first, second), max(first, second))
+        for first, second in session.execute(statement).all()
+    })
+    result = {
+        "program_id": program_id,
+        "threshold": threshold,
+        "candidate_count": len(candidate_pairs),
+        "duplicate_count": 0,
+        "duplicates": []
+    }
+    if not candidate_pairs:
+        return result
+
+    clo_ids = sorted({clo_id for pair in candidate_pairs for clo_id in pair})
+    clo_rows = {
+        clo.id: (clo, code, course_program_id)
+        for clo, code, course_program_id in session.exec(
+            select(CLO, Course.code, Course.program_id)
+            .join(Course, Course.id == CLO.course_id)
+            .where(CLO.id.in_(clo_ids))
+        ).all()
+    }
+    profiles = get_text_profiles(session, ENTITY_CLO, [row[0] for row in clo_rows.values()])
+    signatures = dict(session.exec(
+        select(CLOMinHash.clo_id, CLOMinHash.signature).where(CLOMinHash.clo_id.in_(clo_ids))
+    ).all())
+
+    def describe(clo_id: int) -> Dict[str, Any]:
+        clo, course_code, course_program_id = clo_rows[clo_id]
+        return {
+            "clo_id": clo_id,
+            "code": clo.code,
+            "text": clo.text,
+            "course_id": clo.course_id,
+            "course_code": course_code,
+            "program_id": course_program_id
+        }
+
+    duplicates = []
+    for first, second in candidate_pairs:
+        if first not in clo_rows or second not in clo_rows:
+            continue
+        similarity = exact_jaccard(profiles[first]["tokens"], profiles[second]["tokens"])
+        if similarity < threshold:
+            continue
+        duplicates.append({
+            "similarity": similarity,
+            "estimated_similarity": estimate_jaccard(signatures[first], signatures[second])
+            if first in signatures and second in signatures else similarity,
+            "first": describe(first),
+            "second": describe(second)
+        })
+    duplicates.sort(key=lambda pair: (-pair["similarity"], pair["first"]["clo_id"], pair["second"]["clo_id"]))
+    result["duplicate_count"] = len(duplicates)
+    result["duplicates"] = duplicates
+    return result
@@ -2,31 +2,32 @@
 Service tính toán mapping CLO-PLO dựa trên rule-based algorithm
 Công thức: Score = 0.6*K + 0.3*B + 0.1*H
 """
-import re
-from typing import Dict, Any, List, Set
-from app.models import CLO, PLO, BloomLevel
+from typing import Dict, Any, List, Set, Iterable, Optional, Tuple
+from datetime import datetime
+from itertools import islice
+import numpy as np
+from sqlmodel import Session, select
+from sqlalchemy import literal_column, delete, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import CLO, PLO, Course, CLOPLOMapping, BloomLevel
+from app.services.text_analysis_service import ENTITY_CLO, ENTITY_PLO, token_set, get_text_profiles
+
+# Từ khóa dài hơn độ dài này được coi là từ khóa mạnh (H)
+STRONG_KEYWORD_LENGTH = 4
+
+# Mức đóng góp hợp lệ ('-' = đã xét, không liên quan) và ký hiệu ô chưa có mapping
+CONTRIBUTION_LEVELS = ("M", "N", "L", "-")
+EMPTY_CELL = "."
+
+# Số ô tối đa của một lần ghi ma trận và số dòng mỗi câu lệnh upsert
+MATRIX_MAX_CELLS = 20000
+UPSERT_BATCH_SIZE = 1000
 
 
 def tokenize_text(text: str) -> Set[str]:
-    """Tokenize text thành set các từ khóa (loại bỏ stopwords cơ bản)"""
-    # Chuyển sang lowercase và loại bỏ dấu câu
-    text = text.lower()
-    text = re.sub(r'[^\w\s]', ' ', text)
-    
-    # Tách từ
-    words = text.split()
-    
-    # Loại bỏ stopwords tiếng Việt cơ bản
-    stopwords = {
-        'và', 'của', 'cho', 'với', 'từ', 'trong', 'là', 'được', 'có', 'một', 'các',
-        'theo', 'về', 'này', 'đó', 'nào', 'khi', 'sau', 'trước', 'để', 'bằng',
-        'như', 'hoặc', 'nếu', 'thì', 'mà', 'đã', 'sẽ', 'đang', 'cũng', 'rất'
-    }
-    
-    # Lọc và loại bỏ từ quá ngắn (< 2 ký tự)
-    keywords = {w for w in words if len(w) >= 2 and w not in stopwords}
-    
-    return keywords
+    """Tokenize text thành set các từ khóa (bộ tách từ dùng chung của text_analysis_service)"""
+    return token_set(text)
 
 
 def jaccard_similarity(set1: Set[str], set2: Set[str]) -> float:
@@ -81,8 +82,8 @@ def check_strong_keywords(clo_text: str, plo_description: str) -> float:
         return 0.2
     
     # Hoặc nếu có từ khóa dài (> 4 ký tự) xuất hiện trong cả 2
-    long_keywords = {w for w in plo_keywords if len(w) > 4}
-    clo_long = {w for w in clo_words if len(w) > 4}
+    long_keywords = {w for w in plo_keywords if len(w) > STRONG_KEYWORD_LENGTH}
+    clo_long = {w for w in clo_words if len(w) > STRONG_KEYWORD_LENGTH}
     if long_keywords & clo_long:
         return 0.2
     
@@ -146,4 +147,275 @@ def suggest_clo_plo_mapping(clo: CLO, plo: PLO) -> str:
     return score_to_contribution_level(score)
 
 
+def _bloom_value(bloom_level: Any) -> str:
+    return bloom_level.value if isinstance(bloom_level, BloomLevel) else bloom_level
+
+
+def score_mapping_matrix(
+    clo_tokens: List[Iterable[str]],
+    clo_bloom_levels: List[Any],
+    plo_tokens: List[Iterable[str]]
+) -> np.ndarray:
+    """
+    Ma trận score CLO × PLO trong một lượt vector hóa (cùng kết quả với calculate_mapping_score)
+
+    Tập từ khóa được mã hóa thành ma trận nhị phân CLO × từ và PLO × từ;
+    số từ chung (và số từ khóa mạnh chung) của mọi cặp là một phép nhân ma trận.
+    """
+    clo_tokens = [set(tokens) for tokens in clo_tokens]
+    plo_tokens = [set(tokens) for tokens in plo_tokens]
+    vocabulary: Dict[str, int] = {}
+    for tokens in clo_tokens + plo_tokens:
+        for token in sorted(tokens):
+            vocabulary.setdefault(token, len(vocabulary))
+
+    def incidence(token_sets: List[Set[str]]) -> np.ndarray:
+        matrix = np.zeros((len(token_sets), len(vocabulary)), dtype=np.float64)
+        for i, tokens in enumerate(token_sets):
+            matrix[i, [vocabulary[token] for token in tokens]] = 1.0
+        return matrix
+
+    clo_matrix = incidence(clo_tokens)
+    plo_matrix = incidence(plo_tokens)
+    long_tokens = np.array([len(token) > STRONG_KEYWORD_LENGTH for token in vocabulary], dtype=np.float64)
+
+    # K: Jaccard (0 nếu một trong hai tập rỗng)
+    common = clo_matrix @ plo_matrix.T
+    clo_sizes = clo_matrix.sum(axis=1)[:, None]
+    plo_sizes = plo_matrix.sum(axis=1)[None, :]
+    union = clo_sizes + plo_sizes - common
+    K = np.zeros_like(common)
+    np.divide(common, union, out=K, where=(clo_sizes > 0) & (plo_sizes > 0))
 
+    # B: điểm Bloom theo CLO
+    B = np.array([get_bloom_score(_bloom_value(level)) for level in clo_bloom_levels], dtype=np.float64)
+
+    # H: ≥ 2 từ khóa chung hoặc có từ khóa mạnh chung
+    common_long = (clo_matrix * long_tokens) @ plo_matrix.T
+    H = np.where((common >= 2) | (common_long > 0), 0.2, 0.0)
+
+    return 0.6 * K + 0.3 * B[:, None] + 0.1 * H
+
+
+def scores_to_contribution_levels(scores: np.ndarray) -> np.ndarray:
+    """Phiên bản vector hóa của score_to_contribution_level"""
+    return np.select([scores >= 0.70, scores >= 0.45, scores >= 0.20], ['M', 'N', 'L'], default='-')
+
+
+def _mapping_dict(mapping: CLOPLOMapping) -> Dict[str, Any]:
+    return {
+        "id": mapping.id,
+        "clo_id": mapping.clo_id,
+        "plo_id": mapping.plo_id,
+        "contribution_level": mapping.contribution_level,
+        "created_at": mapping.created_at
+    }
+
+
+def build_mapping_matrix(
+    clo_ids: List[int],
+    plo_ids: List[int],
+    mappings: Iterable[CLOPLOMapping]
+) -> List[List[Optional[str]]]:
+    """Ma trận mức đóng góp theo thứ tự clo_ids × plo_ids (None nếu chưa có mapping)"""
+    clo_index = {clo_id: i for i, clo_id in enumerate(clo_ids)}
+    plo_index = {plo_id: j for j, plo_id in enumerate(plo_ids)}
+    levels: List[List[Optional[str]]] = [[None] * len(plo_ids) for _ in clo_ids]
+    for mapping in mappings:
+        if mapping.clo_id in clo_index and mapping.plo_id in plo_index:
+            levels[clo_index[mapping.clo_id]][plo_index[mapping.plo_id]] = mapping.contribution_level
+    return levels
+
+
+def auto_suggest_course_mappings(session: Session, course: Course) -> Dict[str, Any]:
+    """
+    Gợi ý và tạo mapping cho mọi ô CLO × PLO còn trống của môn học (không commit)
+
+    Score của cả ma trận được tính trong một lượt từ hồ sơ văn bản (TextProfile)
+    của CLO và PLO; mapping đã có được giữ nguyên. Như giao diện ma trận, ô có
+    mức '-' cũng được tạo mapping để đánh dấu đã xét.
+
+    Ô trống được ghi bằng INSERT ... ON CONFLICT DO NOTHING nên mapping do request
+    đồng thời tạo trước không gây lỗi unique; created_count chỉ đếm dòng thực sự thêm.
+    """
+    clos = session.exec(select(CLO).where(CLO.course_id == course.id).order_by(CLO.id)).all()
+    plos = session.exec(
+        select(PLO).where(PLO.program_id == course.program_id).order_by(PLO.id)
+    ).all() if course.program_id is not None else []
+    clo_ids = [clo.id for clo in clos]
+    plo_ids = [plo.id for plo in plos]
+    mappings = list(session.exec(
+        select(CLOPLOMapping).where(CLOPLOMapping.clo_id.in_(clo_ids)).order_by(CLOPLOMapping.id)
+    ).all()) if clo_ids else []
+    # Chỉ xét mapping tới PLO của chương trình (CLO có thể còn mapping tới PLO chương trình khác)
+    program_plo_ids = set(plo_ids)
+    existing_pairs = {
+        (mapping.clo_id, mapping.plo_id) for mapping in mappings if mapping.plo_id in program_plo_ids
+    }
+
+    created_count = 0
+    if clos and plos and len(existing_pairs) < len(clos) * len(plos):
+        clo_profiles = get_text_profiles(session, ENTITY_CLO, clos)
+        plo_profiles = get_text_profiles(session, ENTITY_PLO, plos)
+        levels = scores_to_contribution_levels(score_mapping_matrix(
+            [clo_profiles[clo.id]["tokens"] for clo in clos],
+            [clo.bloom_level for clo in clos],
+            [plo_profiles[plo.id]["tokens"] for plo in plos]
+        ))
+        created_at = datetime.utcnow()
+        created_count = upsert_clo_plo_mappings(session, (
+            {"clo_id": clo_id, "plo_id": plo_id, "contribution_level": str(levels[i, j]), "created_at": created_at}
+            for i, clo_id in enumerate(clo_ids)
+            for j, plo_id in enumerate(plo_ids)
+            if (clo_id, plo_id) not in existing_pairs
+        ), overwrite=False)["inserted"]
+    if created_count:
+        # Đọc lại để ma trận trả về gồm cả mapping do request khác vừa tạo
+        mappings = list(session.exec(
+            select(CLOPLOMapping).where(CLOPLOMapping.clo_id.in_(clo_ids)).order_by(CLOPLOMapping.id)
+        ).all())
+
+    return {
+        "course_id": course.id,
+        "program_id": course.program_id,
+        "clo_ids": clo_ids,
+        "plo_ids": plo_ids,
+        "levels": build_mapping_matrix(clo_ids, plo_ids, mappings),
+        "created_count": created_count,
+        "mappings": [_mapping_dict(mapping) for mapping in mappings]
+    }
+
+
+def load_matrix_scope(
+    session: Session,
+    course_id: Optional[int] = None,
+    program_id: Optional[int] = None
+) -> Tuple[List[CLO], List[PLO]]:
+    """
+    CLO (hàng) và PLO (cột) của ma trận môn học hoặc chương trình
+
+    Ma trận môn học lấy PLO của chương trình chứa môn; ma trận chương trình gồm CLO
+    của mọi môn trong chương trình, sắp theo môn học rồi theo CLO.
+    """
+    if course_id is not None:
+        clo_statement = select(CLO).where(CLO.course_id == course_id).order_by(CLO.id)
+    else:
+        clo_statement = select(CLO).join(Course, Course.id == CLO.course_id).where(
+            Course.program_id == program_id
+        ).order_by(CLO.course_id, CLO.id)
+    clos = list(session.exec(clo_statement).all())
+    plos = list(session.exec(
+        select(PLO).where(PLO.program_id == program_id).order_by(PLO.id)
+    ).all()) if program_id is not None else []
+    return clos, plos
+
+
+def encode_mapping_matrix(session: Session, clos: List[CLO], plos: List[PLO]) -> Dict[str, Any]:
+    """
+    Mã hóa gọn ma trận CLO × PLO: header PLO, danh sách CLO và một chuỗi mã mức mỗi CLO
+
+    rows[i][j] là mức đóng góp của clos[i] vào plos[j] (EMPTY_CELL nếu chưa có mapping).
+    """
+    clo_ids = [clo.id for clo in clos]
+    plo_ids = [plo.id for plo in plos]
+    mappings = session.exec(
+        select(CLOPLOMapping).where(
+            CLOPLOMapping.clo_id.in_(clo_ids),
+            CLOPLOMapping.plo_id.in_(plo_ids)
+        )
+    ).all() if clo_ids and plo_ids else []
+    levels = build_mapping_matrix(clo_ids, plo_ids, mappings)
+    return {
+        "plos": [{"id": plo.id, "code": plo.code, "description": plo.description} for plo in plos],
+        "clos": [
+            {
+                "id": clo.id,
+                "code": clo.code,
+                "verb": clo.verb,
+                "text": clo.text,
+                "bloom_level": _bloom_value(clo.bloom_level),
+                "course_id": clo.course_id
+            }
+            for clo in clos
+        ],
+        "rows": ["".join(level or EMPTY_CELL for level in row) for row in levels]
+    }
+
+
+def find_invalid_matrix_cells(
+    cells: List[Dict[str, Any]],
+    clo_ids: Iterable[int],
+    plo_ids: Iterable[int]
+) -> List[Dict[str, Any]]:
+    """Các ô có CLO / PLO ngoài ma trận hoặc mức đóng góp không hợp lệ"""
+    clo_ids, plo_ids = set(clo_ids), set(plo_ids)
+    return [
+        cell for cell in cells
+        if cell["clo_id"] not in clo_ids or cell["plo_id"] not in plo_ids
+        or (cell["contribution_level"] is not None and cell["contribution_level"] not in CONTRIBUTION_LEVELS)
+    ]
+
+
+def _insert_for(session: Session):
+    """Hàm tạo INSERT ... ON CONFLICT theo dialect của session (SQLite dùng trong test)"""
+    return sqlite_insert if session.get_bind().dialect.name == "sqlite" else pg_insert
+
+
+def upsert_clo_plo_mappings(
+    session: Session,
+    rows: Iterable[Dict[str, Any]],
+    overwrite: bool = True
+) -> Dict[str, int]:
+    """
+    Lưu hàng loạt mapping bằng INSERT ... ON CONFLICT trên (clo_id, plo_id)
+
+    overwrite=True cập nhật mức đóng góp của mapping đã có (DO UPDATE), overwrite=False
+    giữ nguyên mapping đã có (DO NOTHING). Mỗi lô UPSERT_BATCH_SIZE dòng là một câu lệnh.
+    Trả về số mapping được thêm mới và được cập nhật. Không commit.
+    """
+    inserted = 0
+    updated = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, UPSERT_BATCH_SIZE))
+        if not batch:
+            break
+        if not overwrite:
+            # DO NOTHING chỉ trả về các dòng thực sự được thêm
+            statement = _insert_for(session)(CLOPLOMapping).values(batch)
+            statement = statement.on_conflict_do_nothing(
+                index_elements=["clo_id", "plo_id"]
+            ).returning(CLOPLOMapping.id)
+            inserted += len(session.execute(statement).all())
+            continue
+        statement = pg_insert(CLOPLOMapping).values(batch)
+        statement = statement.on_conflict_do_update(
+            index_elements=["clo_id", "plo_id"],
+            set_={"contribution_level": statement.excluded.contribution_level}
+        ).returning(literal_column("(xmax = 0)").label("inserted"))
+        for (was_inserted,) in session.execute(statement):
+            if was_inserted:
+                inserted += 1
+            else:
+                updated += 1
+    return {"inserted": inserted, "updated": updated}
+
+
+def apply_mapping_diff(session: Session, cells: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Áp dụng các ô thay đổi của ma trận (không commit)
+
+    contribution_level = None xóa mapping, ngược lại upsert. Ô lặp lại lấy giá trị sau cùng.
+    Trả về số mapping thêm mới, cập nhật, xóa.
+    """
+    latest = {(cell["clo_id"], cell["plo_id"]): cell["contribution_level"] for cell in cells}
+    created_at = datetime.utcnow()
+    result = upsert_clo_plo_mappings(session, (
+        {"clo_id": clo_id, "plo_id": plo_id, "contribution_level": level, "created_at": created_at}
+        for (clo_id, plo_id), level in latest.items() if level is not None
+    ))
+    removed = [pair for pair, level in latest.items() if level is None]
+    deleted = session.execute(
+        delete(CLOPLOMapping).where(tuple_(CLOPLOMapping.clo_id, CLOPLOMapping.plo_id).in_(removed))
+    ).rowcount if removed else 0
+    return {"inserted": result["inserted"], "updated": result["updated"], "deleted": deleted}
@@ -0,0 +1,267 @@
+"""
+Service tính trước khả năng đăng ký môn học theo cohort
+
+Mỗi cohort giữ trong bộ nhớ một ma trận bool môn học × sinh viên
+(eligible[c, s] = sinh viên s đáp ứng mọi điều kiện chặn của môn c),
+chỉ gồm các môn có điều kiện tiên quyết; môn không có điều kiện thì mọi sinh viên đều đủ.
+Các truy vấn bảng điều khiển đăng ký trở thành phép toán vector:
+- số sinh viên đủ điều kiện của một môn: eligible[c].sum()
+- sinh viên bị chặn bởi ≥ N môn: (~eligible).sum(axis=0) >= N
+
+Làm mới tăng dần: chỉ tính lại cột của các sinh viên có StudentCLOResult /
+StudentCourseResult / StudentPLOResult mới hơn lần dựng trước. Dựng lại toàn bộ khi
+điều kiện tiên quyết, CLO, mapping CLO-PLO hoặc danh sách sinh viên của cohort thay đổi, hoặc khi
+số dòng kết quả giảm (có kết quả bị xóa).
+
+Điều kiện song hành (coreq) được xét như khi đăng ký riêng từng môn: phải đáp ứng.
+"""
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+from sqlmodel import Session, select
+from sqlalchemy import func, union
+from app.config import settings
+from app.models import (
+    CLO, CLOPLOMapping, CoursePrerequisite, PrerequisiteType, Student,
+    StudentCLOResult, StudentCourseResult, StudentPLOResult
+)
+from app.services.prerequisite_service import (
+    IMPACT_BATCH_SIZE, load_prerequisite_facts, evaluate_eligibility_matrix, compute_prerequisite_impact_summary
+)
+from app.services.prerequisite_graph_service import get_prerequisite_graph_token
+from app.services.result_cache import LRUCache
+
+# Quét lại kết quả ghi trong khoảng này trước mốc đã xử lý, phòng transaction
+# commit muộn với thời điểm tính sớm hơn mốc
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+# (bảng, cột thời điểm tính) của các kết quả dùng khi kiểm tra điều kiện tiên quyết
+RESULT_TIMESTAMPS = (
+    (StudentCLOResult, StudentCLOResult.assessed_at),
+    (StudentCourseResult, StudentCourseResult.computed_at),
+    (StudentPLOResult, StudentPLOResult.computed_at),
+)
+
+eligibility_cache = LRUCache(settings.ELIGIBILITY_CACHE_SIZE)
+_refresh_lock = Lock()
+
+
+def _cohort_filter(statement, cohort_id: Optional[str]):
+    return statement.where(Student.cohort == cohort_id) if cohort_id else statement
+
+
+def get_structure_token(session: Session, cohort_id: Optional[str]) -> Tuple[Any, ...]:
+    """Token thay đổi → dựng lại toàn bộ (điều kiện tiên quyết, CLO, mapping CLO-PLO, sinh viên của cohort)"""
+    clo_token = tuple(session.exec(select(func.count(CLO.id), func.max(CLO.updated_at))).one())
+    # Mapping quyết định PLO mặc định của điều kiện PLO_THRESHOLD: thêm / xóa mapping
+    # đổi count / max id, đổi mức giữa '-' và M/N/L đổi số mapping có đóng góp
+    mapping_token = tuple(session.exec(select(
+        func.count(CLOPLOMapping.id),
+        func.max(CLOPLOMapping.id),
+        func.count(CLOPLOMapping.id).filter(CLOPLOMapping.contribution_level != '-')
+    )).one())
+    student_token = tuple(session.exec(_cohort_filter(
+        select(func.count(Student.id), func.max(Student.id)), cohort_id
+    )).one())
+    return get_prerequisite_graph_token(session) + clo_token + mapping_token + student_token
+
+
+def get_result_watermark(session: Session) -> Tuple[Optional[datetime], Tuple[int, ...]]:
+    """Thời điểm tính mới nhất và số dòng của các bảng kết quả"""
+    watermark = None
+    counts = []
+    for model, column in RESULT_TIMESTAMPS:
+        count, latest = session.exec(select(func.count(), func.max(column)).select_from(model)).one()
+        counts.append(int(count))
+        if latest is not None and (watermark is None or latest > watermark):
+            watermark = latest
+    return watermark, tuple(counts)
+
+
+def evaluate_cohort_columns(
+    session: Session,
+    prereqs: List[CoursePrerequisite],
+    course_ids: List[int],
+    student_ids: List[int]
+) -> np.ndarray:
+    """Ma trận môn học × sinh viên cho một nhóm sinh viên, nạp dữ liệu theo lô"""
+    eligible = np.ones((len(course_ids), len(student_ids)), dtype=bool)
+    if not prereqs:
+        return eligible
+    for start in range(0, len(student_ids), IMPACT_BATCH_SIZE):
+        batch = student_ids[start:start + IMPACT_BATCH_SIZE]
+        facts = load_prerequisite_facts(session, prereqs, batch)
+        result = evaluate_eligibility_matrix(facts, prereqs, batch, course_ids)
+        eligible[:, start:start + len(batch)] = result["eligible"].T
+    return eligible
+
+
+def build_cohort_eligibility(session: Session, cohort_id: Optional[str] = None) -> Dict[str, Any]:
+    """Dựng toàn bộ ma trận đủ điều kiện của cohort (cohort_id = None: tất cả sinh viên)"""
+    structure_token = get_structure_token(session, cohort_id)
+    watermark, counts = get_result_watermark(session)
+
+    # Bản sao tách khỏi session để giữ trong cache giữa các request
+    prereqs = [
+        CoursePrerequisite(**prereq.model_dump())
+        for prereq in session.exec(
+            select(CoursePrerequisite).order_by(CoursePrerequisite.id)
+        ).all()
+        if prereq.type != PrerequisiteType.RECOMMENDED
+    ]
+    course_ids = sorted({prereq.course_id for prereq in prereqs})
+    student_ids = list(session.exec(
+        _cohort_filter(select(Student.id), cohort_id).order_by(Student.id)
+    ).all())
+
+    return {
+        "cohort_id": cohort_id,
+        "structure_token": structure_token,
+        "watermark": watermark,
+        "result_counts": counts,
+        "prereqs": prereqs,
+        "course_ids": course_ids,
+        "course_index": {course_id: j for j, course_id in enumerate(course_ids)},
+        "student_ids": np.array(student_ids, dtype=np.int64),
+        "student_index": {student_id: i for i, student_id in enumerate(student_ids)},
+        "eligible": evaluate_cohort_columns(session, prereqs, course_ids, student_ids),
+        "built_at": datetime.utcnow(),
+        "refreshed_student_count": len(student_ids)
+    }
+
+
+def find_changed_student_ids(
+    session: Session,
+    cohort_id: Optional[str],
+    since: datetime
+) -> List[int]:
+    """Sinh viên của cohort có kết quả được tính lại từ thời điểm since"""
+    changed = union(*[
+        select(model.student_id).where(column >= since)
+        for model, column in RESULT_TIMESTAMPS
+    ]).subquery()
+    statement = _cohort_filter(
+        select(Student.id).join(changed, changed.c.student_id == Student.id), cohort_id
+    ).order_by(Student.id)
+    return list(session.execute(statement).scalars().all())
+
+
+def refresh_cohort_eligibility(session: Session, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cập nhật tăng dần: chỉ tính lại cột của sinh viên có kết quả mới
+
+    Trả về entry mới nếu phải dựng lại toàn bộ, ngược lại sửa entry tại chỗ.
+    """
+    cohort_id = entry["cohort_id"]
+    if get_structure_token(session, cohort_id) != entry["structure_token"]:
+        return build_cohort_eligibility(session, cohort_id)
+
+    watermark, counts = get_result_watermark(session)
+    if any(new < old for new, old in zip(counts, entry["result_counts"])):
+        return build_cohort_eligibility(session, cohort_id)
+    if watermark is None or (watermark == entry["watermark"] and counts == entry["result_counts"]):
+        entry["refreshed_student_count"] = 0
+        return entry
+
+    since = entry["watermark"] - REFRESH_OVERLAP if entry["watermark"] else datetime.min
+    changed_ids = [
+        student_id for student_id in find_changed_student_ids(session, cohort_id, since)
+        if student_id in entry["student_index"]
+    ]
+    if changed_ids:
+        columns = [entry["student_index"][student_id] for student_id in changed_ids]
+        entry["eligible"][:, columns] = evaluate_cohort_columns(
+            session, entry["prereqs"], entry["course_ids"], changed_ids
+        )
+    entry["watermark"] = watermark
+    entry["result_counts"] = counts
+    entry["refreshed_student_count"] = len(changed_ids)
+    return entry
+
+
+def get_cohort_eligibility(session: Session, cohort_id: Optional[str] = None) -> Dict[str, Any]:
+    """Ma trận đủ điều kiện của cohort (có cache, làm mới tăng dần trước khi trả về)"""
+    with _refresh_lock:
+        entry = eligibility_cache.get(cohort_id)
+        entry = (
+            build_cohort_eligibility(session, cohort_id) if entry is None
+            else refresh_cohort_eligibility(session, entry)
+        )
+        eligibility_cache.set(cohort_id, entry)
+        return entry
+
+
+def count_eligible_students(entry: Dict[str, Any], course_id: int) -> Dict[str, Any]:
+    """Số sinh viên của cohort đủ điều kiện đăng ký môn học"""
+    student_count = len(entry["student_ids"])
+    j = entry["course_index"].get(course_id)
+    eligible_count = student_count if j is None else int(entry["eligible"][j].sum())
+    return {
+        "cohort_id": entry["cohort_id"],
+        "course_id": course_id,
+        "student_count": student_count,
+        "eligible_count": eligible_count,
+        "blocked_count": student_count - eligible_count
+    }
+
+
+def find_blocked_students(entry: Dict[str, Any], min_blocked_courses: int = 1) -> Dict[str, Any]:
+    """Sinh viên bị chặn đăng ký bởi ít nhất min_blocked_courses môn học"""
+    blocked_counts = (~entry["eligible"]).sum(axis=0)
+    mask = blocked_counts >= min_blocked_courses
+    return {
+        "cohort_id": entry["cohort_id"],
+        "min_blocked_courses": min_blocked_courses,
+        "student_count": len(entry["student_ids"]),
+        "blocked_count": int(mask.sum()),
+        "students": [
+            {"student_id": int(student_id), "blocked_course_count": int(count)}
+            for student_id, count in zip(entry["student_ids"][mask], blocked_counts[mask])
+        ]
+    }
+
+
+def summarize_cohort_eligibility(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Số sinh viên đủ điều kiện theo từng môn có điều kiện tiên quyết"""
+    eligible_counts = entry["eligible"].sum(axis=1)
+    return {
+        "cohort_id": entry["cohort_id"],
+        "student_count": len(entry["student_ids"]),
+        "built_at": entry["built_at"],
+        "refreshed_student_count": entry["refreshed_student_count"],
+        "courses": {
+            str(course_id): int(eligible_counts[j])
+            for j, course_id in enumerate(entry["course_ids"])
+        }
+    }
+
+
+def get_course_impact_summary(
+    session: Session,
+    course_id: int,
+    cohort_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Chỉ số tổng hợp phân tích tác động của môn học, đọc từ ma trận đủ điều kiện của cohort
+
+    Phân tích tác động xét mọi điều kiện của môn (coreq cũng phải đáp ứng). Khi môn
+    không có điều kiện khuyến nghị, "không đáp ứng" trùng với ô False của ma trận
+    (có cache, làm mới tăng dần) nên chỉ còn một phép đếm. Môn có điều kiện khuyến
+    nghị không nằm trọn trong ma trận, được đánh giá lại theo lô.
+    """
+    prereq_types = session.exec(
+        select(CoursePrerequisite.type).where(CoursePrerequisite.course_id == course_id)
+    ).all()
+    if not prereq_types:
+        return {"total_students": 0, "missing_count": 0, "risk_score": 0.0}
+    if PrerequisiteType.RECOMMENDED in prereq_types:
+        return compute_prerequisite_impact_summary(session, course_id, cohort_id)
+
+    counts = count_eligible_students(get_cohort_eligibility(session, cohort_id), course_id)
+    total_students = counts["student_count"]
+    return {
+        "total_students": total_students,
+        "missing_count": counts["blocked_count"],
+        "risk_score": counts["blocked_count"] / total_students if total_students > 0 else 0.0
+    }
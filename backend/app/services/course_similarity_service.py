@@ -0,0 +1,239 @@
+"""
+Service tìm môn học tương tự trên toàn bộ danh mục (mọi chương trình)
+
+Ma trận thưa môn học × từ khóa dựng từ hồ sơ văn bản CLO (TextProfile):
+vector của môn học là tổng vector TF-IDF các CLO, chuẩn hóa L2.
+Ma trận được lưu dạng CSC thuần NumPy (không cần SciPy): với mỗi từ khóa,
+danh sách môn học chứa nó và trọng số. Truy vấn top-k là một phép nhân
+ma trận thưa × vector thưa, chỉ chạm tới các cột có trong truy vấn:
+- cosine: A · q với q là vector TF-IDF chuẩn hóa
+- jaccard: |A ∩ q| / (|A| + |q| - |A ∩ q|) trên ma trận nhị phân cùng cấu trúc
+
+Ma trận được cache trong bộ nhớ, dựng lại khi token dữ liệu
+(CourseTextProfile / TextProfile) thay đổi.
+"""
+from threading import Lock
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+import numpy as np
+from sqlmodel import Session, select
+from sqlalchemy import func
+from app.models import Course, CLO, CourseTextProfile, TextProfile, TextTermStat
+from app.services.text_analysis_service import ENTITY_CLO, tokenize, compute_tfidf
+
+SIMILARITY_METRICS = ("cosine", "jaccard")
+DEFAULT_TOP_K = 10
+
+
+def build_similarity_index(
+    courses: List[Dict[str, Any]],
+    course_vectors: Dict[int, Dict[str, float]],
+    term_document_counts: Dict[str, int],
+    document_total: int
+) -> Dict[str, Any]:
+    """
+    Dựng ma trận CSC môn học × từ khóa
+
+    courses: [{"course_id", "code", "title", "program_id"}] (thứ tự = chỉ số hàng)
+    course_vectors: {course_id: {token: trọng số}} (chưa cần chuẩn hóa)
+    """
+    vocabulary: Dict[str, int] = {}
+    rows, cols, values = [], [], []
+    for i, course in enumerate(courses):
+        vector = course_vectors.get(course["course_id"], {})
+        norm = np.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        for token, weight in vector.items():
+            rows.append(i)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+            values.append(weight / norm)
+
+    rows = np.array(rows, dtype=np.int32)
+    cols = np.array(cols, dtype=np.int32)
+    values = np.array(values, dtype=np.float32)
+    order = np.lexsort((rows, cols))
+    indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cols, minlength=len(vocabulary)), out=indptr[1:])
+
+    return {
+        "courses": courses,
+        "course_index": {course["course_id"]: i for i, course in enumerate(courses)},
+        "program_ids": np.array([course["program_id"] or 0 for course in courses], dtype=np.int64),
+        "vocabulary": vocabulary,
+        "indptr": indptr,
+        "indices": rows[order],
+        "data": values[order],
+        "row_vectors": course_vectors,
+        "row_nnz": np.bincount(rows, minlength=len(courses)).astype(np.int64),
+        "term_document_counts": term_document_counts,
+        "document_total": document_total,
+        "nnz": len(values)
+    }
+
+
+def _gather_columns(index: Dict[str, Any], col_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vị trí các phần tử khác 0 của các cột col_ids (nối liền) và số phần tử mỗi cột"""
+    starts = index["indptr"][col_ids]
+    lengths = index["indptr"][col_ids + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64), lengths
+    # Với mỗi phần tử: start của cột + vị trí trong cột
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return offsets + np.arange(total), lengths
+
+
+def score_query(
+    index: Dict[str, Any],
+    query_vector: Dict[str, float],
+    metric: str = "cosine"
+) -> np.ndarray:
+    """Điểm tương tự của mọi môn học với truy vấn (một phép nhân ma trận thưa × vector)"""
+    scores = np.zeros(len(index["courses"]), dtype=np.float64)
+    terms = [(index["vocabulary"][token], weight) for token, weight in query_vector.items()
+             if token in index["vocabulary"]]
+    if not terms:
+        return scores
+    col_ids = np.array([col for col, _ in terms], dtype=np.int64)
+    positions, lengths = _gather_columns(index, col_ids)
+    rows = index["indices"][positions]
+
+    if metric == "jaccard":
+        intersection = np.bincount(rows, minlength=len(scores)).astype(np.float64)
+        union = len(query_vector) + index["row_nnz"] - intersection
+        np.divide(intersection, union, out=scores, where=union > 0)
+        return scores
+
+    weights = np.array([weight for _, weight in terms], dtype=np.float64)
+    norm = np.sqrt(sum(weight * weight for weight in query_vector.values())) or 1.0
+    products = index["data"][positions] * np.repeat(weights / norm, lengths)
+    return np.bincount(rows, weights=products, minlength=len(scores))
+
+
+def top_k_similar(
+    index: Dict[str, Any],
+    query_vector: Dict[str, float],
+    metric: str = "cosine",
+    k: int = DEFAULT_TOP_K,
+    exclude_course_id: Optional[int] = None,
+    program_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Top-k môn học tương tự (điểm > 0), chọn bằng argpartition"""
+    scores = score_query(index, query_vector, metric)
+    candidates = scores > 0
+    if exclude_course_id in index["course_index"]:
+        candidates[index["course_index"][exclude_course_id]] = False
+    if program_id is not None:
+        candidates &= index["program_ids"] == program_id
+    candidate_rows = np.flatnonzero(candidates)
+    if len(candidate_rows) > k:
+        candidate_rows = candidate_rows[np.argpartition(-scores[candidate_rows], k - 1)[:k]]
+    candidate_rows = candidate_rows[np.lexsort((candidate_rows, -scores[candidate_rows]))]
+    return [
+        {**index["courses"][i], "score": float(scores[i])}
+        for i in candidate_rows
+    ]
+
+
+def query_vector_from_texts(index: Dict[str, Any], texts: Iterable[str]) -> Dict[str, float]:
+    """Vector TF-IDF của một tập CLO tùy ý, IDF theo kho văn bản lúc dựng ma trận"""
+    vector: Dict[str, float] = {}
+    for text in texts:
+        for token, weight in compute_tfidf(
+            tokenize(text), index["term_document_counts"], index["document_total"]
+        ).items():
+            vector[token] = vector.get(token, 0.0) + weight
+    return vector
+
+
+def load_similarity_index(session: Session) -> Dict[str, Any]:
+    """Nạp môn học, hồ sơ văn bản CLO và số văn bản theo từ khóa (3 truy vấn) rồi dựng ma trận"""
+    courses = [
+        {"course_id": course_id, "code": code, "title": title, "program_id": program_id}
+        for course_id, code, title, program_id in session.exec(
+            select(Course.id, Course.code, Course.title, Course.program_id)
+            .join(CourseTextProfile, CourseTextProfile.course_id == Course.id)
+            .order_by(Course.id)
+        ).all()
+    ]
+    course_vectors: Dict[int, Dict[str, float]] = {}
+    for course_id, tfidf in session.exec(
+        select(CLO.course_id, TextProfile.tfidf).join(
+            TextProfile, (TextProfile.entity_id == CLO.id) & (TextProfile.entity_type == ENTITY_CLO)
+        )
+    ).all():
+        vector = course_vectors.setdefault(course_id, {})
+        for token, weight in (tfidf or {}).items():
+            vector[token] = vector.get(token, 0.0) + weight
+
+    term_document_counts = dict(session.exec(
+        select(TextTermStat.token, TextTermStat.document_count)
+    ).all())
+    document_total = session.exec(select(func.count()).select_from(TextProfile)).one()
+    return build_similarity_index(courses, course_vectors, term_document_counts, document_total)
+
+
+def get_similarity_index_token(session: Session) -> Tuple[Any, ...]:
+    """Token dữ liệu của ma trận: số bản ghi và thời điểm cập nhật mới nhất của hồ sơ"""
+    course_token = session.exec(
+        select(func.count(), func.max(CourseTextProfile.updated_at)).select_from(CourseTextProfile)
+    ).one()
+    text_token = session.exec(
+        select(func.count(), func.max(TextProfile.computed_at)).select_from(TextProfile)
+    ).one()
+    return tuple(course_token) + tuple(text_token)
+
+
+_index_lock = Lock()
+_index_cache: Dict[str, Any] = {"token": None, "index": None}
+
+
+def get_similarity_index(session: Session) -> Dict[str, Any]:
+    """Ma trận môn học × từ khóa (có cache, dựng lại khi token dữ liệu thay đổi)"""
+    token = get_similarity_index_token(session)
+    with _index_lock:
+        if _index_cache["index"] is not None and _index_cache["token"] == token:
+            return _index_cache["index"]
+
+    index = load_similarity_index(session)
+    with _index_lock:
+        _index_cache["token"] = token
+        _index_cache["index"] = index
+    return index
+
+
+def find_similar_courses(
+    session: Session,
+    course_id: int,
+    metric: str = "cosine",
+    k: int = DEFAULT_TOP_K,
+    program_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Top-k môn học tương tự một môn học (trừ chính nó)"""
+    index = get_similarity_index(session)
+    return {
+        "metric": metric,
+        "course_id": course_id,
+        "similar_courses": top_k_similar(
+            index, index["row_vectors"].get(course_id, {}), metric, k,
+            exclude_course_id=course_id, program_id=program_id
+        )
+    }
+
+
+def find_courses_similar_to_clos(
+    session: Session,
+    texts: List[str],
+    metric: str = "cosine",
+    k: int = DEFAULT_TOP_K,
+    exclude_course_id: Optional[int] = None,
+    program_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Top-k môn học tương tự một tập CLO tùy ý (chưa lưu)"""
+    index = get_similarity_index(session)
+    return {
+        "metric": metric,
+        "course_id": exclude_course_id,
+        "similar_courses": top_k_similar(
+            index, query_vector_from_texts(index, texts), metric, k,
+            exclude_course_id=exclude_course_id, program_id=program_id
+        )
+    }
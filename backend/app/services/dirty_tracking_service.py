@@ -0,0 +1,170 @@
+"""
+Service ghi nhận dữ liệu cần tính lại (dirty tracking)
+
+- Điểm thay đổi → đánh dấu các cặp (sinh viên, CLO) bị ảnh hưởng
+- Question / Assessment / CLO thay đổi → đánh dấu cả môn học cần tính lại
+- Mọi thay đổi trên đều tăng phiên bản dữ liệu của môn học (CourseDataVersion),
+  dùng làm token cho cache kết quả TLĐ
+
+Các hàm chỉ thêm bản ghi vào session, không commit:
+việc đánh dấu nằm chung transaction với thao tác ghi dữ liệu.
+"""
+import hashlib
+from sqlmodel import Session, select
+from typing import Iterable, Tuple, Optional
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models import (
+    Assessment, Question, CLO, Course, StaleStudentCLO, StaleCourse, CourseDataVersion
+)
+
+
+def bump_course_version(session: Session, course_id: Optional[int]) -> None:
+    """Tăng phiên bản dữ liệu của môn học"""
+    if course_id is None:
+        return
+    statement = pg_insert(CourseDataVersion).values(
+        course_id=course_id, version=1, updated_at=datetime.utcnow()
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["course_id"],
+        set_={
+            "version": CourseDataVersion.version + 1,
+            "updated_at": statement.excluded.updated_at
+        }
+    )
+    session.execute(statement)
+
+
+def bump_clo_version(session: Session, clo_id: int) -> None:
+    """Tăng phiên bản dữ liệu của môn học chứa CLO (ví dụ khi mapping CLO-PLO thay đổi)"""
+    clo = session.get(CLO, clo_id)
+    if clo:
+        bump_course_version(session, clo.course_id)
+
+
+def bump_program_versions(session: Session, program_id: int) -> None:
+    """Tăng phiên bản dữ liệu của tất cả môn học trong chương trình"""
+    course_ids = session.exec(select(Course.id).where(Course.program_id == program_id)).all()
+    for course_id in course_ids:
+        bump_course_version(session, course_id)
+
+
+def get_course_data_version(session: Session, course_id: int) -> int:
+    """Đọc phiên bản dữ liệu hiện tại của môn học (0 nếu chưa thay đổi lần nào)"""
+    row = session.get(CourseDataVersion, course_id)
+    return row.version if row else 0
+
+
+def get_program_data_version(session: Session, program_id: int) -> Tuple[int, str]:
+    """
+    Token phiên bản dữ liệu của chương trình: (số môn học, băm các cặp (môn học, phiên bản))
+
+    Token xác định đúng tập môn học hiện có cùng phiên bản của từng môn. Id môn học
+    không bị dùng lại và phiên bản chỉ tăng, nên token không lặp lại trạng thái cũ
+    (khác với tổng phiên bản: xóa một môn rồi tăng phiên bản môn khác có thể cho lại
+    cùng tổng).
+    """
+    statement = select(
+        Course.id, func.coalesce(CourseDataVersion.version, 0)
+    ).select_from(Course).outerjoin(
+        CourseDataVersion, CourseDataVersion.course_id == Course.id
+    ).where(Course.program_id == program_id).order_by(Course.id)
+    rows = session.exec(statement).all()
+    state = ",".join(f"{course_id}:{version}" for course_id, version in rows)
+    return len(rows), hashlib.blake2b(state.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def mark_scores_stale(
+    session: Session,
+    score_keys: Iterable[Tuple[int, int]]
+) -> int:
+    """
+    Đánh dấu các cặp (sinh viên, CLO) cần tính lại từ danh sách (student_id, question_id)
+
+    Câu hỏi chưa map CLO vẫn có thể làm sinh viên trở thành "được đánh giá"
+    trong môn học, nên khi đó đánh dấu tất cả CLO của môn học.
+    Trả về số cặp được đánh dấu.
+    """
+    score_keys = set(score_keys)
+    if not score_keys:
+        return 0
+
+    question_ids = {question_id for _, question_id in score_keys}
+    statement = select(Question.id, Question.clo_ids, Assessment.course_id).join(
+        Assessment, Assessment.id == Question.assessment_id
+    ).where(Question.id.in_(question_ids))
+    question_info = {
+        question_id: (clo_ids or [], course_id)
+        for question_id, clo_ids, course_id in session.exec(statement).all()
+    }
+
+    unmapped_course_ids = {
+        course_id for clo_ids, course_id in question_info.values() if not clo_ids
+    }
+    course_clo_ids = {}
+    if unmapped_course_ids:
+        statement = select(CLO.id, CLO.course_id).where(CLO.course_id.in_(unmapped_course_ids))
+        for clo_id, course_id in session.exec(statement).all():
+            course_clo_ids.setdefault(course_id, []).append(clo_id)
+
+    for course_id in {course_id for _, course_id in question_info.values()}:
+        bump_course_version(session, course_id)
+
+    marked_at = datetime.utcnow()
+    rows = {}
+    for student_id, question_id in score_keys:
+        if question_id not in question_info:
+            continue
+        clo_ids, course_id = question_info[question_id]
+        for clo_id in clo_ids or course_clo_ids.get(course_id, []):
+            rows[(student_id, clo_id)] = {
+                "course_id": course_id,
+                "student_id": student_id,
+                "clo_id": clo_id,
+                "marked_at": marked_at
+            }
+
+    if not rows:
+        return 0
+
+    statement = pg_insert(StaleStudentCLO).values(list(rows.values()))
+    statement = statement.on_conflict_do_update(
+        index_elements=["student_id", "clo_id"],
+        set_={"marked_at": statement.excluded.marked_at}
+    )
+    session.execute(statement)
+    return len(rows)
+
+
+def mark_course_stale(session: Session, course_id: Optional[int]) -> None:
+    """Đánh dấu môn học cần tính lại toàn bộ"""
+    if course_id is None:
+        return
+    bump_course_version(session, course_id)
+    statement = pg_insert(StaleCourse).values(
+        course_id=course_id, marked_at=datetime.utcnow()
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["course_id"],
+        set_={"marked_at": statement.excluded.marked_at}
+    )
+    session.execute(statement)
+
+
+def mark_assessment_stale(session: Session, assessment_id: int) -> None:
+    """Đánh dấu môn học chứa assessment cần tính lại"""
+    assessment = session.get(Assessment, assessment_id)
+    if assessment:
+        mark_course_stale(session, assessment.course_id)
+
+
+def mark_question_stale(session: Session, question: Question) -> None:
+    """Đánh dấu môn học chứa câu hỏi cần tính lại"""
+    mark_assessment_stale(session, question.assessment_id)
+
+
+def mark_clo_stale(session: Session, clo: CLO) -> None:
+    """Đánh dấu môn học chứa CLO cần tính lại"""
+    mark_course_stale(session, clo.course_id)
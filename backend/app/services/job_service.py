@@ -0,0 +1,201 @@
+"""
+Service chạy job tính toán nền (course / program)
+
+- Job được lưu trong bảng CalculationJob (Postgres), không cần message broker
+- Job chạy trong thread pool của tiến trình backend, mỗi job một DB session riêng
+- Mỗi phạm vi (course/program) chỉ có một job đang chờ hoặc đang chạy:
+  gửi lại sẽ nhận về job hiện có (unique index một phần trên kind, scope_id);
+  router trả về 409 nếu job hiện có khác chế độ tính (JOB_CONFLICT_PARAMS)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+import logging
+from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database import engine as db_engine
+from app.models import CalculationJob, JobStatus
+from app.services.calculation_service import (
+    run_course_calculation,
+    run_incremental_course_calculation,
+    calculate_program_tld_plos
+)
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ("course", "program")
+ACTIVE_STATUSES = (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+
+# Tham số làm thay đổi việc job thực hiện: job đang chờ/chạy chỉ dùng lại được
+# cho request có cùng các tham số này
+JOB_CONFLICT_PARAMS = {
+    "course": ("mode",),
+    "program": ("use_persisted",),
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.CALCULATION_JOB_WORKERS,
+    thread_name_prefix="calculation-job"
+)
+
+
+def get_active_job(session: Session, kind: str, scope_id: int) -> Optional[CalculationJob]:
+    """Lấy job đang chờ hoặc đang chạy của một phạm vi"""
+    statement = select(CalculationJob).where(
+        CalculationJob.kind == kind,
+        CalculationJob.scope_id == scope_id,
+        CalculationJob.status.in_(ACTIVE_STATUSES)
+    )
+    return session.exec(statement).first()
+
+
+def has_conflicting_params(job: CalculationJob, params: Optional[Dict[str, Any]]) -> bool:
+    """Job hiện có khác request ở một trong các tham số JOB_CONFLICT_PARAMS"""
+    job_params = job.params or {}
+    params = params or {}
+    return any(
+        job_params.get(key) != params.get(key)
+        for key in JOB_CONFLICT_PARAMS.get(job.kind, ())
+    )
+
+
+def submit_calculation_job(
+    session: Session,
+    kind: str,
+    scope_id: int,
+    params: Optional[Dict[str, Any]] = None,
+    created_by: Optional[int] = None
+) -> Tuple[CalculationJob, bool]:
+    """
+    Tạo job tính toán và đưa vào thread pool
+
+    Trả về (job, created). Nếu phạm vi đã có job đang chờ/chạy thì trả về job đó
+    với created = False; nơi gọi kiểm tra has_conflicting_params trước khi dùng lại.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Loại job không hợp lệ: {kind}")
+
+    existing = get_active_job(session, kind, scope_id)
+    if existing:
+        return existing, False
+
+    job = CalculationJob(
+        kind=kind,
+        scope_id=scope_id,
+        params=params or {},
+        created_by=created_by
+    )
+    session.add(job)
+    try:
+        session.commit()
+    except IntegrityError:
+        # Một request khác vừa tạo job cho cùng phạm vi
+        session.rollback()
+        existing = get_active_job(session, kind, scope_id)
+        if existing:
+            return existing, False
+        raise
+    session.refresh(job)
+
+    _executor.submit(_run_job, job.id)
+    return job, True
+
+
+def _update_job(job_id: int, **values: Any) -> None:
+    """Cập nhật trạng thái job trong một session ngắn"""
+    with Session(db_engine) as session:
+        job = session.get(CalculationJob, job_id)
+        if not job:
+            return
+        for key, value in values.items():
+            setattr(job, key, value)
+        session.add(job)
+        session.commit()
+
+
+def _execute_course_job(session: Session, job: CalculationJob) -> Dict[str, Any]:
+    """Tính toán cho một môn học, trả về kết quả tóm tắt"""
+    params = job.params or {}
+    if params.get("mode") == "incremental":
+        result = run_incremental_course_calculation(session, job.scope_id, params.get("engine"))
+    else:
+        result = run_course_calculation(session, job.scope_id, params.get("engine"))
+    session.commit()
+
+    return {
+        "course_id": job.scope_id,
+        "mode": result["mode"],
+        "student_count": result["student_count"],
+        "result_count": len(result["rows"]),
+        "inserted_count": result["inserted"],
+        "updated_count": result["updated"],
+        "class_tld_clo": {str(clo_id): tld for clo_id, tld in result["class_tld_clo"].items()}
+    }
+
+
+def _execute_program_job(session: Session, job: CalculationJob) -> Dict[str, Any]:
+    """Tính TLĐ PLO cho một chương trình, trả về kết quả"""
+    params = job.params or {}
+
+    def report_progress(ratio: float) -> None:
+        _update_job(job.id, progress=round(ratio, 4))
+
+    tld_plo = calculate_program_tld_plos(
+        session,
+        job.scope_id,
+        engine=params.get("engine"),
+        use_persisted=params.get("use_persisted", True),
+        progress=report_progress,
+        max_workers=params.get("workers")
+    )
+    return {
+        "program_id": job.scope_id,
+        "tld_plo": {str(plo_id): tld for plo_id, tld in tld_plo.items()}
+    }
+
+
+def _run_job(job_id: int) -> None:
+    """Chạy một job trong thread của pool"""
+    _update_job(job_id, status=JobStatus.RUNNING.value, started_at=datetime.utcnow())
+    try:
+        with Session(db_engine) as session:
+            job = session.get(CalculationJob, job_id)
+            if job.kind == "course":
+                result = _execute_course_job(session, job)
+            else:
+                result = _execute_program_job(session, job)
+        _update_job(
+            job_id,
+            status=JobStatus.SUCCEEDED.value,
+            progress=1.0,
+            result=result,
+            finished_at=datetime.utcnow()
+        )
+    except Exception as exc:
+        logger.exception("Job tính toán %s thất bại", job_id)
+        _update_job(
+            job_id,
+            status=JobStatus.FAILED.value,
+            error=str(exc),
+            finished_at=datetime.utcnow()
+        )
+
+
+def recover_interrupted_jobs() -> int:
+    """
+    Đánh dấu thất bại các job đang chờ/chạy còn sót lại khi server khởi động lại
+
+    Gọi một lần lúc startup, để các phạm vi đó có thể gửi job mới.
+    """
+    with Session(db_engine) as session:
+        jobs = session.exec(
+            select(CalculationJob).where(CalculationJob.status.in_(ACTIVE_STATUSES))
+        ).all()
+        for job in jobs:
+            job.status = JobStatus.FAILED.value
+            job.error = "Job bị gián đoạn do server khởi động lại"
+            job.finished_at = datetime.utcnow()
+            session.add(job)
+        session.commit()
+        return len(jobs)
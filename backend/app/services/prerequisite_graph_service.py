@@ -0,0 +1,318 @@
+"""
+Service đồ thị điều kiện tiên quyết
+
+- Nạp toàn bộ CoursePrerequisite một lần thành danh sách kề (môn học → môn tiên quyết)
+- Tính trước thành phần liên thông mạnh (Tarjan), bao đóng bắc cầu, thứ tự topo
+  và cấp độ (level) của từng môn học
+- Đồ thị được cache trong bộ nhớ, làm mới khi điều kiện tiên quyết / môn học thay đổi
+  (gọi invalidate_prerequisite_graph) hoặc khi token dữ liệu trong DB khác đi
+
+Điều kiện song hành (coreq) được giữ riêng, không tạo cạnh thứ tự
+vì hai môn song hành có thể học cùng kỳ.
+"""
+from collections import deque
+from threading import Lock
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+from sqlmodel import Session, select
+from sqlalchemy import func
+from app.models import Course, CoursePrerequisite, PrerequisiteType
+
+
+def find_strongly_connected_components(
+    nodes: Iterable[int],
+    adjacency: Dict[int, List[int]]
+) -> List[List[int]]:
+    """
+    Thuật toán Tarjan (không đệ quy) tìm thành phần liên thông mạnh
+
+    Thành phần được trả về sau tất cả các thành phần mà nó đi tới được,
+    tức là môn tiên quyết đứng trước môn học cần nó.
+    """
+    index: Dict[int, int] = {}
+    lowlink: Dict[int, int] = {}
+    on_stack = set()
+    stack: List[int] = []
+    components: List[List[int]] = []
+    counter = 0
+
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(adjacency.get(root, ())))]
+
+        while work:
+            node, neighbors = work[-1]
+            advanced = False
+            for neighbor in neighbors:
+                if neighbor not in index:
+                    index[neighbor] = lowlink[neighbor] = counter
+                    counter += 1
+                    stack.append(neighbor)
+                    on_stack.add(neighbor)
+                    work.append((neighbor, iter(adjacency.get(neighbor, ()))))
+                    advanced = True
+                    break
+                if neighbor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[neighbor])
+            if advanced:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(sorted(component))
+
+    return components
+
+
+def build_prerequisite_graph(
+    courses: Dict[int, Dict[str, Any]],
+    edges: Iterable[Tuple[int, int, str]]
+) -> Dict[str, Any]:
+    """
+    Dựng đồ thị điều kiện tiên quyết và các cấu trúc tính trước
+
+    courses: {course_id: {"code", "title", "program_id"}}
+    edges: (course_id, prereq_course_id, type)
+
+    Trả về dict gồm requires / dependents (cạnh trực tiếp), coreqs, closure
+    (môn tiên quyết bắc cầu), dependents_closure, cycles, topological_order và levels.
+    """
+    requires: Dict[int, List[int]] = {course_id: [] for course_id in courses}
+    coreqs: Dict[int, List[int]] = {course_id: [] for course_id in courses}
+    edge_count = 0
+    for course_id, prereq_course_id, prereq_type in edges:
+        for node in (course_id, prereq_course_id):
+            requires.setdefault(node, [])
+            coreqs.setdefault(node, [])
+        edge_count += 1
+        if prereq_type == PrerequisiteType.COREQ.value:
+            coreqs[course_id].append(prereq_course_id)
+        else:
+            requires[course_id].append(prereq_course_id)
+    for neighbors in list(requires.values()) + list(coreqs.values()):
+        neighbors[:] = sorted(set(neighbors))
+
+    dependents: Dict[int, List[int]] = {node: [] for node in requires}
+    for course_id, prereq_ids in requires.items():
+        for prereq_course_id in prereq_ids:
+            dependents[prereq_course_id].append(course_id)
+
+    components = find_strongly_connected_components(sorted(requires), requires)
+
+    # Bao đóng và level theo thứ tự thành phần (môn tiên quyết được xử lý trước)
+    closure: Dict[int, frozenset] = {}
+    levels: Dict[int, int] = {}
+    cycles: List[List[int]] = []
+    for component in components:
+        members = set(component)
+        is_cycle = len(component) > 1 or component[0] in requires[component[0]]
+        if is_cycle:
+            cycles.append(component)
+
+        reachable = set(members) if is_cycle else set()
+        level = 0
+        for node in component:
+            for prereq_course_id in requires[node]:
+                if prereq_course_id in members:
+                    continue
+                reachable.add(prereq_course_id)
+                reachable |= closure[prereq_course_id]
+                level = max(level, levels[prereq_course_id] + 1)
+        for node in component:
+            closure[node] = frozenset(reachable - ({node} if len(component) > 1 else set()))
+            levels[node] = level
+
+    dependents_closure: Dict[int, set] = {node: set() for node in requires}
+    for course_id, prereq_ids in closure.items():
+        for prereq_course_id in prereq_ids:
+            dependents_closure[prereq_course_id].add(course_id)
+
+    return {
+        "courses": courses,
+        "requires": requires,
+        "dependents": dependents,
+        "coreqs": coreqs,
+        "closure": closure,
+        "dependents_closure": {node: frozenset(ids) for node, ids in dependents_closure.items()},
+        "cycles": cycles,
+        "topological_order": [node for component in components for node in component],
+        "levels": levels,
+        "edge_count": edge_count
+    }
+
+
+def find_prerequisite_path(
+    graph: Dict[str, Any],
+    start: int,
+    goal: int
+) -> Optional[List[int]]:
+    """Đường đi ngắn nhất start → ... → goal theo cạnh "cần môn tiên quyết" (BFS)"""
+    previous = {start: None}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        if node == goal:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = previous[node]
+            return path[::-1]
+        for prereq_course_id in graph["requires"].get(node, []):
+            if prereq_course_id not in previous:
+                previous[prereq_course_id] = node
+                queue.append(prereq_course_id)
+    return None
+
+
+def creates_prerequisite_cycle(
+    graph: Dict[str, Any],
+    course_id: int,
+    prereq_course_id: int,
+    prereq_type: str
+) -> Optional[List[int]]:
+    """
+    Kiểm tra thêm cạnh course_id → prereq_course_id có tạo chu trình không
+
+    Trả về chu trình (danh sách course_id, bắt đầu và kết thúc tại course_id)
+    hoặc None. Điều kiện song hành chỉ bị từ chối khi trỏ tới chính môn học.
+    """
+    if course_id == prereq_course_id:
+        return [course_id, course_id]
+    if prereq_type == PrerequisiteType.COREQ.value:
+        return None
+    if course_id not in graph["closure"].get(prereq_course_id, frozenset()):
+        return None
+    return [course_id] + find_prerequisite_path(graph, prereq_course_id, course_id)
+
+
+def load_prerequisite_graph(session: Session) -> Dict[str, Any]:
+    """Nạp toàn bộ môn học và điều kiện tiên quyết (2 truy vấn) rồi dựng đồ thị"""
+    courses = {
+        course_id: {"code": code, "title": title, "program_id": program_id}
+        for course_id, code, title, program_id in session.exec(
+            select(Course.id, Course.code, Course.title, Course.program_id)
+        ).all()
+    }
+    edges = [
+        (course_id, prereq_course_id, prereq_type.value if hasattr(prereq_type, "value") else prereq_type)
+        for course_id, prereq_course_id, prereq_type in session.exec(
+            select(
+                CoursePrerequisite.course_id,
+                CoursePrerequisite.prereq_course_id,
+                CoursePrerequisite.type
+            )
+        ).all()
+    ]
+    return build_prerequisite_graph(courses, edges)
+
+
+def get_prerequisite_graph_token(session: Session) -> Tuple[Any, ...]:
+    """Token dữ liệu của đồ thị: số bản ghi và thời điểm cập nhật mới nhất"""
+    prereq_count, prereq_updated_at = session.exec(
+        select(func.count(CoursePrerequisite.id), func.max(CoursePrerequisite.updated_at))
+    ).one()
+    course_count, course_updated_at = session.exec(
+        select(func.count(Course.id), func.max(Course.updated_at))
+    ).one()
+    return (prereq_count, prereq_updated_at, course_count, course_updated_at)
+
+
+_graph_lock = Lock()
+_graph_cache: Dict[str, Any] = {"token": None, "graph": None}
+
+
+def get_prerequisite_graph(session: Session) -> Dict[str, Any]:
+    """Đồ thị điều kiện tiên quyết (có cache, dựng lại khi token dữ liệu thay đổi)"""
+    token = get_prerequisite_graph_token(session)
+    with _graph_lock:
+        if _graph_cache["graph"] is not None and _graph_cache["token"] == token:
+            return _graph_cache["graph"]
+
+    graph = load_prerequisite_graph(session)
+    with _graph_lock:
+        _graph_cache["token"] = token
+        _graph_cache["graph"] = graph
+    return graph
+
+
+def invalidate_prerequisite_graph() -> None:
+    """Xóa đồ thị đã cache (gọi sau khi điều kiện tiên quyết hoặc môn học thay đổi)"""
+    with _graph_lock:
+        _graph_cache["token"] = None
+        _graph_cache["graph"] = None
+
+
+def describe_courses(graph: Dict[str, Any], course_ids: Iterable[int]) -> List[Dict[str, Any]]:
+    """Thông tin môn học (mã, tên, level) theo thứ tự topo"""
+    position = {node: i for i, node in enumerate(graph["topological_order"])}
+    courses = graph["courses"]
+    return [
+        {
+            "course_id": course_id,
+            "code": courses.get(course_id, {}).get("code"),
+            "title": courses.get(course_id, {}).get("title"),
+            "level": graph["levels"].get(course_id, 0)
+        }
+        for course_id in sorted(course_ids, key=lambda node: position.get(node, 0))
+    ]
+
+
+def get_prerequisite_chain(graph: Dict[str, Any], course_id: int) -> Dict[str, Any]:
+    """Môn tiên quyết trực tiếp, bắc cầu và song hành của môn học (đọc từ bộ nhớ)"""
+    return {
+        "course_id": course_id,
+        "level": graph["levels"].get(course_id, 0),
+        "direct": describe_courses(graph, graph["requires"].get(course_id, [])),
+        "transitive": describe_courses(graph, graph["closure"].get(course_id, frozenset())),
+        "coreqs": describe_courses(graph, graph["coreqs"].get(course_id, []))
+    }
+
+
+def get_dependent_courses(graph: Dict[str, Any], course_id: int) -> Dict[str, Any]:
+    """Các môn học cần môn này (trực tiếp và bắc cầu)"""
+    return {
+        "course_id": course_id,
+        "direct": describe_courses(graph, graph["dependents"].get(course_id, [])),
+        "transitive": describe_courses(graph, graph["dependents_closure"].get(course_id, frozenset()))
+    }
+
+
+def get_prerequisite_graph_report(
+    graph: Dict[str, Any],
+    program_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Chu trình và thứ tự topo của đồ thị (lọc theo chương trình nếu có)"""
+    def in_scope(course_id: int) -> bool:
+        return program_id is None or graph["courses"].get(course_id, {}).get("program_id") == program_id
+
+    scoped_course_ids = [course_id for course_id in graph["requires"] if in_scope(course_id)]
+    return {
+        "program_id": program_id,
+        "course_count": len(scoped_course_ids),
+        "edge_count": sum(
+            len(graph["requires"][course_id]) + len(graph["coreqs"][course_id])
+            for course_id in scoped_course_ids
+        ),
+        "cycles": [
+            describe_courses(graph, cycle)
+            for cycle in graph["cycles"]
+            if any(in_scope(course_id) for course_id in cycle)
+        ],
+        "topological_order": [
+            course_id for course_id in graph["topological_order"] if in_scope(course_id)
+        ]
+    }
@@ -4,28 +4,22 @@ TODO: Có thể nâng cấp bằng ML embeddings (SBERT, sentence-transformers)
 để tính toán similarity giữa CLOs chính xác hơn
 """
 from sqlmodel import Session, select
-from typing import List, Dict, Any
-import re
+from typing import List, Dict, Any, Optional, Iterator, Iterable
+from itertools import islice
+from datetime import datetime
+from sqlalchemy import func, delete
+import heapq
+import numpy as np
 from app.models import (
-    Course, CLO, CoursePrerequisite, Student, StudentCLOResult,
-    ConditionType, BloomLevel
+    Course, CLO, CoursePrerequisite, Student, StudentCLOResult, StudentCourseResult,
+    StudentPLOResult, CLOPLOMapping, CourseTextProfile, CourseTokenPosting,
+    ConditionType, PrerequisiteType, BloomLevel
 )
-
-# Vietnamese stopwords (basic list - có thể mở rộng)
-VIETNAMESE_STOPWORDS = {
-    "và", "của", "cho", "với", "trong", "là", "được", "các", "một", "có",
-    "về", "theo", "từ", "này", "đó", "nào", "đã", "sẽ", "đến", "để"
-}
+from app.services.text_analysis_service import ENTITY_CLO, tokenize, token_set, get_text_profiles
 
 def preprocess_text(text: str) -> List[str]:
-    """Tiền xử lý văn bản: lowercase, tokenize, loại bỏ stopwords"""
-    text = text.lower()
-    # Loại bỏ dấu câu
-    text = re.sub(r'[^\w\s]', ' ', text)
-    tokens = text.split()
-    # Loại bỏ stopwords
-    tokens = [t for t in tokens if t not in VIETNAMESE_STOPWORDS and len(t) > 2]
-    return tokens
+    """Tiền xử lý văn bản (bộ tách từ dùng chung của text_analysis_service)"""
+    return tokenize(text)
 
 def jaccard_similarity(set1: set, set2: set) -> float:
     """Tính Jaccard similarity giữa 2 sets"""
@@ -49,22 +43,98 @@ def bloom_level_to_numeric(bloom_level: str) -> int:
     }
     return mapping.get(bloom_level, 3)
 
+# Số môn học gợi ý tối đa
+SUGGESTION_LIMIT = 5
+
+def build_course_text_profile(entries: Iterable[Any]) -> Dict[str, Any]:
+    """Tập từ khóa và Bloom trung bình từ các cặp (tập từ khóa, bloom_level) của CLO"""
+    tokens = set()
+    bloom_levels = []
+    for clo_tokens, bloom_level in entries:
+        tokens.update(clo_tokens)
+        bloom_levels.append(bloom_level_to_numeric(bloom_level))
+    return {
+        "tokens": sorted(tokens),
+        "clo_count": len(bloom_levels),
+        "bloom_avg": sum(bloom_levels) / len(bloom_levels) if bloom_levels else 3
+    }
+
+def remove_course_text_index(session: Session, course_id: int) -> None:
+    """Xóa hồ sơ từ khóa và posting của môn học (không commit)"""
+    session.execute(delete(CourseTokenPosting).where(CourseTokenPosting.course_id == course_id))
+    profile = session.get(CourseTextProfile, course_id)
+    if profile:
+        session.delete(profile)
+
+def refresh_course_text_index(session: Session, course_id: Optional[int]) -> None:
+    """
+    Cập nhật chỉ mục từ khóa của môn học sau khi CLO được tạo / sửa / xóa
+
+    Chỉ thêm / xóa các posting thay đổi. Gọi sau khi thay đổi CLO đã nằm trong session
+    (autoflush đưa thay đổi vào truy vấn), trước commit.
+    """
+    if course_id is None:
+        return
+    clos = session.exec(select(CLO).where(CLO.course_id == course_id)).all()
+    clo_profiles = get_text_profiles(session, ENTITY_CLO, clos)
+    profile_data = build_course_text_profile(
+        (clo_profiles[clo.id]["tokens"], clo.bloom_level) for clo in clos
+    )
+    if not profile_data["clo_count"]:
+        remove_course_text_index(session, course_id)
+        return
+
+    profile = session.get(CourseTextProfile, course_id) or CourseTextProfile(course_id=course_id)
+    profile.tokens = profile_data["tokens"]
+    profile.token_count = len(profile_data["tokens"])
+    profile.clo_count = profile_data["clo_count"]
+    profile.bloom_avg = profile_data["bloom_avg"]
+    profile.updated_at = datetime.utcnow()
+    session.add(profile)
+
+    tokens = set(profile_data["tokens"])
+    current_tokens = set(session.exec(
+        select(CourseTokenPosting.token).where(CourseTokenPosting.course_id == course_id)
+    ).all())
+    removed_tokens = current_tokens - tokens
+    if removed_tokens:
+        session.execute(delete(CourseTokenPosting).where(
+            CourseTokenPosting.course_id == course_id,
+            CourseTokenPosting.token.in_(removed_tokens)
+        ))
+    for token in sorted(tokens - current_tokens):
+        session.add(CourseTokenPosting(token=token, course_id=course_id))
+
+def rebuild_course_text_index(session: Session) -> int:
+    """Dựng lại chỉ mục từ khóa của mọi môn học (migration / seed). Trả về số môn học có CLO"""
+    course_ids = session.exec(select(Course.id).order_by(Course.id)).all()
+    indexed = 0
+    for course_id in course_ids:
+        refresh_course_text_index(session, course_id)
+        indexed += 1 if session.get(CourseTextProfile, course_id) else 0
+    return indexed
+
 def suggest_prerequisites(
     session: Session,
     clos: List[Dict[str, Any]],
-    domain: str = "Tourism"
+    domain: str = "Tourism",
+    exclude_course_id: Optional[int] = None,
+    limit: int = SUGGESTION_LIMIT
 ) -> List[Dict[str, Any]]:
     """
     Gợi ý môn học tiên quyết dựa trên CLOs (rule-based)
     
     Algorithm:
     1. Preprocess CLO texts từ input
-    2. Lấy tất cả courses khác (trừ course hiện tại nếu có)
-    3. Với mỗi candidate course, tính:
+    2. Tra chỉ mục ngược (CourseTokenPosting) lấy các môn có từ khóa chung
+       cùng số từ khóa chung (trừ course hiện tại nếu có)
+    3. Với mỗi candidate course (hồ sơ CourseTextProfile tính sẵn), tính:
        - overlap_score: Jaccard similarity giữa keywords
        - bloom_score: dựa trên avg bloom level gap
     4. confidence = 0.6 * overlap_score + 0.4 * bloom_score
-    5. Trả về top 5 candidates
+    5. Trả về top `limit` candidates (heap)
+    
+    Chi phí tỉ lệ với số posting khớp, không phụ thuộc tổng số môn học / CLO.
     
     TODO: Có thể thay thế bằng ML embeddings:
     - Sử dụng sentence-transformers với model tiếng Việt
@@ -72,135 +142,254 @@ def suggest_prerequisites(
     - Có thể fine-tune trên domain Tourism
     """
     # Preprocess input CLOs
-    input_keywords = set()
-    input_bloom_levels = []
+    input_profile = build_course_text_profile(
+        (token_set(clo.get("text", "")), clo.get("bloom_level", "Apply")) for clo in clos
+    )
+    input_keywords = set(input_profile["tokens"])
+    avg_input_bloom = input_profile["bloom_avg"]
+    if not input_keywords:
+        return []
     
-    for clo in clos:
-        text = clo.get("text", "")
-        bloom = clo.get("bloom_level", "Apply")
-        keywords = preprocess_text(text)
-        input_keywords.update(keywords)
-        input_bloom_levels.append(bloom_level_to_numeric(bloom))
+    # Số từ khóa chung theo từng môn học, đếm trên posting
+    statement = select(
+        CourseTokenPosting.course_id, func.count()
+    ).where(
+        CourseTokenPosting.token.in_(input_keywords)
+    ).group_by(CourseTokenPosting.course_id)
+    if exclude_course_id is not None:
+        statement = statement.where(CourseTokenPosting.course_id != exclude_course_id)
+    overlaps = dict(session.exec(statement).all())
+    if not overlaps:
+        return []
     
-    avg_input_bloom = sum(input_bloom_levels) / len(input_bloom_levels) if input_bloom_levels else 3
+    profiles = session.exec(
+        select(
+            Course.id, Course.code, Course.title,
+            CourseTextProfile.token_count, CourseTextProfile.bloom_avg
+        ).join(
+            CourseTextProfile, CourseTextProfile.course_id == Course.id
+        ).where(Course.id.in_(list(overlaps)))
+    ).all()
     
-    # Lấy tất cả courses
-    courses = session.exec(select(Course)).all()
-    
-    candidates = []
-    
-    for course in courses:
-        # Lấy CLOs của course này
-        statement = select(CLO).where(CLO.course_id == course.id)
-        course_clos = session.exec(statement).all()
-        
-        if not course_clos:
-            continue
-        
-        # Tính overlap với CLOs của course
-        course_keywords = set()
-        course_bloom_levels = []
-        
-        for clo in course_clos:
-            keywords = preprocess_text(clo.text)
-            course_keywords.update(keywords)
-            course_bloom_levels.append(bloom_level_to_numeric(clo.bloom_level))
-        
-        avg_course_bloom = sum(course_bloom_levels) / len(course_bloom_levels) if course_bloom_levels else 3
-        
-        # Tính scores
-        overlap_score = jaccard_similarity(input_keywords, course_keywords)
+    def score(row):
+        course_id, code, title, token_count, avg_course_bloom = row
+        common_count = overlaps[course_id]
+        union_count = len(input_keywords) + token_count - common_count
+        overlap_score = common_count / union_count if union_count > 0 else 0.0
         bloom_gap = abs(avg_input_bloom - avg_course_bloom)
         bloom_score = 1.0 - (bloom_gap / 6.0)  # Normalize về 0-1
         bloom_score = max(0.0, min(1.0, bloom_score))
-        
-        confidence = 0.6 * overlap_score + 0.4 * bloom_score
-        
+        return {
+            "course_id": course_id,
+            "code": code,
+            "title": title,
+            "confidence": 0.6 * overlap_score + 0.4 * bloom_score,
+            "overlap_score": overlap_score,
+            "bloom_diff": avg_input_bloom - avg_course_bloom
+        }
+    
+    top = heapq.nlargest(limit, (score(row) for row in profiles), key=lambda x: x["confidence"])
+    
+    # Từ khóa chung của các môn được chọn
+    common_keywords = {}
+    if top:
+        for token, course_id in session.exec(
+            select(CourseTokenPosting.token, CourseTokenPosting.course_id).where(
+                CourseTokenPosting.token.in_(input_keywords),
+                CourseTokenPosting.course_id.in_([candidate["course_id"] for candidate in top])
+            ).order_by(CourseTokenPosting.token)
+        ).all():
+            common_keywords.setdefault(course_id, []).append(token)
+    
+    suggestions = []
+    for candidate in top:
         # Tạo match_reasons
         match_reasons = []
-        if overlap_score > 0.2:
-            common_keywords = input_keywords & course_keywords
-            if common_keywords:
-                match_reasons.append(f"Từ khóa chung: {', '.join(list(common_keywords)[:3])}")
+        keywords = common_keywords.get(candidate["course_id"])
+        if candidate["overlap_score"] > 0.2 and keywords:
+            match_reasons.append(f"Từ khóa chung: {', '.join(keywords[:3])}")
         
-        bloom_diff = avg_input_bloom - avg_course_bloom
+        bloom_diff = candidate["bloom_diff"]
         if bloom_diff > 0:
             match_reasons.append(f"Bloom level cao hơn {bloom_diff:.1f} bậc")
         elif bloom_diff < 0:
             match_reasons.append(f"Bloom level thấp hơn {abs(bloom_diff):.1f} bậc")
         
-        candidates.append({
-            "course_id": course.id,
-            "code": course.code,
-            "title": course.title,
-            "confidence": confidence,
+        suggestions.append({
+            "course_id": candidate["course_id"],
+            "code": candidate["code"],
+            "title": candidate["title"],
+            "confidence": candidate["confidence"],
             "match_reasons": match_reasons if match_reasons else ["Không có lý do cụ thể"]
         })
-    
-    # Sắp xếp theo confidence và trả về top 5
-    candidates.sort(key=lambda x: x["confidence"], reverse=True)
-    return candidates[:5]
+    return suggestions
 
-def check_student_meets_prereq(
+def load_prerequisite_facts(
     session: Session,
+    prereqs: List[CoursePrerequisite],
+    student_ids: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """
+    Nạp một lần toàn bộ dữ liệu cần để kiểm tra danh sách điều kiện tiên quyết
+
+    Số truy vấn cố định (tên môn, CLO của môn tiên quyết, PLO liên quan,
+    StudentCLOResult, StudentCourseResult, StudentPLOResult), không phụ thuộc
+    số sinh viên. student_ids = None nghĩa là tất cả sinh viên.
+    """
+    prereq_course_ids = sorted({prereq.prereq_course_id for prereq in prereqs})
+
+    course_names = {}
+    course_clo_ids = {course_id: set() for course_id in prereq_course_ids}
+    if prereq_course_ids:
+        course_names = dict(session.exec(
+            select(Course.id, Course.title).where(Course.id.in_(prereq_course_ids))
+        ).all())
+        for clo_id, course_id in session.exec(
+            select(CLO.id, CLO.course_id).where(CLO.course_id.in_(prereq_course_ids))
+        ).all():
+            course_clo_ids[course_id].add(clo_id)
+
+    # CLO / PLO cần xét theo từng điều kiện
+    required_clo_ids = set()
+    prereq_plo_ids = {}
+    courses_needing_plos = set()
+    for prereq in prereqs:
+        payload = prereq.condition_payload or {}
+        if prereq.condition_type == ConditionType.CLO_ACHIEVEMENT:
+            required_clo_ids.update(payload.get("required_clo_ids", []))
+        elif prereq.condition_type == ConditionType.PLO_THRESHOLD:
+            plo_ids = payload.get("plo_ids") or ([payload["plo_id"]] if payload.get("plo_id") else [])
+            if plo_ids:
+                prereq_plo_ids[prereq.id] = list(plo_ids)
+            else:
+                courses_needing_plos.add(prereq.prereq_course_id)
+
+    # PLO mặc định: PLO mà môn tiên quyết thực sự đóng góp (bỏ mapping mức '-')
+    course_plo_ids = {course_id: [] for course_id in courses_needing_plos}
+    if courses_needing_plos:
+        statement = select(CLO.course_id, CLOPLOMapping.plo_id).join(
+            CLO, CLO.id == CLOPLOMapping.clo_id
+        ).where(
+            CLO.course_id.in_(courses_needing_plos),
+            CLOPLOMapping.contribution_level != '-'
+        ).distinct()
+        for course_id, plo_id in session.exec(statement).all():
+            course_plo_ids[course_id].append(plo_id)
+    for prereq in prereqs:
+        if prereq.condition_type == ConditionType.PLO_THRESHOLD and prereq.id not in prereq_plo_ids:
+            prereq_plo_ids[prereq.id] = course_plo_ids.get(prereq.prereq_course_id, [])
+
+    relevant_clo_ids = set(required_clo_ids)
+    for clo_ids in course_clo_ids.values():
+        relevant_clo_ids.update(clo_ids)
+    relevant_plo_ids = {plo_id for plo_ids in prereq_plo_ids.values() for plo_id in plo_ids}
+
+    clo_results = {}
+    if relevant_clo_ids:
+        statement = select(
+            StudentCLOResult.student_id, StudentCLOResult.clo_id, StudentCLOResult.achieved
+        ).where(StudentCLOResult.clo_id.in_(relevant_clo_ids))
+        if student_ids is not None:
+            statement = statement.where(StudentCLOResult.student_id.in_(student_ids))
+        for student_id, clo_id, achieved in session.exec(statement).all():
+            clo_results.setdefault(student_id, {})[clo_id] = achieved
+
+    course_results = {}
+    if prereq_course_ids:
+        statement = select(
+            StudentCourseResult.student_id, StudentCourseResult.course_id,
+            StudentCourseResult.final_score, StudentCourseResult.passed
+        ).where(StudentCourseResult.course_id.in_(prereq_course_ids))
+        if student_ids is not None:
+            statement = statement.where(StudentCourseResult.student_id.in_(student_ids))
+        for student_id, course_id, final_score, passed in session.exec(statement).all():
+            course_results[(student_id, course_id)] = (final_score, passed)
+
+    plo_results = {}
+    if relevant_plo_ids:
+        statement = select(
+            StudentPLOResult.student_id, StudentPLOResult.plo_id, StudentPLOResult.achievement
+        ).where(StudentPLOResult.plo_id.in_(relevant_plo_ids))
+        if student_ids is not None:
+            statement = statement.where(StudentPLOResult.student_id.in_(student_ids))
+        for student_id, plo_id, achievement in session.exec(statement).all():
+            plo_results.setdefault(student_id, {})[plo_id] = achievement
+
+    return {
+        "course_names": course_names,
+        "course_clo_ids": course_clo_ids,
+        "prereq_plo_ids": prereq_plo_ids,
+        "clo_results": clo_results,
+        "course_results": course_results,
+        "plo_results": plo_results
+    }
+
+# Trạng thái của một điều kiện tiên quyết với sinh viên
+STATUS_MET = "Đạt"
+STATUS_FAILED = "Chưa đạt"  # Đã có kết quả (môn học / CLO / PLO) nhưng không đạt
+STATUS_NOT_TAKEN = "Chưa học"  # Chưa có kết quả nào
+STATUS_INVALID = "Không hợp lệ"
+
+def evaluate_student_prereq(
+    facts: Dict[str, Any],
     student_id: int,
     prereq: CoursePrerequisite
 ) -> Dict[str, Any]:
     """
-    Kiểm tra sinh viên có đáp ứng điều kiện tiên quyết không
-    
-    Hỗ trợ các loại điều kiện:
-    - pass_course: đã pass môn học
-    - clo_achievement: đạt một tỷ lệ CLOs nhất định
-    - plo_threshold: đạt threshold của PLO
-    - min_score: điểm tối thiểu
+    Kiểm tra một điều kiện tiên quyết cho một sinh viên trên dữ liệu đã nạp
+
+    Không truy vấn DB; dùng chung cho kiểm tra đơn lẻ và phân tích tác động hàng loạt.
     """
     condition_type = prereq.condition_type
     payload = prereq.condition_payload or {}
+    prereq_course_id = prereq.prereq_course_id
+    student_clo_results = facts["clo_results"].get(student_id, {})
+    course_result = facts["course_results"].get((student_id, prereq_course_id))
     
     if condition_type == ConditionType.PASS_COURSE:
-        # TODO: Cần có bảng StudentCourseResult để track pass/fail
-        # Tạm thời kiểm tra qua StudentCLOResult
-        prereq_course_id = prereq.prereq_course_id
-        statement = select(CLO).where(CLO.course_id == prereq_course_id)
-        prereq_clos = session.exec(statement).all()
-        prereq_clo_ids = [clo.id for clo in prereq_clos]
+        prereq_course_name = facts["course_names"].get(prereq_course_id, f"Môn học ID {prereq_course_id}")
+        
+        # Ưu tiên điểm tổng kết đã tính (StudentCourseResult)
+        if course_result:
+            final_score, passed = course_result
+            return {
+                "meets": passed,
+                "status": STATUS_MET if passed else STATUS_FAILED,
+                "details": (
+                    f"Đã hoàn thành: {prereq_course_name}" if passed
+                    else f"Chưa đạt: {prereq_course_name} (điểm tổng kết {final_score:.2f})"
+                ),
+                "missing_courses": [] if passed else [prereq_course_name]
+            }
         
+        # Chưa có điểm tổng kết: kiểm tra qua StudentCLOResult
+        prereq_clo_ids = facts["course_clo_ids"].get(prereq_course_id, set())
         if not prereq_clo_ids:
             # Môn học tiên quyết chưa có CLO, không thể kiểm tra
             return {
                 "meets": True,  # Tạm thời coi là đáp ứng nếu chưa có CLO
+                "status": STATUS_MET,
                 "details": "Môn học tiên quyết chưa có CLO để kiểm tra"
             }
         
-        # Kiểm tra có CLO nào của prereq course đạt không
-        statement = select(StudentCLOResult).where(
-            StudentCLOResult.student_id == student_id,
-            StudentCLOResult.clo_id.in_(prereq_clo_ids)
-        )
-        results = session.exec(statement).all()
-        
-        # Lấy thông tin môn học tiên quyết
-        prereq_course = session.get(Course, prereq_course_id)
-        prereq_course_name = prereq_course.title if prereq_course else f"Môn học ID {prereq_course_id}"
+        results = [
+            achieved for clo_id, achieved in student_clo_results.items() if clo_id in prereq_clo_ids
+        ]
         
         # Nếu sinh viên chưa có bất kỳ kết quả nào cho môn học tiên quyết, coi là chưa học
         if not results:
             return {
                 "meets": False,
+                "status": STATUS_NOT_TAKEN,
                 "details": f"Chưa học: {prereq_course_name}",
                 "missing_courses": [prereq_course_name]
             }
         
-        achieved_clos = [r for r in results if r.achieved]
-        
         # Nếu có ít nhất 1 CLO đạt, coi là đã pass
-        meets = len(achieved_clos) > 0
-        prereq_course = session.get(Course, prereq_course_id)
-        prereq_course_name = prereq_course.title if prereq_course else f"Môn học ID {prereq_course_id}"
-        
+        meets = any(results)
         return {
             "meets": meets,
+            "status": STATUS_MET if meets else STATUS_FAILED,
             "details": f"Đã hoàn thành: {prereq_course_name}" if meets else f"Chưa đạt: {prereq_course_name}",
             "missing_courses": [] if meets else [prereq_course_name]
         }
@@ -209,38 +398,470 @@ def check_student_meets_prereq(
         required_clo_ids = payload.get("required_clo_ids", [])
         required_ratio = payload.get("required_ratio", 0.66)
         
-        statement = select(StudentCLOResult).where(
-            StudentCLOResult.student_id == student_id,
-            StudentCLOResult.clo_id.in_(required_clo_ids)
+        achieved_count = sum(
+            1 for clo_id in set(required_clo_ids) if student_clo_results.get(clo_id)
         )
-        results = session.exec(statement).all()
-        
-        achieved_count = sum(1 for r in results if r.achieved)
         ratio = achieved_count / len(required_clo_ids) if required_clo_ids else 0
         
         meets = ratio >= required_ratio
+        has_results = any(clo_id in student_clo_results for clo_id in required_clo_ids)
         return {
             "meets": meets,
+            "status": STATUS_MET if meets else (STATUS_FAILED if has_results else STATUS_NOT_TAKEN),
             "details": f"Đạt {achieved_count}/{len(required_clo_ids)} CLOs yêu cầu" if meets else f"Chưa đạt đủ CLOs ({achieved_count}/{len(required_clo_ids)})"
         }
     
     elif condition_type == ConditionType.PLO_THRESHOLD:
-        # TODO: Cần tính toán PLO achievement cho student
+        # Đọc mức đạt PLO đã tính sẵn (StudentPLOResult).
+        # PLO cần xét: plo_ids / plo_id trong payload, mặc định là các PLO
+        # mà CLO của môn học tiên quyết map tới.
+        threshold = payload.get("threshold", 0.6)
+        plo_ids = facts["prereq_plo_ids"].get(prereq.id, [])
+        
+        if not plo_ids:
+            return {
+                "meets": True,  # Tạm thời coi là đáp ứng nếu môn học chưa map PLO
+                "status": STATUS_MET,
+                "details": "Môn học tiên quyết chưa map PLO để kiểm tra"
+            }
+        
+        achievements = facts["plo_results"].get(student_id, {})
+        missing_plo_ids = [
+            plo_id for plo_id in plo_ids if achievements.get(plo_id, 0.0) < threshold
+        ]
+        meets = not missing_plo_ids
+        has_results = any(plo_id in achievements for plo_id in plo_ids)
         return {
-            "meets": False,
-            "details": "Chức năng PLO threshold chưa được triển khai"
+            "meets": meets,
+            "status": STATUS_MET if meets else (STATUS_FAILED if has_results else STATUS_NOT_TAKEN),
+            "details": (
+                f"Đạt ngưỡng {threshold} cho {len(plo_ids)} PLO"
+                if meets
+                else f"Chưa đạt ngưỡng {threshold} ({len(plo_ids) - len(missing_plo_ids)}/{len(plo_ids)} PLO)"
+            )
         }
     
     elif condition_type == ConditionType.MIN_SCORE:
         min_score = payload.get("min_score", 5.0)
-        # TODO: Cần có bảng điểm tổng kết môn
+        if not course_result:
+            return {
+                "meets": False,
+                "status": STATUS_NOT_TAKEN,
+                "details": "Chưa có điểm tổng kết môn học tiên quyết"
+            }
+        
+        final_score, _ = course_result
+        meets = final_score >= min_score
         return {
-            "meets": False,
-            "details": f"Chức năng min_score chưa được triển khai"
+            "meets": meets,
+            "status": STATUS_MET if meets else STATUS_FAILED,
+            "details": (
+                f"Điểm tổng kết {final_score:.2f} ≥ {min_score}" if meets
+                else f"Điểm tổng kết {final_score:.2f} < {min_score}"
+            )
         }
     
     return {
         "meets": False,
+        "status": STATUS_INVALID,
         "details": "Loại điều kiện không hợp lệ"
     }
 
+def check_student_meets_prereq(
+    session: Session,
+    student_id: int,
+    prereq: CoursePrerequisite
+) -> Dict[str, Any]:
+    """
+    Kiểm tra sinh viên có đáp ứng điều kiện tiên quyết không
+    
+    Hỗ trợ các loại điều kiện:
+    - pass_course: đã pass môn học
+    - clo_achievement: đạt một tỷ lệ CLOs nhất định
+    - plo_threshold: đạt threshold của PLO
+    - min_score: điểm tối thiểu
+    """
+    facts = load_prerequisite_facts(session, [prereq], [student_id])
+    return evaluate_student_prereq(facts, student_id, prereq)
+
+def find_missing_prerequisites(
+    facts: Dict[str, Any],
+    student_id: int,
+    prereqs: List[CoursePrerequisite]
+) -> List[Dict[str, str]]:
+    """
+    Danh sách môn tiên quyết sinh viên chưa đáp ứng, kèm trạng thái
+
+    Chưa đạt: đã có kết quả nhưng không đạt; Chưa học: chưa có kết quả nào.
+    """
+    missing = []
+    for prereq in prereqs:
+        result = evaluate_student_prereq(facts, student_id, prereq)
+        if result["meets"]:
+            continue
+        course_name = facts["course_names"].get(
+            prereq.prereq_course_id, f"Môn học ID {prereq.prereq_course_id}"
+        )
+        missing.append({"course_name": course_name, "status": result["status"]})
+    return missing
+
+# Số sinh viên được nạp và đánh giá trong mỗi lô khi phân tích tác động
+IMPACT_BATCH_SIZE = 1000
+
+def get_course_prerequisites(session: Session, course_id: int) -> List[CoursePrerequisite]:
+    """Danh sách điều kiện tiên quyết của môn học"""
+    return list(session.exec(
+        select(CoursePrerequisite).where(CoursePrerequisite.course_id == course_id)
+    ).all())
+
+def _iter_student_batches(
+    session: Session,
+    columns: tuple,
+    cohort_id: Optional[str] = None,
+    after_student_id: Optional[int] = None,
+    batch_size: int = IMPACT_BATCH_SIZE
+) -> Iterator[List[Any]]:
+    """Duyệt sinh viên theo thứ tự id, từng lô batch_size (phân trang keyset theo id)"""
+    while True:
+        statement = select(*columns).order_by(Student.id).limit(batch_size)
+        if cohort_id:
+            statement = statement.where(Student.cohort == cohort_id)
+        if after_student_id is not None:
+            statement = statement.where(Student.id > after_student_id)
+        # execute (không phải exec) để luôn nhận về tuple kể cả khi chỉ chọn một cột
+        rows = session.execute(statement).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after_student_id = rows[-1][0]
+
+def iter_missing_students(
+    session: Session,
+    prereqs: List[CoursePrerequisite],
+    cohort_id: Optional[str] = None,
+    after_student_id: Optional[int] = None,
+    batch_size: int = IMPACT_BATCH_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Sinh lần lượt các sinh viên không đáp ứng điều kiện tiên quyết, theo thứ tự id
+
+    Mỗi lô sinh viên dùng số truy vấn cố định (load_prerequisite_facts),
+    không giữ toàn bộ danh sách trong bộ nhớ.
+    """
+    columns = (Student.id, Student.name, Student.student_number)
+    for students in _iter_student_batches(session, columns, cohort_id, after_student_id, batch_size):
+        facts = load_prerequisite_facts(session, prereqs, [student_id for student_id, _, _ in students])
+        for student_id, name, student_number in students:
+            missing_course_details = find_missing_prerequisites(facts, student_id, prereqs)
+            if missing_course_details:
+                missing_courses = [detail["course_name"] for detail in missing_course_details]
+                yield {
+                    "id": student_id,
+                    "name": name,
+                    "student_number": student_number,
+                    "reason": ", ".join(missing_courses),
+                    "missing_courses": missing_courses,
+                    "missing_course_details": missing_course_details
+                }
+
+def compute_prerequisite_impact_summary(
+    session: Session,
+    course_id: int,
+    cohort_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Chỉ số tổng hợp của phân tích tác động, đánh giá lại toàn bộ sinh viên
+
+    Vẫn nạp kết quả của mọi sinh viên theo lô như danh sách đầy đủ, chỉ bỏ phần dựng
+    chi tiết: mỗi lô được đánh giá theo cột bằng evaluate_prereq_columns. Bản đọc từ
+    ma trận đã tính sẵn là cohort_eligibility_service.get_course_impact_summary.
+    """
+    prereqs = get_course_prerequisites(session, course_id)
+    if not prereqs:
+        return {"total_students": 0, "missing_count": 0, "risk_score": 0.0}
+    
+    total_students = 0
+    missing_count = 0
+    for students in _iter_student_batches(session, (Student.id,), cohort_id):
+        student_ids = [student_id for student_id, in students]
+        facts = load_prerequisite_facts(session, prereqs, student_ids)
+        total_students += len(student_ids)
+        missing_count += int((~evaluate_prereq_columns(facts, prereqs, student_ids).all(axis=1)).sum())
+    
+    return {
+        "total_students": total_students,
+        "missing_count": missing_count,
+        "risk_score": missing_count / total_students if total_students > 0 else 0.0
+    }
+
+def get_prerequisite_impact_page(
+    session: Session,
+    course_id: int,
+    cohort_id: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: int = 100
+) -> Dict[str, Any]:
+    """
+    Một trang sinh viên không đáp ứng điều kiện tiên quyết
+
+    cursor là id sinh viên cuối cùng của trang trước; next_cursor = None khi hết dữ liệu.
+    """
+    prereqs = get_course_prerequisites(session, course_id)
+    if not prereqs:
+        return {"missing_students": [], "next_cursor": None}
+    
+    page = list(islice(iter_missing_students(session, prereqs, cohort_id, cursor), limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+    return {
+        "missing_students": page,
+        "next_cursor": page[-1]["id"] if has_more else None
+    }
+
+def count_students(session: Session, cohort_id: Optional[str] = None) -> int:
+    """Số sinh viên (lọc theo cohort nếu có)"""
+    statement = select(func.count(Student.id))
+    if cohort_id:
+        statement = statement.where(Student.cohort == cohort_id)
+    return session.exec(statement).one()
+
+def iter_prerequisite_impact_stream(
+    bind: Any,
+    course_id: int,
+    cohort_id: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Sinh kết quả phân tích tác động theo dạng luồng
+
+    Mỗi sinh viên không đáp ứng là một phần tử (type = "student"), phần tử cuối
+    là bản tóm tắt (type = "summary"). Dùng DB session riêng trên bind vì
+    generator chạy sau khi request trả về.
+    """
+    with Session(bind) as session:
+        prereqs = get_course_prerequisites(session, course_id)
+        missing_count = 0
+        if prereqs:
+            for student in iter_missing_students(session, prereqs, cohort_id):
+                missing_count += 1
+                yield {"type": "student", **student}
+        
+        total_students = count_students(session, cohort_id) if prereqs else 0
+        yield {
+            "type": "summary",
+            "total_students": total_students,
+            "missing_count": missing_count,
+            "risk_score": missing_count / total_students if total_students > 0 else 0.0
+        }
+
+def compute_prerequisite_impact(
+    session: Session,
+    course_id: int,
+    cohort_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Phân tích tác động: sinh viên không đáp ứng điều kiện tiên quyết của môn học
+
+    Nạp điều kiện, sinh viên và kết quả liên quan theo lô (số truy vấn cố định mỗi lô),
+    sau đó đánh giá từng sinh viên trong bộ nhớ.
+    """
+    prereqs = get_course_prerequisites(session, course_id)
+    if not prereqs:
+        return {
+            "total_students": 0,
+            "missing_count": 0,
+            "missing_students": [],
+            "risk_score": 0.0
+        }
+    
+    total_students = count_students(session, cohort_id)
+    missing_students = list(iter_missing_students(session, prereqs, cohort_id))
+    missing_count = len(missing_students)
+    return {
+        "total_students": total_students,
+        "missing_count": missing_count,
+        "missing_students": missing_students,
+        "risk_score": missing_count / total_students if total_students > 0 else 0.0
+    }
+
+# Giới hạn số cặp (sinh viên, môn học) trong một lần kiểm tra hàng loạt
+ELIGIBILITY_MAX_PAIRS = 1_000_000
+
+def evaluate_prereq_columns(
+    facts: Dict[str, Any],
+    prereqs: List[CoursePrerequisite],
+    student_ids: List[int]
+) -> np.ndarray:
+    """
+    Ma trận bool sinh viên × điều kiện trên dữ liệu đã nạp (chỉ đạt / không đạt)
+
+    Cùng kết quả "meets" với evaluate_student_prereq nhưng đánh giá từng điều kiện
+    trên cả mảng sinh viên, không tạo chi tiết:
+    - pass_course: điểm tổng kết nếu có, ngược lại any() trên ma trận sinh viên × CLO của môn
+    - clo_achievement: tỉ lệ CLO yêu cầu đạt so với required_ratio
+    - plo_threshold: mọi PLO liên quan ≥ threshold
+    - min_score: so sánh vector điểm tổng kết
+    """
+    n = len(student_ids)
+    meets = np.ones((n, len(prereqs)), dtype=bool)
+    if not n or not prereqs:
+        return meets
+
+    # Ma trận sinh viên × CLO liên quan (CLO của môn tiên quyết và CLO yêu cầu)
+    clo_index: Dict[int, int] = {}
+    plo_index: Dict[int, int] = {}
+    for prereq in prereqs:
+        if prereq.condition_type == ConditionType.PASS_COURSE:
+            clo_ids = facts["course_clo_ids"].get(prereq.prereq_course_id, ())
+        elif prereq.condition_type == ConditionType.CLO_ACHIEVEMENT:
+            clo_ids = (prereq.condition_payload or {}).get("required_clo_ids", [])
+        else:
+            clo_ids = ()
+            if prereq.condition_type == ConditionType.PLO_THRESHOLD:
+                for plo_id in facts["prereq_plo_ids"].get(prereq.id, []):
+                    plo_index.setdefault(plo_id, len(plo_index))
+        for clo_id in clo_ids:
+            clo_index.setdefault(clo_id, len(clo_index))
+
+    achieved = np.zeros((n, len(clo_index)), dtype=bool)
+    if clo_index:
+        for i, student_id in enumerate(student_ids):
+            for clo_id, value in facts["clo_results"].get(student_id, {}).items():
+                j = clo_index.get(clo_id)
+                if j is not None and value:
+                    achieved[i, j] = True
+
+    plo_achievements = np.zeros((n, len(plo_index)), dtype=np.float64)
+    if plo_index:
+        for i, student_id in enumerate(student_ids):
+            for plo_id, value in facts["plo_results"].get(student_id, {}).items():
+                j = plo_index.get(plo_id)
+                if j is not None:
+                    plo_achievements[i, j] = value
+
+    # Cột kết quả môn học (có kết quả, đạt, điểm tổng kết) theo môn tiên quyết
+    course_columns: Dict[int, Any] = {}
+
+    def course_result_columns(course_id: int):
+        if course_id not in course_columns:
+            has_result = np.zeros(n, dtype=bool)
+            passed = np.zeros(n, dtype=bool)
+            scores = np.zeros(n, dtype=np.float64)
+            for i, student_id in enumerate(student_ids):
+                result = facts["course_results"].get((student_id, course_id))
+                if result is not None:
+                    has_result[i] = True
+                    scores[i] = result[0]
+                    passed[i] = bool(result[1])
+            course_columns[course_id] = (has_result, passed, scores)
+        return course_columns[course_id]
+
+    for k, prereq in enumerate(prereqs):
+        payload = prereq.condition_payload or {}
+        condition_type = prereq.condition_type
+        if condition_type == ConditionType.PASS_COURSE:
+            has_result, passed, _ = course_result_columns(prereq.prereq_course_id)
+            clo_ids = facts["course_clo_ids"].get(prereq.prereq_course_id, ())
+            # Môn tiên quyết chưa có CLO: tạm coi là đáp ứng (như evaluate_student_prereq)
+            from_clos = (
+                achieved[:, [clo_index[clo_id] for clo_id in clo_ids]].any(axis=1) if clo_ids
+                else np.ones(n, dtype=bool)
+            )
+            meets[:, k] = np.where(has_result, passed, from_clos)
+        elif condition_type == ConditionType.CLO_ACHIEVEMENT:
+            required_clo_ids = payload.get("required_clo_ids", [])
+            required_ratio = payload.get("required_ratio", 0.66)
+            if required_clo_ids:
+                columns = [clo_index[clo_id] for clo_id in set(required_clo_ids)]
+                ratio = achieved[:, columns].sum(axis=1) / len(required_clo_ids)
+            else:
+                ratio = np.zeros(n, dtype=np.float64)
+            meets[:, k] = ratio >= required_ratio
+        elif condition_type == ConditionType.PLO_THRESHOLD:
+            plo_ids = facts["prereq_plo_ids"].get(prereq.id, [])
+            if plo_ids:
+                threshold = payload.get("threshold", 0.6)
+                columns = [plo_index[plo_id] for plo_id in plo_ids]
+                meets[:, k] = (plo_achievements[:, columns] >= threshold).all(axis=1)
+        elif condition_type == ConditionType.MIN_SCORE:
+            has_result, _, scores = course_result_columns(prereq.prereq_course_id)
+            meets[:, k] = has_result & (scores >= payload.get("min_score", 5.0))
+        else:
+            meets[:, k] = False
+    return meets
+
+def evaluate_eligibility_matrix(
+    facts: Dict[str, Any],
+    prereqs: List[CoursePrerequisite],
+    student_ids: List[int],
+    course_ids: List[int],
+    registrations: Optional[Dict[int, Iterable[int]]] = None
+) -> Dict[str, Any]:
+    """
+    Ma trận đủ điều kiện sinh viên × môn học trên dữ liệu đã nạp
+
+    Mỗi điều kiện được đánh giá một lần trên cả mảng sinh viên (evaluate_prereq_columns),
+    sau đó gộp theo môn học bằng phép AND trên mảng NumPy:
+    - strict: phải đáp ứng
+    - coreq: đáp ứng, hoặc chính sinh viên đó đăng ký môn song hành trong cùng đợt
+      (registrations: {student_id: các môn sinh viên đăng ký}; không có → phải đáp ứng)
+    - recommended: không chặn đăng ký
+    """
+    blocking = [prereq for prereq in prereqs if prereq.type != PrerequisiteType.RECOMMENDED]
+    meets = evaluate_prereq_columns(facts, blocking, student_ids)
+
+    if registrations:
+        registered = [set(registrations.get(student_id, ())) for student_id in student_ids]
+        for k, prereq in enumerate(blocking):
+            if prereq.type == PrerequisiteType.COREQ:
+                meets[:, k] |= np.fromiter(
+                    (prereq.prereq_course_id in courses for courses in registered),
+                    dtype=bool, count=len(student_ids)
+                )
+
+    prereq_columns: Dict[int, List[int]] = {course_id: [] for course_id in course_ids}
+    for k, prereq in enumerate(blocking):
+        if prereq.course_id in prereq_columns:
+            prereq_columns[prereq.course_id].append(k)
+
+    eligible = np.ones((len(student_ids), len(course_ids)), dtype=bool)
+    for j, course_id in enumerate(course_ids):
+        columns = prereq_columns[course_id]
+        if columns:
+            eligible[:, j] = meets[:, columns].all(axis=1)
+
+    return {
+        "eligible": eligible,
+        "blocking_prereq_ids": {
+            course_id: [blocking[k].id for k in columns]
+            for course_id, columns in prereq_columns.items()
+        }
+    }
+
+def compute_eligibility_matrix(
+    session: Session,
+    student_ids: List[int],
+    course_ids: List[int],
+    registrations: Optional[Dict[int, Iterable[int]]] = None
+) -> Dict[str, Any]:
+    """
+    Kiểm tra hàng loạt nhiều sinh viên × nhiều môn học đăng ký
+
+    Dùng số truy vấn cố định: điều kiện tiên quyết của các môn (1 truy vấn)
+    và load_prerequisite_facts cho toàn bộ sinh viên. registrations là các môn
+    mỗi sinh viên đăng ký trong cùng đợt (để xét điều kiện song hành).
+    """
+    prereqs = []
+    if course_ids:
+        prereqs = list(session.exec(
+            select(CoursePrerequisite).where(CoursePrerequisite.course_id.in_(course_ids))
+        ).all())
+    facts = load_prerequisite_facts(session, prereqs, student_ids) if prereqs else None
+
+    if facts is None:
+        return {
+            "eligible": np.ones((len(student_ids), len(course_ids)), dtype=bool),
+            "blocking_prereq_ids": {course_id: [] for course_id in course_ids}
+        }
+    return evaluate_eligibility_matrix(facts, prereqs, student_ids, course_ids, registrations)
@@ -0,0 +1,29 @@
+"""
+Service liên kết câu hỏi - CLO
+
+Question.clo_ids là nguồn dữ liệu duy nhất của liên kết câu hỏi - CLO. Cột có GIN
+index nên các điều kiện clo_ids @> ARRAY[clo_id] tra cứu CLO → câu hỏi trên server
+mà không quét toàn bộ câu hỏi.
+
+Các hàm chỉ thay đổi session, không commit.
+"""
+from sqlmodel import Session
+from sqlalchemy import update, func
+from sqlalchemy.dialects.postgresql import array
+from app.models import Question
+
+
+def remove_clo_from_questions(session: Session, clo_id: int) -> int:
+    """
+    Gỡ CLO khỏi clo_ids của các câu hỏi map với nó
+
+    Một câu UPDATE array_remove trên các câu hỏi thỏa clo_ids @> ARRAY[clo_id]
+    (dùng GIN index), không nạp câu hỏi vào Python. Trả về số câu hỏi được cập nhật.
+    """
+    result = session.execute(
+        update(Question)
+        .where(Question.clo_ids.op("@>")(array([clo_id])))
+        .values(clo_ids=func.array_remove(Question.clo_ids, clo_id))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
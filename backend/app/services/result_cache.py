@@ -0,0 +1,67 @@
+"""
+Cache kết quả tính toán (TLĐ CLO, TLĐ PLO) và ma trận điểm trong bộ nhớ
+
+Khóa cache gồm phạm vi (course/program) và token phiên bản dữ liệu,
+nên khi dữ liệu thay đổi thì khóa mới tự động khác đi, không cần xóa cache.
+Kích thước giới hạn, loại bỏ theo LRU.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional
+from app.config import settings
+
+
+class LRUCache:
+    """Cache LRU an toàn với nhiều thread, có bộ đếm hit/miss"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Lấy giá trị theo khóa, trả về None nếu không có"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Lưu giá trị, loại bỏ phần tử ít dùng nhất khi vượt kích thước"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Xóa toàn bộ cache (giữ nguyên bộ đếm)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê cache phục vụ giám sát"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0
+            }
+
+
+# Cache dùng chung cho TLĐ CLO của lớp và TLĐ PLO của chương trình
+tld_cache = LRUCache(settings.RESULT_CACHE_SIZE)
+
+# Cache ma trận điểm của môn học (và cấu trúc chương trình) phục vụ mô phỏng what-if
+matrix_cache = LRUCache(settings.MATRIX_CACHE_SIZE)
@@ -0,0 +1,172 @@
+"""
+Service mô phỏng what-if cho TLĐ CLO / TLĐ PLO
+
+Cho phép thử thay đổi ngưỡng đạt CLO, trọng số assessment và trọng số đóng góp
+M/N/L mà không sửa dữ liệu và không lưu kết quả.
+
+Ma trận điểm của môn học được nạp một lần và giữ trong matrix_cache theo phiên bản
+dữ liệu; mỗi lần mô phỏng chỉ còn một phép nhân ma trận trên dữ liệu đã nạp.
+"""
+from sqlmodel import Session, select
+from typing import Dict, Any, Optional
+import numpy as np
+from app.models import PLO
+from app.services.calculation_service import (
+    CONTRIBUTION_WEIGHTS,
+    load_course_matrices,
+    compute_achievement_matrix,
+    load_program_structure,
+    build_contribution_matrix,
+    get_mapped_course_clo_ids,
+    aggregate_program_tld_plos
+)
+from app.services.dirty_tracking_service import get_course_data_version, get_program_data_version
+from app.services.result_cache import matrix_cache
+
+
+def get_course_matrices(session: Session, course_id: int) -> Dict[str, Any]:
+    """Ma trận điểm của môn học, có cache theo phiên bản dữ liệu"""
+    key = ("course_matrices", course_id, get_course_data_version(session, course_id))
+    matrices = matrix_cache.get(key)
+    if matrices is None:
+        matrices = load_course_matrices(session, course_id)
+        matrix_cache.set(key, matrices)
+    return matrices
+
+
+def get_program_structure(session: Session, program_id: int) -> Dict[str, Any]:
+    """Cấu trúc chương trình (CLO, tín chỉ, mức đóng góp), có cache theo phiên bản dữ liệu"""
+    plo_ids = list(session.exec(
+        select(PLO.id).where(PLO.program_id == program_id).order_by(PLO.id)
+    ).all())
+    key = (
+        "program_structure", program_id,
+        get_program_data_version(session, program_id), tuple(plo_ids)
+    )
+    structure = matrix_cache.get(key)
+    if structure is None:
+        structure = load_program_structure(session, program_id, plo_ids)
+        matrix_cache.set(key, structure)
+    return structure
+
+
+def build_simulation_parameters(
+    matrices: Dict[str, Any],
+    clo_threshold: Optional[float] = None,
+    clo_thresholds: Optional[Dict[int, float]] = None,
+    assessment_weights: Optional[Dict[int, float]] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Tạo vector trọng số assessment và ngưỡng CLO giả định (không sửa ma trận gốc)
+
+    clo_threshold áp dụng cho mọi CLO, clo_thresholds ghi đè cho từng CLO;
+    assessment_weights ghi đè trọng số theo assessment_id. Khóa không thuộc môn học bị bỏ qua.
+    """
+    thresholds = matrices["thresholds"].copy()
+    if clo_threshold is not None:
+        thresholds[:] = clo_threshold
+    for j, clo_id in enumerate(matrices["clo_ids"]):
+        if clo_thresholds and clo_id in clo_thresholds:
+            thresholds[j] = clo_thresholds[clo_id]
+
+    weights = matrices["assessment_weights"].copy()
+    for k, assessment_id in enumerate(matrices["assessment_ids"]):
+        if assessment_weights and assessment_id in assessment_weights:
+            weights[k] = assessment_weights[assessment_id]
+
+    return {"assessment_weights": weights, "thresholds": thresholds}
+
+
+def _class_tld_clo(matrices: Dict[str, Any], achieved: np.ndarray) -> Dict[int, float]:
+    """TLĐ CLO của lớp từ ma trận đạt/không đạt"""
+    if not matrices["student_ids"]:
+        return {clo_id: 0.0 for clo_id in matrices["clo_ids"]}
+    tld_values = achieved.mean(axis=0)
+    return {clo_id: float(tld_values[j]) for j, clo_id in enumerate(matrices["clo_ids"])}
+
+
+def _clo_counts(matrices: Dict[str, Any], achieved: np.ndarray) -> Dict[str, Any]:
+    """Bộ đếm CLO của môn học theo cùng định dạng với compute_course_clo_counts"""
+    achieved_counts = achieved.sum(axis=0)
+    return {
+        "student_count": len(matrices["student_ids"]),
+        "achieved_counts": {
+            clo_id: int(achieved_counts[j]) for j, clo_id in enumerate(matrices["clo_ids"])
+        }
+    }
+
+
+def simulate_course(
+    session: Session,
+    course_id: int,
+    clo_threshold: Optional[float] = None,
+    clo_thresholds: Optional[Dict[int, float]] = None,
+    assessment_weights: Optional[Dict[int, float]] = None
+) -> Dict[str, Any]:
+    """
+    Mô phỏng TLĐ CLO của lớp với ngưỡng / trọng số assessment giả định
+
+    Trả về TLĐ CLO mô phỏng và TLĐ CLO hiện tại (baseline) để so sánh.
+    """
+    matrices = get_course_matrices(session, course_id)
+    parameters = build_simulation_parameters(
+        matrices, clo_threshold, clo_thresholds, assessment_weights
+    )
+    baseline = compute_achievement_matrix(matrices)
+    simulated = compute_achievement_matrix(matrices, **parameters)
+
+    return {
+        "course_id": course_id,
+        "student_count": len(matrices["student_ids"]),
+        "class_tld_clo": _class_tld_clo(matrices, simulated["achieved"]),
+        "baseline_tld_clo": _class_tld_clo(matrices, baseline["achieved"])
+    }
+
+
+def simulate_program(
+    session: Session,
+    program_id: int,
+    clo_threshold: Optional[float] = None,
+    clo_thresholds: Optional[Dict[int, float]] = None,
+    assessment_weights: Optional[Dict[int, float]] = None,
+    contribution_weights: Optional[Dict[str, float]] = None
+) -> Dict[str, Any]:
+    """
+    Mô phỏng TLĐ PLO của chương trình với ngưỡng, trọng số assessment
+    và trọng số đóng góp M/N/L giả định
+
+    Trả về TLĐ PLO mô phỏng và TLĐ PLO hiện tại (baseline) để so sánh.
+    """
+    structure = get_program_structure(session, program_id)
+    baseline_contribution = build_contribution_matrix(structure)
+    contribution = build_contribution_matrix(structure, contribution_weights)
+
+    # Môn học cần nạp: có CLO map với PLO theo mức hiện tại hoặc theo trọng số mới
+    course_clo_ids = get_mapped_course_clo_ids(structure, baseline_contribution)
+    course_clo_ids.update(get_mapped_course_clo_ids(structure, contribution))
+
+    baseline_counts = {}
+    simulated_counts = {}
+    for course_id in course_clo_ids:
+        matrices = get_course_matrices(session, course_id)
+        parameters = build_simulation_parameters(
+            matrices, clo_threshold, clo_thresholds, assessment_weights
+        )
+        baseline_counts[course_id] = _clo_counts(
+            matrices, compute_achievement_matrix(matrices)["achieved"]
+        )
+        simulated_counts[course_id] = _clo_counts(
+            matrices, compute_achievement_matrix(matrices, **parameters)["achieved"]
+        )
+
+    weights = dict(CONTRIBUTION_WEIGHTS)
+    weights.update(contribution_weights or {})
+    return {
+        "program_id": program_id,
+        "course_count": len(course_clo_ids),
+        "contribution_weights": weights,
+        "tld_plo": aggregate_program_tld_plos(structure, contribution, simulated_counts),
+        "baseline_tld_plo": aggregate_program_tld_plos(
+            structure, baseline_contribution, baseline_counts
+        )
+    }
@@ -0,0 +1,269 @@
+"""
+Service phân tích văn bản CLO / PLO dùng chung
+
+- Một bộ tách từ và một danh sách stopwords cho mọi tính năng so khớp văn bản
+  (gợi ý môn tiên quyết, gợi ý mapping CLO-PLO, ...)
+- Mỗi CLO / PLO được tách từ một lần khi ghi; tập từ khóa và vector TF-IDF thưa được
+  lưu trong TextProfile, gắn với updated_at của bản ghi nguồn
+- Đọc hồ sơ qua get_text_profiles: cache bộ nhớ (LRU) → bảng TextProfile → tính lại
+  nếu hồ sơ chưa có hoặc đã cũ
+
+IDF lấy từ TextTermStat tại thời điểm tính nên trọng số của các hồ sơ cũ lệch dần khi
+kho văn bản thay đổi; rebuild_text_profiles tính lại toàn bộ.
+"""
+import math
+import re
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Any, Iterable, Set
+from collections import Counter
+from sqlmodel import Session, select
+from sqlalchemy import delete, func
+from app.config import settings
+from app.models import CLO, PLO, TextProfile, TextTermStat
+from app.services.result_cache import LRUCache
+
+ENTITY_CLO = "clo"
+ENTITY_PLO = "plo"
+
+# Stopwords tiếng Việt cơ bản (có thể mở rộng)
+STOPWORDS = {
+    "và", "của", "cho", "với", "từ", "trong", "là", "được", "có", "một", "các",
+    "theo", "về", "này", "đó", "nào", "khi", "sau", "trước", "để", "bằng",
+    "như", "hoặc", "nếu", "thì", "mà", "đã", "sẽ", "đang", "cũng", "rất", "đến"
+}
+
+# Bỏ các từ ngắn hơn độ dài này
+MIN_TOKEN_LENGTH = 2
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ: lowercase, bỏ dấu câu, stopwords và từ quá ngắn (giữ thứ tự, giữ lặp)"""
+    text = re.sub(r'[^\w\s]', ' ', (text or "").lower())
+    return [t for t in text.split() if len(t) >= MIN_TOKEN_LENGTH and t not in STOPWORDS]
+
+
+def token_set(text: str) -> Set[str]:
+    """Tập từ khóa của văn bản"""
+    return set(tokenize(text))
+
+
+def entity_text(entity_type: str, entity: Any) -> str:
+    """Văn bản dùng để phân tích: "verb text" của CLO, description của PLO"""
+    if entity_type == ENTITY_CLO:
+        return f"{entity.verb} {entity.text}"
+    return entity.description
+
+
+def compute_tfidf(
+    tokens: List[str],
+    document_counts: Dict[str, int],
+    document_total: int
+) -> Dict[str, float]:
+    """
+    Vector TF-IDF thưa, chuẩn hóa L2
+
+    tf = số lần xuất hiện / số từ; idf = ln((1 + N) / (1 + df)) + 1 (smooth idf).
+    """
+    if not tokens:
+        return {}
+    counts = Counter(tokens)
+    weights = {
+        token: (count / len(tokens)) * (
+            math.log((1 + document_total) / (1 + document_counts.get(token, 0))) + 1
+        )
+        for token, count in counts.items()
+    }
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {token: weight / norm for token, weight in sorted(weights.items())}
+
+
+text_profile_cache = LRUCache(settings.TEXT_PROFILE_CACHE_SIZE)
+_stats_lock = Lock()
+_profile_stats = {"persisted_hits": 0, "recomputed": 0}
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _profile_stats[key] += amount
+
+
+def _cache_key(entity_type: str, entity_id: int, source_updated_at: datetime):
+    return (entity_type, entity_id, source_updated_at)
+
+
+def _profile_dict(profile: TextProfile) -> Dict[str, Any]:
+    return {"tokens": frozenset(profile.tokens or []), "tfidf": dict(profile.tfidf or {})}
+
+
+def _adjust_term_stats(session: Session, added: Iterable[str], removed: Iterable[str]) -> None:
+    """Cập nhật số văn bản chứa từ khóa (không commit)"""
+    changes = {token: 1 for token in added}
+    for token in removed:
+        changes[token] = changes.get(token, 0) - 1
+    changes = {token: delta for token, delta in changes.items() if delta}
+    if not changes:
+        return
+    stats = {
+        stat.token: stat
+        for stat in session.exec(select(TextTermStat).where(TextTermStat.token.in_(list(changes)))).all()
+    }
+    for token, delta in changes.items():
+        stat = stats.get(token) or TextTermStat(token=token, document_count=0)
+        stat.document_count = max(0, stat.document_count + delta)
+        session.add(stat)
+
+
+def refresh_text_profile(session: Session, entity_type: str, entity: Any) -> Dict[str, Any]:
+    """
+    Tách từ và lưu hồ sơ văn bản của một CLO / PLO (gọi khi tạo / sửa, trước commit)
+
+    Trả về {"tokens": frozenset, "tfidf": {token: trọng số}}.
+    """
+    if entity.id is None:
+        session.flush()
+    tokens = tokenize(entity_text(entity_type, entity))
+    new_tokens = set(tokens)
+
+    profile = session.get(TextProfile, (entity_type, entity.id))
+    old_tokens = set(profile.tokens or []) if profile else set()
+    if profile is None:
+        profile = TextProfile(entity_type=entity_type, entity_id=entity.id, source_updated_at=entity.updated_at)
+    _adjust_term_stats(session, new_tokens - old_tokens, old_tokens - new_tokens)
+
+    profile.tokens = sorted(new_tokens)
+    profile.source_updated_at = entity.updated_at
+    profile.computed_at = datetime.utcnow()
+    session.add(profile)
+    session.flush()
+
+    document_total = session.exec(select(func.count()).select_from(TextProfile)).one()
+    document_counts = dict(session.exec(
+        select(TextTermStat.token, TextTermStat.document_count)
+        .where(TextTermStat.token.in_(list(new_tokens)))
+    ).all()) if new_tokens else {}
+    profile.tfidf = compute_tfidf(tokens, document_counts, document_total)
+    session.add(profile)
+
+    result = _profile_dict(profile)
+    text_profile_cache.set(_cache_key(entity_type, entity.id, entity.updated_at), result)
+    return result
+
+
+def delete_text_profiles(session: Session, entity_type: str, entity_ids: Iterable[int]) -> None:
+    """Xóa hồ sơ văn bản của các CLO / PLO bị xóa (không commit)"""
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return
+    profiles = session.exec(
+        select(TextProfile).where(
+            TextProfile.entity_type == entity_type,
+            TextProfile.entity_id.in_(entity_ids)
+        )
+    ).all()
+    for profile in profiles:
+        _adjust_term_stats(session, [], profile.tokens or [])
+        session.delete(profile)
+
+
+def get_text_profiles(
+    session: Session,
+    entity_type: str,
+    entities: Iterable[Any]
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Hồ sơ văn bản của nhiều CLO / PLO: {entity_id: {"tokens", "tfidf"}}
+
+    Thứ tự tra cứu: cache bộ nhớ → TextProfile còn mới (một truy vấn cho mọi bản ghi
+    chưa có trong cache) → tính lại. Hồ sơ tính lại được thêm vào session,
+    caller commit nếu muốn lưu.
+    """
+    entities = list(entities)
+    profiles = {}
+    missing = []
+    for entity in entities:
+        cached = text_profile_cache.get(_cache_key(entity_type, entity.id, entity.updated_at))
+        if cached is None:
+            missing.append(entity)
+        else:
+            profiles[entity.id] = cached
+    if not missing:
+        return profiles
+
+    persisted = {
+        profile.entity_id: profile
+        for profile in session.exec(
+            select(TextProfile).where(
+                TextProfile.entity_type == entity_type,
+                TextProfile.entity_id.in_([entity.id for entity in missing])
+            )
+        ).all()
+    }
+    for entity in missing:
+        profile = persisted.get(entity.id)
+        if profile is not None and profile.source_updated_at == entity.updated_at:
+            _count("persisted_hits")
+            profiles[entity.id] = _profile_dict(profile)
+            text_profile_cache.set(_cache_key(entity_type, entity.id, entity.updated_at), profiles[entity.id])
+        else:
+            _count("recomputed")
+            profiles[entity.id] = refresh_text_profile(session, entity_type, entity)
+    return profiles
+
+
+def rebuild_text_profiles(session: Session) -> Dict[str, int]:
+    """
+    Tách từ lại toàn bộ CLO / PLO, tính lại số văn bản theo từ khóa và TF-IDF (không commit)
+
+    Trả về số hồ sơ CLO, PLO và số từ khóa.
+    """
+    documents = [
+        (ENTITY_CLO, clo.id, clo.updated_at, tokenize(entity_text(ENTITY_CLO, clo)))
+        for clo in session.exec(select(CLO).order_by(CLO.id)).all()
+    ] + [
+        (ENTITY_PLO, plo.id, plo.updated_at, tokenize(entity_text(ENTITY_PLO, plo)))
+        for plo in session.exec(select(PLO).order_by(PLO.id)).all()
+    ]
+    document_counts = Counter(token for *_, tokens in documents for token in set(tokens))
+
+    session.execute(delete(TextProfile))
+    session.execute(delete(TextTermStat))
+    text_profile_cache.clear()
+    computed_at = datetime.utcnow()
+    for entity_type, entity_id, updated_at, tokens in documents:
+        session.add(TextProfile(
+            entity_type=entity_type,
+            entity_id=entity_id,
+            tokens=sorted(set(tokens)),
+            tfidf=compute_tfidf(tokens, document_counts, len(documents)),
+            source_updated_at=updated_at,
+            computed_at=computed_at
+        ))
+    for token, count in sorted(document_counts.items()):
+        session.add(TextTermStat(token=token, document_count=count))
+
+    return {
+        "clo_count": sum(1 for document in documents if document[0] == ENTITY_CLO),
+        "plo_count": sum(1 for document in documents if document[0] == ENTITY_PLO),
+        "term_count": len(document_counts)
+    }
+
+
+def get_text_profile_stats() -> Dict[str, Any]:
+    """
+    Thống kê tái sử dụng hồ sơ văn bản phục vụ giám sát
+
+    hit_ratio = (trúng cache bộ nhớ + trúng TextProfile) / tổng lượt tra cứu.
+    """
+    memory = text_profile_cache.stats()
+    with _stats_lock:
+        persisted_hits = _profile_stats["persisted_hits"]
+        recomputed = _profile_stats["recomputed"]
+    lookups = memory["hits"] + persisted_hits + recomputed
+    return {
+        "memory_cache": memory,
+        "persisted_hits": persisted_hits,
+        "recomputed": recomputed,
+        "lookups": lookups,
+        "hit_ratio": (memory["hits"] + persisted_hits) / lookups if lookups else 0.0
+    }
@@ -5,10 +5,11 @@ import logging
 import os
 
 from app.database import engine, init_db
+from app.services.job_service import recover_interrupted_jobs
 from app.routers import (
     programs, plos, courses, clos, assessments, questions,
     students, scores, prerequisites, calculations, export, auth,
-    clo_plo_mapping, rubrics, references
+    clo_plo_mapping, rubrics, references, eligibility, text_analysis
 )
 
 # Setup logging
@@ -19,6 +20,9 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Startup
     init_db()
+    interrupted = recover_interrupted_jobs()
+    if interrupted:
+        logger.info("Đã đánh dấu %s job tính toán bị gián đoạn", interrupted)
     yield
     # Shutdown
 
@@ -62,11 +66,13 @@ app.include_router(questions.router, prefix="/api/questions", tags=["Questions"]
 app.include_router(students.router, prefix="/api/students", tags=["Students"])
 app.include_router(scores.router, prefix="/api/scores", tags=["Scores"])
 app.include_router(prerequisites.router, prefix="/api/courses", tags=["Prerequisites"])
+app.include_router(eligibility.router, prefix="/api/prerequisites", tags=["Prerequisites"])
 app.include_router(calculations.router, prefix="/api/calculate", tags=["Calculations"])
 app.include_router(export.router, prefix="/api/export", tags=["Export"])
 app.include_router(clo_plo_mapping.router, prefix="/api", tags=["CLO-PLO Mapping"])
 app.include_router(rubrics.router, prefix="/api", tags=["Rubrics"])
 app.include_router(references.router, prefix="/api", tags=["References"])
+app.include_router(text_analysis.router, prefix="/api/text-profiles", tags=["Text Analysis"])
 
 @app.get("/")
 async def root():
@@ -0,0 +1,30 @@
+"""
+Migration script: Tạo bảng clominhash, clolshbucket và tính chữ ký MinHash cho CLO hiện có
+Chạy sau migrate_add_text_profile.py (dùng hồ sơ văn bản của CLO)
+Chạy: docker compose exec backend python migrate_add_clo_minhash.py
+"""
+from sqlmodel import Session
+from app.database import engine
+from app.models import CLOMinHash, CLOLSHBucket
+from app.services.clo_duplicate_service import rebuild_clo_minhashes
+
+
+def migrate():
+    """Tạo bảng (nếu chưa có) và dựng lại chỉ mục LSH của mọi CLO"""
+    CLOMinHash.__table__.create(engine, checkfirst=True)
+    CLOLSHBucket.__table__.create(engine, checkfirst=True)
+    print("✓ Bảng clominhash, clolshbucket đã sẵn sàng")
+
+    with Session(engine) as session:
+        try:
+            indexed = rebuild_clo_minhashes(session)
+            session.commit()
+            print(f"✓ Đã tính chữ ký MinHash cho {indexed} CLO")
+        except Exception as exc:
+            session.rollback()
+            print(f"✗ Lỗi khi migration: {exc}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,47 @@
+"""
+Migration script: Thêm unique constraint (clo_id, plo_id) cho bảng cloplomapping
+Cần cho API ma trận CLO-PLO (bulk upsert INSERT ... ON CONFLICT)
+Chạy: docker compose exec backend python migrate_add_clo_plo_mapping_unique.py
+"""
+from sqlalchemy import text
+from app.database import engine
+
+
+def migrate():
+    """Xóa mapping trùng lặp và thêm unique constraint (clo_id, plo_id)"""
+    with engine.connect() as conn:
+        try:
+            result = conn.execute(text("""
+                SELECT constraint_name
+                FROM information_schema.table_constraints
+                WHERE table_name='cloplomapping'
+                  AND constraint_name='uq_cloplomapping_clo_plo'
+            """))
+            if result.fetchone():
+                print("✓ Unique constraint đã tồn tại, bỏ qua migration")
+                return
+
+            # Giữ lại mapping mới nhất cho mỗi cặp (clo_id, plo_id)
+            deleted = conn.execute(text("""
+                DELETE FROM cloplomapping m
+                USING cloplomapping newer
+                WHERE m.clo_id = newer.clo_id
+                  AND m.plo_id = newer.plo_id
+                  AND m.id < newer.id
+            """))
+            print(f"✓ Đã xóa {deleted.rowcount} mapping trùng lặp")
+
+            conn.execute(text("""
+                ALTER TABLE cloplomapping
+                ADD CONSTRAINT uq_cloplomapping_clo_plo UNIQUE (clo_id, plo_id)
+            """))
+            conn.commit()
+            print("✓ Đã thêm unique constraint (clo_id, plo_id) vào bảng cloplomapping")
+        except Exception as exc:
+            conn.rollback()
+            print(f"✗ Lỗi khi migration: {exc}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
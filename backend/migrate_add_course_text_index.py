@@ -0,0 +1,30 @@
+"""
+Migration script: Tạo bảng chỉ mục từ khóa (coursetextprofile, coursetokenposting)
+và dựng chỉ mục từ CLO hiện có
+Chạy: docker compose exec backend python migrate_add_course_text_index.py
+"""
+from sqlmodel import Session
+from app.database import engine
+from app.models import CourseTextProfile, CourseTokenPosting
+from app.services.prerequisite_service import rebuild_course_text_index
+
+
+def migrate():
+    """Tạo bảng (nếu chưa có) và dựng lại chỉ mục từ khóa của mọi môn học"""
+    CourseTextProfile.__table__.create(engine, checkfirst=True)
+    CourseTokenPosting.__table__.create(engine, checkfirst=True)
+    print("✓ Bảng coursetextprofile, coursetokenposting đã sẵn sàng")
+
+    with Session(engine) as session:
+        try:
+            indexed = rebuild_course_text_index(session)
+            session.commit()
+            print(f"✓ Đã dựng chỉ mục từ khóa cho {indexed} môn học")
+        except Exception as exc:
+            session.rollback()
+            print(f"✗ Lỗi khi migration: {exc}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
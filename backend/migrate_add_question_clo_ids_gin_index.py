@@ -0,0 +1,35 @@
+"""
+Migration script: Thêm GIN index cho cột question.clo_ids
+Phục vụ truy vấn "câu hỏi map với CLO X" dạng clo_ids @> ARRAY[X] (ví dụ khi xóa CLO)
+Chạy: docker compose exec backend python migrate_add_question_clo_ids_gin_index.py
+"""
+from sqlalchemy import text
+from app.database import engine
+
+
+def migrate():
+    """Tạo GIN index ix_question_clo_ids_gin (không khóa bảng khi tạo)"""
+    # CREATE INDEX CONCURRENTLY không chạy được trong transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        try:
+            result = conn.execute(text("""
+                SELECT indexname
+                FROM pg_indexes
+                WHERE tablename='question' AND indexname='ix_question_clo_ids_gin'
+            """))
+            if result.fetchone():
+                print("✓ GIN index đã tồn tại, bỏ qua migration")
+                return
+
+            conn.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_question_clo_ids_gin
+                ON question USING gin (clo_ids)
+            """))
+            print("✓ Đã thêm GIN index ix_question_clo_ids_gin vào bảng question")
+        except Exception as exc:
+            print(f"✗ Lỗi khi migration: {exc}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,47 @@
+"""
+Migration script: Thêm unique constraint (student_id, clo_id) cho bảng studentcloresult
+Cần cho bulk upsert (INSERT ... ON CONFLICT) khi lưu kết quả tính toán
+Chạy: docker compose exec backend python migrate_add_student_clo_result_unique.py
+"""
+from sqlalchemy import text
+from app.database import engine
+
+
+def migrate():
+    """Xóa bản ghi trùng lặp và thêm unique constraint (student_id, clo_id)"""
+    with engine.connect() as conn:
+        try:
+            result = conn.execute(text("""
+                SELECT constraint_name
+                FROM information_schema.table_constraints
+                WHERE table_name='studentcloresult'
+                  AND constraint_name='uq_studentcloresult_student_clo'
+            """))
+            if result.fetchone():
+                print("✓ Unique constraint đã tồn tại, bỏ qua migration")
+                return
+
+            # Giữ lại bản ghi mới nhất cho mỗi cặp (student_id, clo_id)
+            deleted = conn.execute(text("""
+                DELETE FROM studentcloresult r
+                USING studentcloresult newer
+                WHERE r.student_id = newer.student_id
+                  AND r.clo_id = newer.clo_id
+                  AND r.id < newer.id
+            """))
+            print(f"✓ Đã xóa {deleted.rowcount} bản ghi trùng lặp")
+
+            conn.execute(text("""
+                ALTER TABLE studentcloresult
+                ADD CONSTRAINT uq_studentcloresult_student_clo UNIQUE (student_id, clo_id)
+            """))
+            conn.commit()
+            print("✓ Đã thêm unique constraint (student_id, clo_id) vào bảng studentcloresult")
+        except Exception as exc:
+            conn.rollback()
+            print(f"✗ Lỗi khi migration: {exc}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
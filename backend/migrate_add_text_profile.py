@@ -0,0 +1,35 @@
+"""
+Migration script: Tạo bảng textprofile, texttermstat và tách từ toàn bộ CLO / PLO
+Chạy lại bất kỳ lúc nào để dựng lại hồ sơ văn bản (ví dụ sau khi đổi bộ tách từ / stopwords)
+Chạy: docker compose exec backend python migrate_add_text_profile.py
+"""
+from sqlmodel import Session
+from app.database import engine
+from app.models import TextProfile, TextTermStat
+from app.services.text_analysis_service import rebuild_text_profiles
+from app.services.prerequisite_service import rebuild_course_text_index
+
+
+def migrate():
+    """Tạo bảng (nếu chưa có), dựng lại hồ sơ văn bản và chỉ mục từ khóa của môn học"""
+    TextProfile.__table__.create(engine, checkfirst=True)
+    TextTermStat.__table__.create(engine, checkfirst=True)
+    print("✓ Bảng textprofile, texttermstat đã sẵn sàng")
+
+    with Session(engine) as session:
+        try:
+            result = rebuild_text_profiles(session)
+            course_count = rebuild_course_text_index(session)
+            session.commit()
+            print(
+                f"✓ Đã tách từ {result['clo_count']} CLO, {result['plo_count']} PLO "
+                f"({result['term_count']} từ khóa), dựng lại chỉ mục của {course_count} môn học"
+            )
+        except Exception as exc:
+            session.rollback()
+            print(f"✗ Lỗi khi migration: {exc}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
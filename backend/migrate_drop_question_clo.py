@@ -0,0 +1,24 @@
+"""
+Migration script: Xóa bảng questionclo
+Liên kết câu hỏi - CLO chỉ lưu ở question.clo_ids (có GIN index ix_question_clo_ids_gin)
+Chạy: docker compose exec backend python migrate_drop_question_clo.py
+"""
+from sqlalchemy import text
+from app.database import engine
+
+
+def migrate():
+    """Xóa bảng questionclo (nếu có)"""
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("DROP TABLE IF EXISTS questionclo"))
+            conn.commit()
+            print("✓ Đã xóa bảng questionclo")
+        except Exception as exc:
+            conn.rollback()
+            print(f"✗ Lỗi khi migration: {exc}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
@@ -120,6 +120,15 @@ def seed_data():
             session.refresh(clo)
         print(f"✓ Đã tạo {len(clos)} CLOs")
         
+        # Hồ sơ văn bản CLO / PLO, chỉ mục từ khóa và chỉ mục CLO trùng lặp
+        from app.services.text_analysis_service import rebuild_text_profiles
+        from app.services.prerequisite_service import rebuild_course_text_index
+        from app.services.clo_duplicate_service import rebuild_clo_minhashes
+        rebuild_text_profiles(session)
+        rebuild_course_text_index(session)
+        rebuild_clo_minhashes(session)
+        session.commit()
+        
         # 5. Prerequisite
         dmkt201 = next((c for c in courses if c.code == "DMKT201"), None)
         dmkt302 = next((c for c in courses if c.code == "DMKT302"), None)
@@ -0,0 +1,238 @@
+"""
+Tests cho calculation service (engine ma trận)
+"""
+import os
+import numpy as np
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+from app.models import (
+    Course, CLO, PLO, CLOPLOMapping, CLOClassResult, StaleCourse, StaleStudentCLO, BloomLevel,
+    Program, Assessment, Question, Student, StudentScore
+)
+from app.services.calculation_service import (
+    compute_achievement_matrix, calculate_program_tld_plos, compute_student_plo_matrix,
+    compute_final_scores, calculate_course_clo_achievements
+)
+
+# Engine SQL cần Postgres (unnest, DISTINCT ON, ARRAY): đặt TEST_DATABASE_URL tới một database test trống
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+def build_matrices():
+    """2 sinh viên, 3 câu hỏi thuộc 2 assessment, 2 CLO"""
+    return {
+        "student_ids": [10, 11],
+        "question_ids": [1, 2, 3],
+        "clo_ids": [100, 101],
+        "assessment_ids": [7, 8],
+        "scores": np.array([
+            [8.0, 4.0, 10.0],
+            [2.0, 0.0, 5.0],
+        ]),
+        "max_scores": np.array([10.0, 5.0, 10.0]),
+        "question_assessment": np.array([0, 0, 1]),
+        "assessment_weights": np.array([0.4, 0.6]),
+        # Q1 -> CLO100, Q2 -> CLO100 + CLO101, Q3 -> CLO101
+        "incidence": np.array([
+            [1.0, 0.0],
+            [1.0, 1.0],
+            [0.0, 1.0],
+        ]),
+        "thresholds": np.array([0.7, 0.7]),
+    }
+
+
+def test_compute_achievement_matrix_matches_weighted_formula():
+    """Test achievement = tổng điểm có trọng số / tổng điểm tối đa có trọng số"""
+    result = compute_achievement_matrix(build_matrices())
+    achievement = result["achievement"]
+
+    # Sinh viên 10, CLO100: (8*0.4 + 4*0.4) / (10*0.4 + 5*0.4)
+    assert np.isclose(achievement[0, 0], (8 * 0.4 + 4 * 0.4) / (10 * 0.4 + 5 * 0.4))
+    # Sinh viên 11, CLO101: (0*0.4 + 5*0.6) / (5*0.4 + 10*0.6)
+    assert np.isclose(achievement[1, 1], (0 * 0.4 + 5 * 0.6) / (5 * 0.4 + 10 * 0.6))
+    assert result["achieved"].tolist() == [[True, True], [False, False]]
+
+
+def test_compute_achievement_matrix_clo_without_questions():
+    """Test CLO không có câu hỏi nào thì achievement = 0 và không đạt"""
+    matrices = build_matrices()
+    matrices["incidence"][:, 1] = 0.0
+    matrices["thresholds"][1] = 0.0
+
+    result = compute_achievement_matrix(matrices)
+
+    assert result["achievement"][:, 1].tolist() == [0.0, 0.0]
+    assert not result["achieved"][:, 1].any()
+
+
+def test_compute_achievement_matrix_overrides():
+    """Test truyền trọng số assessment và ngưỡng khác mà không sửa dữ liệu gốc"""
+    matrices = build_matrices()
+    result = compute_achievement_matrix(
+        matrices,
+        assessment_weights=np.array([1.0, 0.0]),
+        thresholds=np.array([0.5, 0.5])
+    )
+
+    # Chỉ còn câu hỏi của assessment đầu tiên được tính
+    assert np.isclose(result["achievement"][1, 0], 2.0 / 15.0)
+    assert np.isclose(result["achievement"][0, 1], 4.0 / 5.0)
+    assert matrices["assessment_weights"].tolist() == [0.4, 0.6]
+
+
+def test_calculate_program_tld_plos_from_persisted_counts():
+    """Test TLĐ PLO được suy ra từ bộ đếm TLĐ CLO đã lưu và trọng số M/N/L"""
+    engine = create_engine("sqlite:///:memory:")
+    tables = [
+        model.__table__ for model in (
+            Course, CLO, PLO, CLOPLOMapping, CLOClassResult, StaleCourse, StaleStudentCLO
+        )
+    ]
+    SQLModel.metadata.create_all(engine, tables=tables)
+
+    with Session(engine) as session:
+        course1 = Course(code="DL101", title="Tổng quan du lịch", credits=2, version_year=2025, program_id=1)
+        course2 = Course(code="DL201", title="Marketing du lịch", credits=3, version_year=2025, program_id=1)
+        session.add_all([course1, course2])
+        session.commit()
+
+        clos = [
+            CLO(code="CLO1", verb="Nhận biết", text="a", bloom_level=BloomLevel.REMEMBER, course_id=course1.id),
+            CLO(code="CLO1", verb="Phân tích", text="b", bloom_level=BloomLevel.ANALYZE, course_id=course2.id),
+        ]
+        plos = [
+            PLO(code="PLO1", description="x", program_id=1),
+            PLO(code="PLO2", description="y", program_id=1),
+        ]
+        session.add_all(clos + plos)
+        session.commit()
+
+        session.add_all([
+            CLOPLOMapping(clo_id=clos[0].id, plo_id=plos[0].id, contribution_level="M"),
+            CLOPLOMapping(clo_id=clos[1].id, plo_id=plos[0].id, contribution_level="L"),
+            CLOPLOMapping(clo_id=clos[1].id, plo_id=plos[1].id, contribution_level="N"),
+            CLOClassResult(clo_id=clos[0].id, course_id=course1.id, assessed_count=10, achieved_count=8, tld=0.8),
+            CLOClassResult(clo_id=clos[1].id, course_id=course2.id, assessed_count=20, achieved_count=5, tld=0.25),
+        ])
+        session.commit()
+
+        plo_ids = [plo.id for plo in plos]
+        tld_plo = calculate_program_tld_plos(session, 1)
+
+    expected_plo1 = (2 * 1.0 * 8 + 3 * 0.33 * 5) / (2 * 1.0 * 10 + 3 * 0.33 * 20)
+    assert np.isclose(tld_plo[plo_ids[0]], expected_plo1)
+    assert np.isclose(tld_plo[plo_ids[1]], 5 / 20)
+
+
+def test_compute_courses_clo_counts_parallel_matches_sequential(monkeypatch):
+    """Test chạy song song theo môn học cho cùng kết quả như chạy tuần tự"""
+    from app.services import calculation_service
+
+    def fake_counts(session, course_id, engine=None):
+        return {"student_count": course_id * 10, "achieved_counts": {course_id * 100: course_id}}
+
+    monkeypatch.setattr(calculation_service, "compute_course_clo_counts", fake_counts)
+    engine = create_engine("sqlite:///:memory:")
+    progress_values = []
+
+    with Session(engine) as session:
+        sequential = calculation_service.compute_courses_clo_counts(
+            session, [1, 2, 3], max_workers=1
+        )
+        parallel = calculation_service.compute_courses_clo_counts(
+            session, [1, 2, 3], max_workers=3, progress=progress_values.append
+        )
+
+    assert parallel == sequential
+    assert sorted(progress_values)[-1] == 1.0
+
+
+def test_compute_student_plo_matrix_weighted_by_credits_and_contribution():
+    """Test mức đạt PLO của sinh viên = tỷ lệ CLO đạt có trọng số T_j * w(CLO, PLO)"""
+    # 2 sinh viên, 3 CLO (2 môn: 2 tín chỉ, 3 tín chỉ), 2 PLO
+    achieved = np.array([
+        [1.0, 0.0, 1.0],
+        [0.0, 0.0, 0.0],
+    ])
+    assessed = np.array([
+        [1.0, 1.0, 1.0],
+        [1.0, 0.0, 0.0],
+    ])
+    contribution = np.array([
+        [1.0, 0.0],
+        [0.33, 0.0],
+        [0.0, 0.66],
+    ])
+    credits = np.array([2.0, 3.0, 3.0])
+
+    result = compute_student_plo_matrix(achieved, assessed, contribution * credits[:, None])
+
+    assert np.isclose(result["achievement"][0, 0], 2.0 / (2.0 + 3 * 0.33))
+    assert np.isclose(result["achievement"][0, 1], 1.0)
+    assert result["achievement"][1, 0] == 0.0
+    # Sinh viên 2 chưa có kết quả CLO nào map với PLO2
+    assert result["assessed"].tolist() == [[True, True], [True, False]]
+
+
+def test_compute_final_scores_weighted_ten_point_scale():
+    """Test điểm tổng kết = trung bình có trọng số tỷ lệ điểm assessment, thang 10"""
+    assessment_scores = np.array([
+        [12.0, 8.0, 0.0],
+        [6.0, 2.0, 0.0],
+    ])
+    # Assessment thứ 3 chưa có câu hỏi nên không được tính trọng số
+    assessment_max = np.array([15.0, 10.0, 0.0])
+    weights = np.array([0.3, 0.5, 0.2])
+
+    final_scores = compute_final_scores(assessment_scores, assessment_max, weights)
+
+    assert np.isclose(final_scores[0], (0.3 * 0.8 + 0.5 * 0.8) / 0.8 * 10)
+    assert np.isclose(final_scores[1], (0.3 * 0.4 + 0.5 * 0.2) / 0.8 * 10)
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="Cần TEST_DATABASE_URL (Postgres) cho engine SQL")
+def test_matrix_and_sql_engines_agree_on_duplicate_scores():
+    """Test hai engine cho cùng kết quả khi một (sinh viên, câu hỏi) có nhiều dòng điểm"""
+    engine = create_engine(TEST_DATABASE_URL)
+    SQLModel.metadata.create_all(engine)
+    try:
+        with Session(engine) as session:
+            program = Program(code="DL", name="Du lịch")
+            session.add(program)
+            session.commit()
+            course = Course(code="DL101", title="Tổng quan du lịch", credits=3, version_year=2025, program_id=program.id)
+            session.add(course)
+            session.commit()
+            clos = [CLO(code=f"CLO{i}", verb="Phân tích", text="a", bloom_level=BloomLevel.ANALYZE,
+                        course_id=course.id, threshold=0.5) for i in range(2)]
+            assessment = Assessment(code="GK", title="Giữa kỳ", weight=1.0, course_id=course.id)
+            students = [Student(student_number=f"SV{i}", name=f"Sinh viên {i}") for i in range(2)]
+            session.add_all(clos + [assessment] + students)
+            session.commit()
+            questions = [
+                Question(text="Câu 1", max_score=10.0, assessment_id=assessment.id, clo_ids=[clos[0].id]),
+                Question(text="Câu 2", max_score=10.0, assessment_id=assessment.id, clo_ids=[clos[0].id, clos[1].id]),
+            ]
+            session.add_all(questions)
+            session.commit()
+            # Sinh viên 0 có hai dòng điểm cho câu 1: dòng mới nhất (4.0) được giữ
+            for student_id, question_id, score in [
+                (students[0].id, questions[0].id, 9.0),
+                (students[0].id, questions[0].id, 4.0),
+                (students[0].id, questions[1].id, 6.0),
+                (students[1].id, questions[1].id, 8.0),
+            ]:
+                session.add(StudentScore(student_id=student_id, question_id=question_id, score=score))
+                session.commit()
+
+            matrix_result = calculate_course_clo_achievements(session, course.id, engine="matrix")
+            sql_result = calculate_course_clo_achievements(session, course.id, engine="sql")
+
+        assert matrix_result["student_ids"] == sql_result["student_ids"]
+        assert matrix_result["clo_ids"] == sql_result["clo_ids"]
+        assert np.allclose(matrix_result["achievement"], sql_result["achievement"])
+        assert (matrix_result["achieved"] == sql_result["achieved"]).all()
+        assert np.allclose(matrix_result["achievement"][0], [0.5, 0.6])
+    finally:
+        SQLModel.metadata.drop_all(engine)
@@ -0,0 +1,78 @@
+"""
+Tests cho phát hiện CLO gần trùng lặp (MinHash / LSH)
+"""
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+from app.models import Program, Course, CLO, BloomLevel, TextProfile, TextTermStat, CLOMinHash, CLOLSHBucket
+from app.services.text_analysis_service import ENTITY_CLO, refresh_text_profile
+from app.services.clo_duplicate_service import (
+    compute_minhash_signature, estimate_jaccard, exact_jaccard, compute_band_buckets,
+    refresh_clo_minhash, delete_clo_minhashes, find_duplicate_clos, LSH_BANDS
+)
+
+
+def test_minhash_estimate_close_to_exact_jaccard():
+    """Test ước lượng Jaccard từ chữ ký gần với giá trị chính xác"""
+    tokens1 = {f"t{i}" for i in range(0, 40)}
+    tokens2 = {f"t{i}" for i in range(10, 50)}
+    estimate = estimate_jaccard(compute_minhash_signature(tokens1), compute_minhash_signature(tokens2))
+    assert estimate == pytest.approx(exact_jaccard(tokens1, tokens2), abs=0.1)
+    assert compute_minhash_signature([]) is None
+    # Chữ ký ổn định, tập giống nhau cho cùng bucket ở mọi band
+    assert compute_band_buckets(compute_minhash_signature(tokens1)) == compute_band_buckets(
+        compute_minhash_signature(sorted(tokens1))
+    )
+    assert len(compute_band_buckets(compute_minhash_signature(tokens1))) == LSH_BANDS
+
+
+def test_duplicate_report_finds_copied_clos_across_programs():
+    """Test báo cáo tìm CLO sao chép giữa các môn / chương trình và cập nhật khi CLO thay đổi"""
+    engine = create_engine("sqlite:///:memory:")
+    tables = [
+        model.__table__ for model in (
+            Program, Course, CLO, TextProfile, TextTermStat, CLOMinHash, CLOLSHBucket
+        )
+    ]
+    SQLModel.metadata.create_all(engine, tables=tables)
+
+    with Session(engine) as session:
+        courses = [
+            Course(code="DL101", title="Du lịch 1", credits=2, version_year=2025, program_id=1),
+            Course(code="DL102", title="Du lịch 2", credits=2, version_year=2025, program_id=1),
+            Course(code="KS101", title="Khách sạn", credits=2, version_year=2025, program_id=2),
+        ]
+        session.add_all(courses)
+        session.commit()
+        texts = [
+            (courses[0], "phân tích đặc điểm thị trường khách du lịch quốc tế tại Việt Nam"),
+            (courses[1], "phân tích đặc điểm thị trường khách du lịch quốc tế tại Việt Nam hiện nay"),
+            (courses[2], "phân tích đặc điểm thị trường khách du lịch quốc tế tại Việt Nam"),
+            (courses[2], "vận hành bộ phận lễ tân và buồng phòng khách sạn"),
+        ]
+        clos = []
+        for course, text in texts:
+            clo = CLO(code=f"CLO{len(clos) + 1}", verb="Phân tích", text=text,
+                      bloom_level=BloomLevel.ANALYZE, course_id=course.id)
+            session.add(clo)
+            profile = refresh_text_profile(session, ENTITY_CLO, clo)
+            refresh_clo_minhash(session, clo.id, profile["tokens"])
+            clos.append(clo)
+        session.commit()
+
+        report = find_duplicate_clos(session, program_id=1, threshold=0.7)
+        pairs = {(d["first"]["clo_id"], d["second"]["clo_id"]) for d in report["duplicates"]}
+        assert pairs == {(clos[0].id, clos[1].id), (clos[0].id, clos[2].id), (clos[1].id, clos[2].id)}
+        assert report["duplicates"][0]["similarity"] == 1.0
+
+        within_program = find_duplicate_clos(session, program_id=1, include_other_programs=False)
+        assert [(d["first"]["clo_id"], d["second"]["clo_id"]) for d in within_program["duplicates"]] == [
+            (clos[0].id, clos[1].id)
+        ]
+
+        # Xóa khỏi chỉ mục → không còn là ứng viên
+        delete_clo_minhashes(session, [clos[1].id])
+        session.commit()
+        report = find_duplicate_clos(session, program_id=1)
+        assert [(d["first"]["clo_id"], d["second"]["clo_id"]) for d in report["duplicates"]] == [
+            (clos[0].id, clos[2].id)
+        ]
@@ -0,0 +1,137 @@
+"""
+Tests cho gợi ý mapping CLO-PLO
+"""
+from sqlmodel import Session, SQLModel, create_engine, select
+from app.models import Course, CLO, PLO, CLOPLOMapping, BloomLevel, TextProfile, TextTermStat
+from app.services.clo_plo_mapping_service import (
+    calculate_mapping_score, score_to_contribution_level, score_mapping_matrix,
+    scores_to_contribution_levels, auto_suggest_course_mappings, load_matrix_scope,
+    encode_mapping_matrix, find_invalid_matrix_cells
+)
+from app.services.text_analysis_service import token_set
+
+CLO_SAMPLES = [
+    ("Phân tích", "thị trường du lịch và hành vi khách hàng", BloomLevel.ANALYZE),
+    ("Nhận biết", "các loại hình lưu trú", BloomLevel.REMEMBER),
+    ("Thiết kế", "chương trình du lịch trọn gói cho khách quốc tế", BloomLevel.CREATE),
+    ("Đánh giá", "chất lượng dịch vụ lữ hành", BloomLevel.EVALUATE),
+    ("Áp dụng", "", BloomLevel.APPLY),
+]
+PLO_SAMPLES = [
+    "Phân tích thị trường và hành vi khách hàng trong ngành du lịch",
+    "Thiết kế và điều hành chương trình du lịch",
+    "Giao tiếp hiệu quả bằng ngoại ngữ",
+    "và của",
+]
+
+
+def test_score_mapping_matrix_matches_scalar_score():
+    """Test ma trận score vector hóa trùng với calculate_mapping_score từng cặp"""
+    clos = [CLO(code=f"CLO{i}", verb=verb, text=text, bloom_level=bloom, course_id=1)
+            for i, (verb, text, bloom) in enumerate(CLO_SAMPLES)]
+    plos = [PLO(code=f"PLO{j}", description=description, program_id=1)
+            for j, description in enumerate(PLO_SAMPLES)]
+
+    scores = score_mapping_matrix(
+        [token_set(f"{clo.verb} {clo.text}") for clo in clos],
+        [clo.bloom_level for clo in clos],
+        [token_set(plo.description) for plo in plos]
+    )
+    levels = scores_to_contribution_levels(scores)
+    assert scores.shape == (len(clos), len(plos))
+    for i, clo in enumerate(clos):
+        for j, plo in enumerate(plos):
+            expected = calculate_mapping_score(clo, plo)
+            assert abs(scores[i, j] - expected) < 1e-12
+            assert levels[i, j] == score_to_contribution_level(expected)
+
+
+def test_auto_suggest_fills_missing_cells_only():
+    """Test gợi ý tạo mapping cho ô còn trống và giữ nguyên mapping đã có"""
+    engine = create_engine("sqlite:///:memory:")
+    tables = [model.__table__ for model in (Course, CLO, PLO, CLOPLOMapping, TextProfile, TextTermStat)]
+    SQLModel.metadata.create_all(engine, tables=tables)
+
+    with Session(engine) as session:
+        course = Course(code="DL101", title="Tổng quan du lịch", credits=3, version_year=2025, program_id=1)
+        session.add(course)
+        session.add_all([PLO(code=f"PLO{j}", description=d, program_id=1) for j, d in enumerate(PLO_SAMPLES[:2])])
+        session.add(PLO(code="PLO9", description="Chương trình khác", program_id=2))
+        session.commit()
+        clos = [CLO(code=f"CLO{i}", verb=verb, text=text, bloom_level=bloom, course_id=course.id)
+                for i, (verb, text, bloom) in enumerate(CLO_SAMPLES[:3])]
+        session.add_all(clos)
+        session.commit()
+        session.add(CLOPLOMapping(clo_id=clos[0].id, plo_id=1, contribution_level="L"))
+        session.commit()
+
+        result = auto_suggest_course_mappings(session, course)
+        session.commit()
+        assert result["clo_ids"] == [clo.id for clo in clos]
+        assert result["plo_ids"] == [1, 2]
+        assert result["created_count"] == 5
+        assert result["levels"][0][0] == "L"  # Mapping đã có không bị ghi đè
+        assert all(level is not None for row in result["levels"] for level in row)
+        assert result["levels"][2][1] == score_to_contribution_level(
+            calculate_mapping_score(clos[2], session.get(PLO, 2))
+        )
+
+        # Đã đủ ma trận → không tạo thêm
+        assert auto_suggest_course_mappings(session, course)["created_count"] == 0
+        assert len(session.exec(select(CLOPLOMapping)).all()) == 6
+
+        # Mapping tới PLO chương trình khác không được tính là ô đã có
+        session.delete(session.exec(select(CLOPLOMapping).where(
+            CLOPLOMapping.clo_id == clos[1].id, CLOPLOMapping.plo_id == 2
+        )).one())
+        session.add(CLOPLOMapping(clo_id=clos[1].id, plo_id=3, contribution_level="M"))
+        session.commit()
+        result = auto_suggest_course_mappings(session, course)
+        assert result["created_count"] == 1
+        assert all(level is not None for row in result["levels"] for level in row)
+
+
+def test_mapping_matrix_encoding_and_cell_validation():
+    """Test mã hóa ma trận chương trình (một chuỗi mỗi CLO) và kiểm tra ô thay đổi"""
+    engine = create_engine("sqlite:///:memory:")
+    SQLModel.metadata.create_all(engine, tables=[model.__table__ for model in (Course, CLO, PLO, CLOPLOMapping)])
+
+    with Session(engine) as session:
+        courses = [Course(code=f"DL{i}01", title=f"Môn {i}", credits=2, version_year=2025, program_id=1)
+                   for i in range(1, 3)]
+        session.add_all(courses)
+        session.add_all([PLO(code=f"PLO{j}", description=d, program_id=1) for j, d in enumerate(PLO_SAMPLES[:3])])
+        session.add(PLO(code="PLO9", description="Chương trình khác", program_id=2))
+        session.commit()
+        clos = [CLO(code=f"CLO{i}", verb=verb, text=text, bloom_level=bloom, course_id=courses[i % 2].id)
+                for i, (verb, text, bloom) in enumerate(CLO_SAMPLES[:3])]
+        session.add_all(clos)
+        session.commit()
+        session.add_all([
+            CLOPLOMapping(clo_id=clos[0].id, plo_id=1, contribution_level="M"),
+            CLOPLOMapping(clo_id=clos[0].id, plo_id=3, contribution_level="-"),
+            CLOPLOMapping(clo_id=clos[1].id, plo_id=2, contribution_level="N"),
+            CLOPLOMapping(clo_id=clos[1].id, plo_id=4, contribution_level="L"),  # PLO ngoài chương trình
+        ])
+        session.commit()
+
+        program_clos, plos = load_matrix_scope(session, program_id=1)
+        matrix = encode_mapping_matrix(session, program_clos, plos)
+        assert [plo["id"] for plo in matrix["plos"]] == [1, 2, 3]
+        assert [clo["id"] for clo in matrix["clos"]] == [clos[0].id, clos[2].id, clos[1].id]
+        assert matrix["rows"] == ["M.-", "...", ".N."]
+        assert matrix["clos"][0]["bloom_level"] == "Analyze"
+
+        course_clos, _ = load_matrix_scope(session, course_id=courses[1].id, program_id=1)
+        assert [clo.id for clo in course_clos] == [clos[1].id]
+
+        invalid = find_invalid_matrix_cells([
+            {"clo_id": clos[1].id, "plo_id": 1, "contribution_level": "M"},
+            {"clo_id": clos[1].id, "plo_id": 2, "contribution_level": None},
+            {"clo_id": clos[0].id, "plo_id": 1, "contribution_level": "M"},  # CLO ngoài môn học
+            {"clo_id": clos[1].id, "plo_id": 4, "contribution_level": "L"},  # PLO ngoài chương trình
+            {"clo_id": clos[1].id, "plo_id": 3, "contribution_level": "X"},  # Mức không hợp lệ
+        ], [clo.id for clo in course_clos], [plo.id for plo in plos])
+        assert [(cell["clo_id"], cell["plo_id"]) for cell in invalid] == [
+            (clos[0].id, 1), (clos[1].id, 4), (clos[1].id, 3)
+        ]
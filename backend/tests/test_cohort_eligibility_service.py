@@ -0,0 +1,71 @@
+"""
+Tests cho ma trận đủ điều kiện đăng ký theo cohort
+"""
+from datetime import datetime, timedelta
+from sqlmodel import Session, SQLModel, create_engine
+from app.models import (
+    Course, CLO, PLO, CLOPLOMapping, Student, CoursePrerequisite, PrerequisiteType, ConditionType,
+    BloomLevel, StudentCLOResult, StudentCourseResult, StudentPLOResult
+)
+from app.services.cohort_eligibility_service import (
+    build_cohort_eligibility, refresh_cohort_eligibility, count_eligible_students, find_blocked_students
+)
+
+
+def test_cohort_eligibility_refreshes_only_changed_students():
+    """Test kết quả mới chỉ làm tính lại cột của sinh viên liên quan"""
+    engine = create_engine("sqlite:///:memory:")
+    tables = [
+        model.__table__ for model in (
+            Course, CLO, PLO, CLOPLOMapping, Student, CoursePrerequisite,
+            StudentCLOResult, StudentCourseResult, StudentPLOResult
+        )
+    ]
+    SQLModel.metadata.create_all(engine, tables=tables)
+
+    with Session(engine) as session:
+        courses = [
+            Course(code=f"DL{i}01", title=f"Môn {i}", credits=2, version_year=2025, program_id=1)
+            for i in range(1, 4)
+        ]
+        session.add_all(courses)
+        session.commit()
+        base, second, third = courses
+        session.add(CLO(code="CLO1", verb="Nhận biết", text="a", bloom_level=BloomLevel.REMEMBER, course_id=base.id))
+        students = [Student(student_number=f"SV{i}", name=f"Sinh viên {i}", cohort="K2023") for i in range(3)]
+        session.add_all(students)
+        session.add(Student(student_number="SV9", name="Sinh viên khác", cohort="K2022"))
+        for course in (second, third):
+            session.add(CoursePrerequisite(
+                course_id=course.id, prereq_course_id=base.id,
+                type=PrerequisiteType.STRICT, condition_type=ConditionType.PASS_COURSE,
+                condition_payload={}, version_year=2025
+            ))
+        session.commit()
+        session.add(StudentCourseResult(
+            student_id=students[0].id, course_id=base.id, final_score=7.0, passed=True,
+            computed_at=datetime.utcnow() - timedelta(hours=1)
+        ))
+        session.commit()
+
+        entry = build_cohort_eligibility(session, "K2023")
+        assert len(entry["student_ids"]) == 3
+        assert count_eligible_students(entry, second.id)["eligible_count"] == 1
+        assert count_eligible_students(entry, base.id)["eligible_count"] == 3
+        blocked = find_blocked_students(entry, 2)
+        assert [s["student_id"] for s in blocked["students"]] == [students[1].id, students[2].id]
+
+        # Không có thay đổi → không tính lại sinh viên nào
+        assert refresh_cohort_eligibility(session, entry)["refreshed_student_count"] == 0
+
+        session.add(StudentCourseResult(
+            student_id=students[1].id, course_id=base.id, final_score=6.0, passed=True,
+            computed_at=datetime.utcnow()
+        ))
+        session.commit()
+
+        refreshed = refresh_cohort_eligibility(session, entry)
+        assert refreshed is entry
+        assert refreshed["refreshed_student_count"] == 2  # Sinh viên mới và sinh viên trong khoảng overlap
+        assert count_eligible_students(refreshed, third.id)["eligible_count"] == 2
+        assert find_blocked_students(refreshed, 1)["blocked_count"] == 1
@@ -0,0 +1,68 @@
+"""
+Tests cho ma trận thưa môn học × từ khóa và truy vấn top-k
+"""
+import numpy as np
+import pytest
+from app.services.course_similarity_service import (
+    build_similarity_index, score_query, top_k_similar, query_vector_from_texts
+)
+
+
+def build_random_index(seed: int = 7, course_count: int = 60, term_count: int = 40):
+    rng = np.random.default_rng(seed)
+    courses = [
+        {"course_id": 100 + i, "code": f"C{i}", "title": f"Môn {i}", "program_id": 1 + i % 3}
+        for i in range(course_count)
+    ]
+    vectors = {}
+    for course in courses:
+        terms = rng.choice(term_count, size=rng.integers(0, 8), replace=False)
+        vectors[course["course_id"]] = {f"t{t}": float(rng.random() + 0.1) for t in terms}
+    return courses, vectors, build_similarity_index(courses, vectors, {}, course_count)
+
+
+def test_scores_match_dense_computation():
+    """Test cosine / Jaccard từ ma trận CSC khớp với tính toán dày"""
+    courses, vectors, index = build_random_index()
+    query = {"t1": 0.5, "t3": 1.0, "t7": 0.2, "không_có": 0.4}
+
+    terms = sorted({t for v in vectors.values() for t in v} | set(query))
+    dense = np.array([[vectors[c["course_id"]].get(t, 0.0) for t in terms] for c in courses])
+    q = np.array([query.get(t, 0.0) for t in terms])
+    norms = np.linalg.norm(dense, axis=1)
+    expected_cosine = np.divide(dense @ q, norms * np.linalg.norm(q), out=np.zeros(len(courses)), where=norms > 0)
+    assert score_query(index, query, "cosine") == pytest.approx(expected_cosine, abs=1e-6)
+
+    intersection = ((dense > 0) & (q > 0)).sum(axis=1)
+    union = ((dense > 0) | (q > 0)).sum(axis=1)
+    assert score_query(index, query, "jaccard") == pytest.approx(intersection / union)
+
+
+def test_top_k_excludes_course_and_filters_program():
+    """Test top-k sắp theo điểm, bỏ chính môn học và lọc theo chương trình"""
+    courses, vectors, index = build_random_index()
+    course_id = next(c["course_id"] for c in courses if len(vectors[c["course_id"]]) >= 3)
+    scores = score_query(index, vectors[course_id], "cosine")
+
+    result = top_k_similar(index, vectors[course_id], "cosine", k=5, exclude_course_id=course_id)
+    assert course_id not in [r["course_id"] for r in result]
+    assert [r["score"] for r in result] == sorted((r["score"] for r in result), reverse=True)
+    others = sorted((s for i, s in enumerate(scores) if courses[i]["course_id"] != course_id and s > 0), reverse=True)
+    assert [r["score"] for r in result] == pytest.approx(others[:5])
+
+    filtered = top_k_similar(index, vectors[course_id], "jaccard", k=50, program_id=2)
+    assert filtered and all(r["program_id"] == 2 for r in filtered)
+
+
+def test_query_vector_from_texts_uses_index_vocabulary():
+    """Test tập CLO tùy ý được chuyển thành vector TF-IDF và tìm được môn có từ khóa chung"""
+    courses = [
+        {"course_id": 1, "code": "DL101", "title": "Marketing", "program_id": 1},
+        {"course_id": 2, "code": "KS101", "title": "Khách sạn", "program_id": 2},
+    ]
+    vectors = {1: {"marketing": 0.8, "du": 0.3, "lịch": 0.3}, 2: {"khách": 0.7, "sạn": 0.7}}
+    index = build_similarity_index(courses, vectors, {"marketing": 1, "du": 1, "lịch": 1, "khách": 1, "sạn": 1}, 2)
+
+    query = query_vector_from_texts(index, ["Thiết kế chiến dịch marketing du lịch"])
+    assert [r["course_id"] for r in top_k_similar(index, query, "cosine")] == [1]
+    assert top_k_similar(build_similarity_index([], {}, {}, 0), query) == []
@@ -0,0 +1,33 @@
+"""
+Tests cho dirty tracking service
+"""
+from sqlmodel import Session, SQLModel, create_engine
+from app.models import Course, CourseDataVersion
+from app.services.dirty_tracking_service import get_program_data_version
+
+
+def test_program_data_version_does_not_repeat_after_course_delete():
+    """Test token chương trình không trùng token cũ khi xóa môn rồi tăng phiên bản môn khác"""
+    engine = create_engine("sqlite:///:memory:")
+    SQLModel.metadata.create_all(engine, tables=[Course.__table__, CourseDataVersion.__table__])
+
+    with Session(engine) as session:
+        first = Course(code="DL101", title="Môn 1", credits=2, version_year=2025, program_id=1)
+        second = Course(code="DL102", title="Môn 2", credits=2, version_year=2025, program_id=1)
+        session.add_all([first, second])
+        session.commit()
+        session.add(CourseDataVersion(course_id=first.id, version=3))
+        session.commit()
+        seen = get_program_data_version(session, 1)
+        assert seen[0] == 2
+
+        # Xóa môn có phiên bản 3, tạo môn mới và tăng phiên bản 3 lần: tổng phiên bản như cũ
+        session.delete(session.get(CourseDataVersion, first.id))
+        session.delete(first)
+        third = Course(code="DL103", title="Môn 3", credits=2, version_year=2025, program_id=1)
+        session.add(third)
+        session.commit()
+        session.add(CourseDataVersion(course_id=third.id, version=3))
+        session.commit()
+
+        assert get_program_data_version(session, 1) != seen
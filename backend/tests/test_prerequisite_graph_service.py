@@ -0,0 +1,50 @@
+"""
+Tests cho prerequisite graph service (đồ thị điều kiện tiên quyết)
+"""
+from app.services.prerequisite_graph_service import (
+    build_prerequisite_graph,
+    creates_prerequisite_cycle,
+    get_prerequisite_chain,
+    get_dependent_courses
+)
+
+
+def build_courses(*course_ids):
+    return {
+        course_id: {"code": f"C{course_id}", "title": f"Môn {course_id}", "program_id": 1}
+        for course_id in course_ids
+    }
+
+
+def test_closure_topological_order_and_levels():
+    """Test bao đóng bắc cầu, thứ tự topo và level của chuỗi 1 ← 2 ← 3, 1 ← 4"""
+    graph = build_prerequisite_graph(
+        build_courses(1, 2, 3, 4),
+        [(2, 1, "strict"), (3, 2, "strict"), (4, 1, "recommended"), (3, 4, "coreq")]
+    )
+
+    assert graph["closure"][3] == {1, 2}
+    assert graph["dependents_closure"][1] == {2, 3, 4}
+    assert graph["levels"] == {1: 0, 2: 1, 3: 2, 4: 1}
+    order = graph["topological_order"]
+    assert order.index(1) < order.index(2) < order.index(3)
+    assert graph["cycles"] == []
+
+    chain = get_prerequisite_chain(graph, 3)
+    assert [course["course_id"] for course in chain["transitive"]] == [1, 2]
+    assert [course["course_id"] for course in chain["coreqs"]] == [4]
+    assert {course["course_id"] for course in get_dependent_courses(graph, 1)["transitive"]} == {2, 3, 4}
+
+
+def test_cycles_detected_and_cycle_creation_rejected():
+    """Test phát hiện chu trình có sẵn và từ chối cạnh mới tạo chu trình"""
+    graph = build_prerequisite_graph(
+        build_courses(1, 2, 3, 5, 6),
+        [(2, 1, "strict"), (3, 2, "strict"), (5, 6, "strict"), (6, 5, "strict")]
+    )
+
+    assert graph["cycles"] == [[5, 6]]
+    assert creates_prerequisite_cycle(graph, 1, 3, "strict") == [1, 3, 2, 1]
+    assert creates_prerequisite_cycle(graph, 3, 1, "strict") is None
+    assert creates_prerequisite_cycle(graph, 1, 3, "coreq") is None
+    assert creates_prerequisite_cycle(graph, 2, 2, "coreq") == [2, 2]
@@ -2,9 +2,12 @@
 Tests cho prerequisite service
 """
 import pytest
-from sqlmodel import Session, create_engine, SQLModel
+from sqlmodel import Session, create_engine, SQLModel, select
 from app.models import Course, CLO, CoursePrerequisite, PrerequisiteType, ConditionType, BloomLevel
-from app.services.prerequisite_service import check_student_meets_prereq, suggest_prerequisites
+from app.services.prerequisite_service import (
+    check_student_meets_prereq, suggest_prerequisites, find_missing_prerequisites,
+    evaluate_eligibility_matrix, rebuild_course_text_index, refresh_course_text_index
+)
 from app.database import get_session
 
 # Test database
@@ -65,7 +68,9 @@ def test_suggest_prerequisites_returns_relevant_candidate(session):
     session.add(clo2)
     session.commit()
     
-    # Test suggest
+    # Dựng chỉ mục từ khóa rồi test suggest
+    rebuild_course_text_index(session)
+    session.commit()
     clos_input = [
         {"verb": "Thiết kế", "text": "Thiết kế chiến dịch marketing", "bloom_level": "Create"}
     ]
@@ -78,6 +83,62 @@ def test_suggest_prerequisites_returns_relevant_candidate(session):
     course_ids = [s["course_id"] for s in suggestions]
     assert course1.id in course_ids or course2.id in course_ids
 
+def test_suggest_prerequisites_uses_keyword_index():
+    """Test gợi ý chỉ xét môn có từ khóa chung và chỉ mục được cập nhật khi CLO thay đổi"""
+    from app.models import CourseTextProfile, CourseTokenPosting, TextProfile, TextTermStat
+    from datetime import datetime
+
+    engine = create_engine("sqlite:///:memory:")
+    tables = [
+        model.__table__ for model in (
+            Course, CLO, CourseTextProfile, CourseTokenPosting, TextProfile, TextTermStat
+        )
+    ]
+    SQLModel.metadata.create_all(engine, tables=tables)
+
+    with Session(engine) as session:
+        courses = [
+            Course(code="DMKT201", title="Marketing Du lịch", credits=3, version_year=2025, program_id=1),
+            Course(code="DMKT302", title="Thương mại điện tử", credits=3, version_year=2025, program_id=1),
+            Course(code="HOTEL101", title="Quản trị khách sạn", credits=3, version_year=2025, program_id=1),
+        ]
+        session.add_all(courses)
+        session.commit()
+        marketing, ecommerce, hotel = courses
+        session.add_all([
+            CLO(code="M1", verb="Phân tích", text="Phân tích phân khúc thị trường du lịch",
+                bloom_level=BloomLevel.ANALYZE, course_id=marketing.id),
+            CLO(code="E1", verb="Thiết kế", text="Thiết kế chiến dịch marketing cho sản phẩm du lịch",
+                bloom_level=BloomLevel.CREATE, course_id=ecommerce.id),
+            CLO(code="H1", verb="Nhận biết", text="Nhận biết quy trình lễ tân khách sạn",
+                bloom_level=BloomLevel.REMEMBER, course_id=hotel.id),
+        ])
+        assert rebuild_course_text_index(session) == 3
+        session.commit()
+
+        clos_input = [{"text": "Thiết kế chiến dịch marketing", "bloom_level": "Create"}]
+        suggestions = suggest_prerequisites(session, clos_input)
+        assert [s["course_id"] for s in suggestions] == [ecommerce.id]
+        assert suggestions[0]["match_reasons"] == ["Từ khóa chung: chiến, dịch, kế"]
+        assert suggestions[0]["confidence"] == pytest.approx(0.6 * 5 / 9 + 0.4)
+        assert suggest_prerequisites(session, clos_input, exclude_course_id=ecommerce.id) == []
+
+        # Sửa CLO: posting cũ bị xóa, posting mới được thêm
+        hotel_clo = session.exec(select(CLO).where(CLO.course_id == hotel.id)).one()
+        hotel_clo.text = "Thiết kế chiến dịch khách sạn"
+        hotel_clo.updated_at = datetime.utcnow()
+        session.add(hotel_clo)
+        refresh_course_text_index(session, hotel.id)
+        session.commit()
+        assert "trình" not in session.get(CourseTextProfile, hotel.id).tokens
+        assert hotel.id in [s["course_id"] for s in suggest_prerequisites(session, clos_input)]
+
+        session.delete(hotel_clo)
+        refresh_course_text_index(session, hotel.id)
+        session.commit()
+        assert session.get(CourseTextProfile, hotel.id) is None
+        assert not session.exec(select(CourseTokenPosting).where(CourseTokenPosting.course_id == hotel.id)).all()
+
 def test_check_student_meets_prereq_pass_course(session):
     """Test check student meets prerequisite với condition pass_course"""
     # Tạo prerequisite
@@ -101,5 +162,221 @@ def test_check_student_meets_prereq_pass_course(session):
     assert "details" in result
     assert isinstance(result["meets"], bool)
 
+def test_find_missing_prerequisites_from_loaded_facts():
+    """Test đánh giá hàng loạt trên dữ liệu đã nạp: chưa học / chưa đạt / đạt"""
+    prereqs = [
+        CoursePrerequisite(
+            id=1, course_id=3, prereq_course_id=1,
+            type=PrerequisiteType.STRICT, condition_type=ConditionType.PASS_COURSE,
+            condition_payload={}, version_year=2025
+        ),
+        CoursePrerequisite(
+            id=2, course_id=3, prereq_course_id=2,
+            type=PrerequisiteType.STRICT, condition_type=ConditionType.MIN_SCORE,
+            condition_payload={"min_score": 5.0}, version_year=2025
+        ),
+    ]
+    facts = {
+        "course_names": {1: "Tổng quan du lịch", 2: "Marketing du lịch"},
+        "course_clo_ids": {1: {10, 11}, 2: {20}},
+        "prereq_plo_ids": {},
+        # Sinh viên 100 có kết quả CLO nhưng không đạt CLO nào của môn 1
+        "clo_results": {100: {10: False, 11: False}, 200: {10: True}},
+        "course_results": {(100, 2): (6.5, True), (200, 2): (4.0, True)},
+        "plo_results": {}
+    }
+
+    assert find_missing_prerequisites(facts, 100, prereqs) == [
+        {"course_name": "Tổng quan du lịch", "status": "Chưa đạt"}
+    ]
+    # Sinh viên 200 đã học môn 2 nhưng điểm 4.0 < 5.0 → Chưa đạt
+    assert find_missing_prerequisites(facts, 200, prereqs) == [
+        {"course_name": "Marketing du lịch", "status": "Chưa đạt"}
+    ]
+    assert find_missing_prerequisites(facts, 300, prereqs) == [
+        {"course_name": "Tổng quan du lịch", "status": "Chưa học"},
+        {"course_name": "Marketing du lịch", "status": "Chưa học"}
+    ]
+
+def test_eligibility_matrix_coreq_and_recommended():
+    """Test ma trận đủ điều kiện: coreq đăng ký cùng lúc được chấp nhận, recommended không chặn"""
+    prereqs = [
+        CoursePrerequisite(
+            id=1, course_id=3, prereq_course_id=1,
+            type=PrerequisiteType.STRICT, condition_type=ConditionType.PASS_COURSE,
+            condition_payload={}, version_year=2025
+        ),
+        CoursePrerequisite(
+            id=2, course_id=4, prereq_course_id=5,
+            type=PrerequisiteType.COREQ, condition_type=ConditionType.PASS_COURSE,
+            condition_payload={}, version_year=2025
+        ),
+        CoursePrerequisite(
+            id=3, course_id=5, prereq_course_id=2,
+            type=PrerequisiteType.RECOMMENDED, condition_type=ConditionType.PASS_COURSE,
+            condition_payload={}, version_year=2025
+        ),
+    ]
+    facts = {
+        "course_names": {1: "Tổng quan du lịch", 2: "Marketing du lịch", 5: "Thực tập"},
+        "course_clo_ids": {1: {10}, 2: {20}, 5: {50}},
+        "prereq_plo_ids": {},
+        "clo_results": {100: {10: True}},
+        "course_results": {},
+        "plo_results": {}
+    }
+
+    # Sinh viên 100 đăng ký cả môn song hành 5, sinh viên 200 chỉ đăng ký môn 4
+    registrations = {100: [3, 4, 5], 200: [4]}
+    result = evaluate_eligibility_matrix(facts, prereqs, [100, 200], [3, 4, 5], registrations)
+    assert result["eligible"].tolist() == [[True, True, True], [False, False, True]]
+    assert result["blocking_prereq_ids"] == {3: [1], 4: [2], 5: []}
+
+    # Không có thông tin đăng ký → coreq phải đáp ứng
+    result = evaluate_eligibility_matrix(facts, prereqs, [100, 200], [4])
+    assert result["eligible"].tolist() == [[False], [False]]
+    assert result["blocking_prereq_ids"] == {4: [2]}
+
+def test_prereq_columns_match_scalar_evaluation():
+    """Test đánh giá theo cột cho cùng kết quả meets với evaluate_student_prereq"""
+    import random
+    from app.services.prerequisite_service import evaluate_prereq_columns, evaluate_student_prereq
+
+    rng = random.Random(7)
+    conditions = [
+        (ConditionType.PASS_COURSE, {}),
+        (ConditionType.MIN_SCORE, {"min_score": 5.0}),
+        (ConditionType.CLO_ACHIEVEMENT, {"required_clo_ids": [10, 11, 11, 20], "required_ratio": 0.5}),
+        (ConditionType.CLO_ACHIEVEMENT, {"required_clo_ids": [], "required_ratio": 0.5}),
+        (ConditionType.PLO_THRESHOLD, {"threshold": 0.6}),
+    ]
+    prereqs = [
+        CoursePrerequisite(
+            id=k, course_id=9, prereq_course_id=course_id,
+            type=PrerequisiteType.STRICT, condition_type=condition_type,
+            condition_payload=payload, version_year=2025
+        )
+        for k, (course_id, (condition_type, payload)) in enumerate(
+            [(course_id, condition) for course_id in (1, 2, 3) for condition in conditions], start=1
+        )
+    ]
+    student_ids = list(range(100, 160))
+    facts = {
+        "course_names": {},
+        "course_clo_ids": {1: {10, 11}, 2: {20}, 3: set()},
+        "prereq_plo_ids": {prereq.id: [1, 2] for prereq in prereqs if prereq.prereq_course_id != 3},
+        "clo_results": {
+            sid: {clo_id: rng.random() < 0.5 for clo_id in (10, 11, 20) if rng.random() < 0.7}
+            for sid in student_ids
+        },
+        "course_results": {
+            (sid, course_id): (rng.uniform(0, 10), rng.random() < 0.5)
+            for sid in student_ids for course_id in (1, 2) if rng.random() < 0.5
+        },
+        "plo_results": {sid: {plo_id: rng.random() for plo_id in (1, 2) if rng.random() < 0.8} for sid in student_ids}
+    }
+
+    meets = evaluate_prereq_columns(facts, prereqs, student_ids)
+    expected = [
+        [evaluate_student_prereq(facts, sid, prereq)["meets"] for prereq in prereqs]
+        for sid in student_ids
+    ]
+    assert meets.tolist() == expected
+
+def test_prerequisite_impact_pages_match_full_result():
+    """Test phân trang theo cursor và summary cho cùng kết quả với danh sách đầy đủ"""
+    from app.models import Student, StudentCLOResult, StudentCourseResult, StudentPLOResult, PLO, CLOPLOMapping
+    from app.services.prerequisite_service import (
+        compute_prerequisite_impact, compute_prerequisite_impact_summary, get_prerequisite_impact_page
+    )
+    from app.services.cohort_eligibility_service import eligibility_cache, get_course_impact_summary
+    from datetime import datetime
+
+    engine = create_engine("sqlite:///:memory:")
+    tables = [
+        model.__table__ for model in (
+            Course, CLO, PLO, CLOPLOMapping, Student, CoursePrerequisite,
+            StudentCLOResult, StudentCourseResult, StudentPLOResult
+        )
+    ]
+    SQLModel.metadata.create_all(engine, tables=tables)
+
+    with Session(engine) as session:
+        prereq_course = Course(code="DL101", title="Tổng quan du lịch", credits=2, version_year=2025, program_id=1)
+        course = Course(code="DL201", title="Marketing du lịch", credits=3, version_year=2025, program_id=1)
+        session.add_all([prereq_course, course])
+        session.commit()
+        clo = CLO(code="CLO1", verb="Nhận biết", text="a", bloom_level=BloomLevel.REMEMBER, course_id=prereq_course.id)
+        students = [Student(student_number=f"SV{i}", name=f"Sinh viên {i}", cohort="K1") for i in range(7)]
+        session.add_all([clo] + students)
+        session.add(CoursePrerequisite(
+            course_id=course.id, prereq_course_id=prereq_course.id,
+            type=PrerequisiteType.STRICT, condition_type=ConditionType.PASS_COURSE,
+            condition_payload={}, version_year=2025
+        ))
+        session.commit()
+        # Sinh viên có id chẵn đã đạt CLO của môn tiên quyết
+        session.add_all([
+            StudentCLOResult(student_id=s.id, clo_id=clo.id, achievement=0.9, achieved=True, assessed_at=datetime.utcnow())
+            for s in students if s.id % 2 == 0
+        ])
+        session.commit()
+
+        full = compute_prerequisite_impact(session, course.id)
+        summary = compute_prerequisite_impact_summary(session, course.id, "K1")
+        eligibility_cache.clear()
+        cached_summary = get_course_impact_summary(session, course.id, "K1")
+
+        paged = []
+        cursor = None
+        while True:
+            page = get_prerequisite_impact_page(session, course.id, cursor=cursor, limit=2)
+            paged.extend(page["missing_students"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    assert full["total_students"] == 7
+    assert paged == full["missing_students"]
+    assert summary == {
+        "total_students": 7,
+        "missing_count": full["missing_count"],
+        "risk_score": full["risk_score"]
+    }
+    assert cached_summary == summary
+
+def test_plo_threshold_default_plos_skip_unrelated_mappings():
+    """Test PLO mặc định của điều kiện PLO_THRESHOLD bỏ qua mapping mức '-'"""
+    from app.models import PLO, CLOPLOMapping, StudentCLOResult, StudentCourseResult, StudentPLOResult
+    from app.services.prerequisite_service import load_prerequisite_facts
+
+    engine = create_engine("sqlite:///:memory:")
+    tables = [
+        model.__table__ for model in (
+            Course, CLO, PLO, CLOPLOMapping, StudentCLOResult, StudentCourseResult, StudentPLOResult
+        )
+    ]
+    SQLModel.metadata.create_all(engine, tables=tables)
 
+    with Session(engine) as session:
+        prereq_course = Course(code="DL101", title="Tổng quan du lịch", credits=2, version_year=2025, program_id=1)
+        plos = [PLO(code=f"PLO{j}", description=f"PLO {j}", program_id=1) for j in range(3)]
+        session.add_all([prereq_course] + plos)
+        session.commit()
+        clo = CLO(code="CLO1", verb="Nhận biết", text="a", bloom_level=BloomLevel.REMEMBER, course_id=prereq_course.id)
+        session.add(clo)
+        session.commit()
+        session.add_all([
+            CLOPLOMapping(clo_id=clo.id, plo_id=plos[0].id, contribution_level="M"),
+            CLOPLOMapping(clo_id=clo.id, plo_id=plos[1].id, contribution_level="-"),
+            CLOPLOMapping(clo_id=clo.id, plo_id=plos[2].id, contribution_level="L"),
+        ])
+        session.commit()
+        prereq = CoursePrerequisite(
+            id=1, course_id=2, prereq_course_id=prereq_course.id,
+            type=PrerequisiteType.STRICT, condition_type=ConditionType.PLO_THRESHOLD,
+            condition_payload={"threshold": 0.5}, version_year=2025
+        )
 
+        facts = load_prerequisite_facts(session, [prereq], student_ids=[])
+        assert sorted(facts["prereq_plo_ids"][1]) == [plos[0].id, plos[2].id]
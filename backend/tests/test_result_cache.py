@@ -0,0 +1,33 @@
+"""
+Tests cho cache kết quả TLĐ
+"""
+from app.services.result_cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test cache vượt kích thước thì loại phần tử ít dùng nhất"""
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" vừa được dùng
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_counts_hits_and_misses():
+    """Test bộ đếm hit/miss và hit_ratio"""
+    cache = LRUCache(maxsize=4)
+    cache.set(("class_tld_clo", 1, 0), {10: 0.5})
+
+    assert cache.get(("class_tld_clo", 1, 0)) == {10: 0.5}
+    # Phiên bản dữ liệu khác → khóa khác → miss
+    assert cache.get(("class_tld_clo", 1, 1)) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
@@ -0,0 +1,53 @@
+"""
+Tests cho simulation service (mô phỏng what-if)
+"""
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from app.services.calculation_service import compute_achievement_matrix
+from app.services.simulation_service import build_simulation_parameters
+from app.schemas import SimulationRequest
+from tests.test_calculation_service import build_matrices
+
+
+def test_build_simulation_parameters_overrides_without_mutating():
+    """Test ngưỡng chung, ngưỡng theo CLO và trọng số assessment ghi đè đúng vị trí"""
+    matrices = build_matrices()
+    parameters = build_simulation_parameters(
+        matrices,
+        clo_threshold=0.6,
+        clo_thresholds={101: 0.9, 999: 0.1},
+        assessment_weights={8: 0.0}
+    )
+
+    assert parameters["thresholds"].tolist() == [0.6, 0.9]
+    assert parameters["assessment_weights"].tolist() == [0.4, 0.0]
+    assert matrices["thresholds"].tolist() == [0.7, 0.7]
+    assert matrices["assessment_weights"].tolist() == [0.4, 0.6]
+
+
+def test_lower_threshold_increases_achieved():
+    """Test hạ ngưỡng đạt thì số sinh viên đạt không giảm"""
+    matrices = build_matrices()
+    baseline = compute_achievement_matrix(matrices)["achieved"]
+    simulated = compute_achievement_matrix(
+        matrices, **build_simulation_parameters(matrices, clo_threshold=0.1)
+    )["achieved"]
+
+    assert np.all(simulated >= baseline)
+    assert simulated[1, 0]
+
+
+@pytest.mark.parametrize("payload", [
+    {"clo_thresholds": {"1": 1.5}},
+    {"clo_thresholds": {"1": -0.1}},
+    {"assessment_weights": {"1": -2}},
+    {"contribution_weights": {"M": -1}},
+])
+def test_simulation_request_rejects_out_of_range_values(payload):
+    """Test ngưỡng ngoài [0, 1] và trọng số âm bị từ chối khi kiểm tra request"""
+    with pytest.raises(ValidationError):
+        SimulationRequest.model_validate(payload)
+    assert SimulationRequest.model_validate(
+        {"clo_thresholds": {"1": 0.5}, "assessment_weights": {"1": 0}, "contribution_weights": {"M": 1}}
+    ).clo_thresholds == {1: 0.5}
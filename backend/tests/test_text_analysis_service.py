@@ -0,0 +1,78 @@
+"""
+Tests cho service phân tích văn bản CLO / PLO dùng chung
+"""
+import math
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+from app.models import Course, CLO, PLO, BloomLevel, TextProfile, TextTermStat
+from app.services.text_analysis_service import (
+    ENTITY_CLO, ENTITY_PLO, tokenize, compute_tfidf, refresh_text_profile, delete_text_profiles,
+    get_text_profiles, rebuild_text_profiles, get_text_profile_stats, text_profile_cache
+)
+
+
+def test_tokenize_uses_shared_stopwords():
+    """Test bộ tách từ chung bỏ dấu câu, stopwords và từ 1 ký tự"""
+    assert tokenize("Phân tích thị trường, và đánh giá của khách (du lịch) a") == [
+        "phân", "tích", "thị", "trường", "đánh", "giá", "khách", "du", "lịch"
+    ]
+
+
+def test_compute_tfidf_is_normalized():
+    """Test vector TF-IDF chuẩn hóa L2, từ hiếm có trọng số cao hơn"""
+    vector = compute_tfidf(["marketing", "du", "lịch", "du"], {"du": 3, "lịch": 3, "marketing": 1}, 3)
+    assert math.sqrt(sum(weight ** 2 for weight in vector.values())) == pytest.approx(1.0)
+    assert vector["marketing"] > vector["lịch"]
+
+
+def test_text_profiles_reused_until_source_changes():
+    """Test hồ sơ được tính khi ghi, đọc lại từ bảng và tính lại khi updated_at thay đổi"""
+    engine = create_engine("sqlite:///:memory:")
+    tables = [model.__table__ for model in (Course, CLO, PLO, TextProfile, TextTermStat)]
+    SQLModel.metadata.create_all(engine, tables=tables)
+    text_profile_cache.clear()
+
+    with Session(engine) as session:
+        course = Course(code="DL101", title="Tổng quan du lịch", credits=2, version_year=2025, program_id=1)
+        session.add(course)
+        session.commit()
+        clo = CLO(code="CLO1", verb="Phân tích", text="thị trường du lịch",
+                  bloom_level=BloomLevel.ANALYZE, course_id=course.id)
+        plo = PLO(code="PLO1", description="Phân tích thị trường du lịch quốc tế", program_id=1)
+        session.add_all([clo, plo])
+        refresh_text_profile(session, ENTITY_CLO, clo)
+        refresh_text_profile(session, ENTITY_PLO, plo)
+        session.commit()
+
+        assert session.get(TextTermStat, "thị").document_count == 2
+        assert session.get(TextTermStat, "quốc").document_count == 1
+
+        # Cache bộ nhớ trống → đọc từ bảng TextProfile
+        text_profile_cache.clear()
+        before = get_text_profile_stats()
+        profiles = get_text_profiles(session, ENTITY_CLO, [clo])
+        assert profiles[clo.id]["tokens"] == {"phân", "tích", "thị", "trường", "du", "lịch"}
+        get_text_profiles(session, ENTITY_CLO, [clo])
+        stats = get_text_profile_stats()
+        assert stats["persisted_hits"] - before["persisted_hits"] == 1
+        assert stats["memory_cache"]["hits"] - before["memory_cache"]["hits"] == 1
+        assert stats["recomputed"] == before["recomputed"]
+
+        # updated_at thay đổi → hồ sơ cũ, tách từ lại
+        clo.text = "thị trường quốc tế"
+        clo.updated_at = clo.updated_at.replace(year=clo.updated_at.year + 1)
+        session.add(clo)
+        profiles = get_text_profiles(session, ENTITY_CLO, [clo])
+        assert "quốc" in profiles[clo.id]["tokens"]
+        assert get_text_profile_stats()["recomputed"] == before["recomputed"] + 1
+        session.commit()
+        assert session.get(TextTermStat, "quốc").document_count == 2
+        assert session.get(TextTermStat, "lịch").document_count == 1
+
+        delete_text_profiles(session, ENTITY_PLO, [plo.id])
+        session.commit()
+        assert session.get(TextTermStat, "quốc").document_count == 1
+
+        assert rebuild_text_profiles(session) == {"clo_count": 1, "plo_count": 1, "term_count": 8}
+        session.commit()
+        assert session.get(TextTermStat, "quốc").document_count == 2
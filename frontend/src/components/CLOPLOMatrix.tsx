@@ -26,6 +26,19 @@ interface Mapping {
   contribution_level: string;
 }
 
+// Ma trận gọn từ API: header PLO, hàng CLO, mỗi hàng một chuỗi mã mức ('.' = chưa có mapping)
+interface MatrixData {
+  plos: PLO[];
+  clos: CLO[];
+  rows: string[];
+}
+
+interface MatrixCell {
+  clo_id: number;
+  plo_id: number;
+  contribution_level: string | null;
+}
+
 interface CLOPLOMatrixProps {
   courseId: number;
 }
@@ -43,6 +56,7 @@ const CLOPLOMatrix: React.FC<CLOPLOMatrixProps> = ({ courseId }) => {
   const [loading, setLoading] = useState(true);
   const [autoSuggesting, setAutoSuggesting] = useState(false);
   const saveTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+  const pendingCellsRef = useRef<Map<string, MatrixCell>>(new Map());
   
   // Import Excel states
   const [showImportDialog, setShowImportDialog] = useState(false);
@@ -63,153 +77,29 @@ const CLOPLOMatrix: React.FC<CLOPLOMatrixProps> = ({ courseId }) => {
     type: 'success' | 'error' | 'info';
   }>({ isOpen: false, title: '', message: '', type: 'info' });
 
-  // Tokenize text thành keywords
-  const tokenizeText = (text: string): Set<string> => {
-    const stopwords = new Set([
-      'và', 'của', 'cho', 'với', 'từ', 'trong', 'là', 'được', 'có', 'một', 'các',
-      'theo', 'về', 'này', 'đó', 'nào', 'khi', 'sau', 'trước', 'để', 'bằng',
-      'như', 'hoặc', 'nếu', 'thì', 'mà', 'đã', 'sẽ', 'đang', 'cũng', 'rất'
-    ]);
-    
-    const words = text.toLowerCase()
-      .replace(/[^\w\s]/g, ' ')
-      .split(/\s+/)
-      .filter(w => w.length >= 2 && !stopwords.has(w));
-    
-    return new Set(words);
-  };
-
-  // Tính Jaccard similarity
-  const jaccardSimilarity = (set1: Set<string>, set2: Set<string>): number => {
-    if (set1.size === 0 || set2.size === 0) return 0;
-    const intersection = new Set(Array.from(set1).filter(x => set2.has(x)));
-    const union = new Set([...Array.from(set1), ...Array.from(set2)]);
-    return intersection.size / union.size;
-  };
-
-  // Tính điểm Bloom (B)
-  const getBloomScore = (bloomLevel: string): number => {
-    const level = bloomLevel.toLowerCase();
-    if (level === 'remember' || level === 'understand') return 0.33; // L
-    if (level === 'apply' || level === 'analyze') return 0.66; // N
-    if (level === 'evaluate' || level === 'create') return 1.0; // M
-    return 0.33;
-  };
-
-  // Kiểm tra từ khóa mạnh (H)
-  const checkStrongKeywords = (cloText: string, ploDescription: string): number => {
-    const cloKeywords = tokenizeText(cloText);
-    const ploKeywords = tokenizeText(ploDescription);
-    
-    const common = new Set(Array.from(cloKeywords).filter(x => ploKeywords.has(x)));
-    if (common.size >= 2) return 0.2;
-    
-    const cloLong = new Set(Array.from(cloKeywords).filter(w => w.length > 4));
-    const ploLong = new Set(Array.from(ploKeywords).filter(w => w.length > 4));
-    const longCommon = new Set(Array.from(cloLong).filter(x => ploLong.has(x)));
-    if (longCommon.size > 0) return 0.2;
-    
-    return 0.0;
-  };
-
-  // Tính score mapping: Score = 0.6*K + 0.3*B + 0.1*H
-  const calculateMappingScore = (clo: CLO, plo: PLO): number => {
-    const cloText = `${clo.verb} ${clo.text}`.toLowerCase();
-    const ploText = plo.description.toLowerCase();
-    
-    const cloKeywords = tokenizeText(cloText);
-    const ploKeywords = tokenizeText(ploText);
-    
-    const K = jaccardSimilarity(cloKeywords, ploKeywords);
-    const B = getBloomScore(clo.bloom_level);
-    const H = checkStrongKeywords(cloText, ploText);
-    
-    return 0.6 * K + 0.3 * B + 0.1 * H;
-  };
-
-  // Chuyển score sang contribution level
-  const scoreToLevel = (score: number): string => {
-    if (score >= 0.70) return 'M';
-    if (score >= 0.45) return 'N';
-    if (score >= 0.20) return 'L';
-    return '-';
-  };
-
-  // Gợi ý mapping dựa trên thuật toán mới
-  const suggestMapping = (clo: CLO, plo: PLO): string => {
-    const score = calculateMappingScore(clo, plo);
-    return scoreToLevel(score);
-  };
-
-  // Tự động gợi ý mapping khi load (sử dụng thuật toán mới)
-  const autoSuggestMappings = useCallback(async (clos: CLOWithDisplay<CLO>[], plos: PLO[], existingMappings: Mapping[]) => {
-    if (clos.length === 0 || plos.length === 0) {
-      console.log('Không có CLO hoặc PLO để mapping');
-      return;
-    }
-
+  // Tự động gợi ý mapping khi load: server tính score cho cả ma trận
+  // (Score = 0.6*K + 0.3*B + 0.1*H) và tạo các mapping còn thiếu trong một request
+  const autoSuggestMappings = useCallback(async (): Promise<Mapping[] | null> => {
     setAutoSuggesting(true);
     const token = localStorage.getItem('token');
-    const newMappings: Mapping[] = [];
-    let successCount = 0;
-    let skipCount = 0;
-    let errorCount = 0;
-
-    console.log(`Bắt đầu auto-suggest: ${clos.length} CLOs, ${plos.length} PLOs, ${existingMappings.length} mappings hiện có`);
 
     try {
-      for (const clo of clos) {
-        for (const plo of plos) {
-          // Kiểm tra xem đã có mapping chưa
-          const existing = existingMappings.find(m => m.clo_id === clo.id && m.plo_id === plo.id);
-          if (existing) {
-            skipCount++;
-            continue; // Bỏ qua nếu đã có
-          }
-
-          // Sử dụng thuật toán mới: Score = 0.6*K + 0.3*B + 0.1*H
-          const suggestedLevel = suggestMapping(clo, plo);
-          const score = calculateMappingScore(clo, plo);
-          
-          console.log(`CLO${clo.id} (${clo.verb} ${clo.text}) - PLO${plo.id}: score=${score.toFixed(3)}, level=${suggestedLevel}`);
-
-          // Tạo mapping cho TẤT CẢ các level, kể cả '-' (để hiển thị trong ma trận)
-          try {
-            const response = await axios.post(
-              `${API_URL}/api/clo-plo-mapping`,
-              {
-                clo_id: clo.id,
-                plo_id: plo.id,
-                contribution_level: suggestedLevel,
-              },
-              {
-                headers: token ? { 'Authorization': `Bearer ${token}` } : {}
-              }
-            );
-            newMappings.push(response.data);
-            successCount++;
-          } catch (error: any) {
-            // Nếu lỗi do đã tồn tại (400), bỏ qua
-            if (error.response?.status === 400) {
-              skipCount++;
-            } else {
-              console.error(`Lỗi khi tạo mapping CLO${clo.id}-PLO${plo.id}:`, error.response?.data || error.message);
-              errorCount++;
-            }
-          }
+      const response = await axios.post(
+        `${API_URL}/api/course/${courseId}/clo-plo-mapping/auto-suggest`,
+        {},
+        {
+          headers: token ? { 'Authorization': `Bearer ${token}` } : {}
         }
-      }
-
-      console.log(`Kết quả auto-suggest: ${successCount} thành công, ${skipCount} bỏ qua, ${errorCount} lỗi`);
-      if (newMappings.length > 0) {
-        setMappings([...existingMappings, ...newMappings]);
-      }
-    } catch (error) {
-      console.error('Lỗi khi gợi ý tự động:', error);
+      );
+      console.log(`Kết quả auto-suggest: ${response.data.created_count} mapping mới`);
+      return response.data.mappings;
+    } catch (error: any) {
+      console.error('Lỗi khi gợi ý tự động:', error.response?.data || error.message);
+      return null;
     } finally {
       setAutoSuggesting(false);
     }
-  }, []);
+  }, [courseId]);
 
   useEffect(() => {
     fetchData();
@@ -225,41 +115,35 @@ const CLOPLOMatrix: React.FC<CLOPLOMatrixProps> = ({ courseId }) => {
     }
   };
 
+  const mappingsFromMatrix = (matrix: MatrixData): Mapping[] => {
+    const result: Mapping[] = [];
+    matrix.clos.forEach((clo, i) => {
+      matrix.plos.forEach((plo, j) => {
+        const level = matrix.rows[i][j];
+        if (level !== '.') {
+          result.push({ id: result.length + 1, clo_id: clo.id, plo_id: plo.id, contribution_level: level });
+        }
+      });
+    });
+    return result;
+  };
+
   const fetchData = async () => {
     try {
-      const [closRes, mappingsRes] = await Promise.all([
-        axios.get(`${API_URL}/api/clos?course_id=${courseId}`),
-        axios.get(`${API_URL}/api/course/${courseId}/clo-plo-mapping`),
-      ]);
-      const closData = sortClosWithDisplay<CLO>(closRes.data as CLO[]);
-      setClos(closData);
-
-      // Lấy program_id từ course để lấy PLOs
-      const courseRes = await axios.get(`${API_URL}/api/courses/${courseId}`);
-      const programId = courseRes.data.program_id;
-
-      const plosRes = await axios.get(`${API_URL}/api/plos?program_id=${programId}`);
-      const plosData = plosRes.data;
-      setPlos(plosData);
-      
-      const existingMappings = mappingsRes.data;
-      setMappings(existingMappings);
-
-      // Tự động gợi ý mapping - LUÔN chạy để đảm bảo có mapping đầy đủ
-      if (closData.length > 0 && plosData.length > 0) {
-        const totalPossible = closData.length * plosData.length;
-        const existingCount = existingMappings.length;
-        
-        // Luôn chạy auto-suggest để tạo mapping cho tất cả CLO-PLO
-        // Chỉ bỏ qua nếu đã có đủ 100% mappings
-        if (existingCount < totalPossible) {
-          console.log(`Tự động tạo mapping: ${existingCount}/${totalPossible} mappings hiện có`);
-          await autoSuggestMappings(closData, plosData, existingMappings);
-          // Refresh lại mappings sau khi gợi ý
-          const updatedMappingsRes = await axios.get(`${API_URL}/api/course/${courseId}/clo-plo-mapping`);
-          setMappings(updatedMappingsRes.data);
-        } else {
-          console.log(`Đã có đủ mappings: ${existingCount}/${totalPossible}`);
+      // Một request cho CLO, PLO của chương trình và toàn bộ mapping của môn học
+      const matrixRes = await axios.get(`${API_URL}/api/course/${courseId}/clo-plo-matrix`);
+      const matrix: MatrixData = matrixRes.data;
+      setClos(sortClosWithDisplay<CLO>(matrix.clos));
+      setPlos(matrix.plos);
+      setMappings(mappingsFromMatrix(matrix));
+
+      // Tự động gợi ý mapping cho các ô còn trống (chỉ bỏ qua nếu đã có đủ 100% mappings)
+      const emptyCount = matrix.rows.reduce((count, row) => count + row.split('.').length - 1, 0);
+      if (emptyCount > 0) {
+        console.log(`Tự động tạo mapping cho ${emptyCount} ô còn trống`);
+        const updatedMappings = await autoSuggestMappings();
+        if (updatedMappings) {
+          setMappings(updatedMappings);
         }
       }
     } catch (error) {
@@ -269,8 +153,10 @@ const CLOPLOMatrix: React.FC<CLOPLOMatrixProps> = ({ courseId }) => {
     }
   };
 
-  // Debounced save function
-  const saveMapping = useCallback(async (cloId: number, ploId: number, level: string | null) => {
+  // Debounced save: gom các ô thay đổi và ghi bằng một request PUT ma trận
+  const saveMapping = useCallback((cloId: number, ploId: number, level: string | null) => {
+    pendingCellsRef.current.set(`${cloId}:${ploId}`, { clo_id: cloId, plo_id: ploId, contribution_level: level });
+
     // Clear previous timeout
     if (saveTimeoutRef.current) {
       clearTimeout(saveTimeoutRef.current);
@@ -278,49 +164,23 @@ const CLOPLOMatrix: React.FC<CLOPLOMatrixProps> = ({ courseId }) => {
 
     // Set new timeout
     saveTimeoutRef.current = setTimeout(async () => {
+      const cells = Array.from(pendingCellsRef.current.values());
+      pendingCellsRef.current.clear();
       try {
         const token = localStorage.getItem('token');
-        const existing = mappings.find(m => m.clo_id === cloId && m.plo_id === ploId);
-
-        if (level === null || level === '-') {
-          // Xóa mapping
-          if (existing) {
-            await axios.delete(`${API_URL}/api/clo-plo-mapping/${existing.id}`, {
-              headers: token ? { 'Authorization': `Bearer ${token}` } : {}
-            });
-            setMappings(mappings.filter(m => m.id !== existing.id));
+        await axios.put(
+          `${API_URL}/api/course/${courseId}/clo-plo-matrix`,
+          { cells },
+          {
+            headers: token ? { 'Authorization': `Bearer ${token}` } : {}
           }
-        } else if (existing) {
-          // Cập nhật mapping
-          const response = await axios.put(
-            `${API_URL}/api/clo-plo-mapping/${existing.id}`,
-            { contribution_level: level },
-            {
-              headers: token ? { 'Authorization': `Bearer ${token}` } : {}
-            }
-          );
-          setMappings(mappings.map(m => m.id === existing.id ? response.data : m));
-        } else {
-          // Tạo mapping mới
-          const response = await axios.post(
-            `${API_URL}/api/clo-plo-mapping`,
-            {
-              clo_id: cloId,
-              plo_id: ploId,
-              contribution_level: level,
-            },
-            {
-              headers: token ? { 'Authorization': `Bearer ${token}` } : {}
-            }
-          );
-          setMappings([...mappings, response.data]);
-        }
+        );
       } catch (error: any) {
         console.error('Lỗi khi lưu mapping:', error);
         // Không hiển thị alert để tránh làm phiền user
       }
     }, 500); // Debounce 500ms
-  }, [mappings]);
+  }, [courseId]);
 
   const cycleContributionLevel = (cloId: number, ploId: number) => {
     const existing = mappings.find(m => m.clo_id === cloId && m.plo_id === ploId);